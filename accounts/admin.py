@@ -1,7 +1,8 @@
 from django.contrib import admin
 from .models import (
     CustomUser, School, StudentProfile, TeacherProfile, ParentProfile, 
-    ParentStudentLink, UserLoginActivity, UserDailyActivity, UserSubjectStudy, 
+    ParentStudentLink, UserLoginActivity, UserDailyActivity, UserSubjectStudy, UserStudyStreak,
+    UserAttendanceYear,
     RecentActivity, Syllabus, SchoolClass, StudentRecommendation, StudentTask,
     TeacherTask
 )
@@ -16,6 +17,8 @@ admin.site.register(ParentStudentLink)
 admin.site.register(UserLoginActivity)
 admin.site.register(UserDailyActivity)
 admin.site.register(UserSubjectStudy)
+admin.site.register(UserStudyStreak)
+admin.site.register(UserAttendanceYear)
 admin.site.register(RecentActivity)
 admin.site.register(Syllabus)
 admin.site.register(SchoolClass)
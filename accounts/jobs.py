@@ -0,0 +1,8 @@
+from jobs.queue import register
+from .study_pings import FLUSH_STUDY_PINGS_JOB, flush_study_pings
+
+
+@register(FLUSH_STUDY_PINGS_JOB)
+def flush_pings(payload):
+    # Jobs queued before flushes named their buffer flush whichever one their worker has.
+    flush_study_pings(payload.get('buffer'))
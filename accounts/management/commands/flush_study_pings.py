@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from accounts.study_pings import flush_study_pings
+
+
+class Command(BaseCommand):
+    help = "Writes the study pings buffered on this server to the daily activity tables."
+
+    def handle(self, *args, **options):
+        flushed = flush_study_pings()
+        self.stdout.write(self.style.SUCCESS(f"Flushed {flushed} buffered study totals."))
@@ -0,0 +1,49 @@
+from itertools import groupby
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from accounts.models import UserDailyActivity, UserStudyStreak
+from accounts.services import DEFAULT_STREAK_MINUTES, trailing_run
+
+
+class Command(BaseCommand):
+    help = "Rebuilds every user's study streak record from their existing daily activity."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=int, action='append', dest='thresholds',
+                            help=f"Daily study minutes a day needs to qualify (default {DEFAULT_STREAK_MINUTES}). Can be repeated.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows read and written per batch.")
+
+    def handle(self, *args, **options):
+        thresholds = options['thresholds'] or [DEFAULT_STREAK_MINUTES]
+        batch_size = options['batch_size']
+
+        for threshold in thresholds:
+            rebuilt = self.rebuild(threshold, batch_size)
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} study streaks for the {threshold}-minute threshold."))
+
+    def rebuild(self, threshold, batch_size):
+        # Rows arrive grouped by user, newest day first, so each user's streak is
+        # the run of consecutive days at the head of their group.
+        rows = UserDailyActivity.objects.filter(
+            study_duration_minutes__gte=threshold
+        ).order_by('user_id', '-date').values_list('user_id', 'date').iterator(chunk_size=batch_size)
+
+        rebuilt = 0
+        with transaction.atomic():
+            UserStudyStreak.objects.filter(threshold_minutes=threshold).delete()
+            pending = []
+            for user_id, user_rows in groupby(rows, key=lambda row: row[0]):
+                last_date, length = trailing_run(date for _, date in user_rows)
+                pending.append(UserStudyStreak(
+                    user_id=user_id,
+                    threshold_minutes=threshold,
+                    current_streak=length,
+                    last_qualifying_date=last_date,
+                ))
+                if len(pending) >= batch_size:
+                    UserStudyStreak.objects.bulk_create(pending)
+                    rebuilt += len(pending)
+                    pending = []
+            UserStudyStreak.objects.bulk_create(pending)
+            rebuilt += len(pending)
+        return rebuilt
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.9 on 2026-10-17 10:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_teachertask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStudyStreak',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('threshold_minutes', models.PositiveIntegerField(default=240, help_text='Minutes of study a day needs to count towards the streak.')),
+                ('current_streak', models.PositiveIntegerField(default=0, help_text='Length of the run of qualifying days ending on last_qualifying_date.')),
+                ('last_qualifying_date', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='study_streaks', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'threshold_minutes')},
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.9 on 2026-10-17 14:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import ExtractYear
+
+
+def backfill_attendance_years(apps, schema_editor):
+    UserDailyActivity = apps.get_model('accounts', 'UserDailyActivity')
+    UserAttendanceYear = apps.get_model('accounts', 'UserAttendanceYear')
+
+    rows = UserDailyActivity.objects.annotate(year=ExtractYear('date')).values('user_id', 'year').annotate(
+        recorded=models.Count('id'),
+        present=models.Count('id', filter=models.Q(present=True)),
+    ).order_by()
+    UserAttendanceYear.objects.bulk_create([
+        UserAttendanceYear(
+            user_id=row['user_id'],
+            year=row['year'],
+            present_days=row['present'],
+            recorded_days=row['recorded'],
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_userstudystreak'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserAttendanceYear',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('present_days', models.PositiveIntegerField(default=0, help_text='Days marked present this year.')),
+                ('recorded_days', models.PositiveIntegerField(default=0, help_text='Days with an activity record this year.')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_years', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['user', '-year'],
+                'unique_together': {('user', 'year')},
+            },
+        ),
+        migrations.RunPython(backfill_attendance_years, migrations.RunPython.noop),
+    ]
@@ -164,6 +164,50 @@ class UserDailyActivity(models.Model):
     def __str__(self):
         return f"{self.user.username}'s activity on {self.date}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so the attendance rollup and study streaks can tell what a save changes.
+        instance._loaded_date = instance.date if 'date' in field_names else None
+        instance._loaded_present = instance.present if 'present' in field_names else None
+        instance._loaded_study_minutes = instance.study_duration_minutes if 'study_duration_minutes' in field_names else None
+        return instance
+
+class UserAttendanceYear(models.Model):
+    """
+    A user's attendance for one calendar year, kept in step with their
+    UserDailyActivity rows so percentages don't need to count them.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='attendance_years')
+    year = models.PositiveSmallIntegerField()
+    present_days = models.PositiveIntegerField(default=0, help_text="Days marked present this year.")
+    recorded_days = models.PositiveIntegerField(default=0, help_text="Days with an activity record this year.")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['user', '-year']
+        unique_together = ('user', 'year')
+
+    def __str__(self):
+        return f"{self.user.username}'s attendance in {self.year}: {self.present_days}/{self.recorded_days} days"
+
+class UserStudyStreak(models.Model):
+    """
+    The user's current run of consecutive days with at least `threshold_minutes`
+    of study, kept up to date as study time is recorded.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='study_streaks')
+    threshold_minutes = models.PositiveIntegerField(default=240, help_text="Minutes of study a day needs to count towards the streak.")
+    current_streak = models.PositiveIntegerField(default=0, help_text="Length of the run of qualifying days ending on last_qualifying_date.")
+    last_qualifying_date = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'threshold_minutes')
+
+    def __str__(self):
+        return f"{self.user.username}'s {self.threshold_minutes}-minute streak: {self.current_streak} days"
+
 class UserSubjectStudy(models.Model):
     daily_activity = models.ForeignKey(UserDailyActivity, on_delete=models.CASCADE, related_name='subject_studies')
     subject = models.ForeignKey('content.Subject', on_delete=models.CASCADE, related_name='study_sessions')
@@ -16,6 +16,7 @@ from django.template.loader import render_to_string
 from django.conf import settings
 from django.urls import reverse
 import uuid
+from stepwise_backend.fieldsets import SparseFieldsMixin
 
 def send_verification_email(user, request):
     if not user.verification_token:
@@ -33,20 +34,20 @@ def send_verification_email(user, request):
     send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email], html_message=html_message)
 
 
-class StudentRecommendationSerializer(serializers.ModelSerializer):
+class StudentRecommendationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = StudentRecommendation
         fields = ['id', 'student', 'recommendation_data', 'created_at']
         read_only_fields = ['student', 'created_at']
 
-class SchoolClassSerializer(serializers.ModelSerializer):
+class SchoolClassSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     name = serializers.CharField(source='master_class.name', read_only=True)
     description = serializers.CharField(source='master_class.description', read_only=True)
     class Meta:
         model = SchoolClass
         fields = ['id', 'school', 'master_class', 'name', 'description']
 
-class SchoolSerializer(serializers.ModelSerializer):
+class SchoolSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     admin_username = serializers.CharField(write_only=True, required=True)
     admin_email = serializers.EmailField(write_only=True, required=True)
     admin_password = serializers.CharField(write_only=True, required=True, style={'input_type': 'password'})
@@ -118,7 +119,7 @@ class SchoolSerializer(serializers.ModelSerializer):
         
         return school
 
-class StudentProfileSerializer(serializers.ModelSerializer):
+class StudentProfileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     enrolled_class_name = serializers.CharField(source='enrolled_class.master_class.name', read_only=True, allow_null=True)
     school_name = serializers.CharField(source='school.name', read_only=True, allow_null=True)
     profile_picture_url = serializers.SerializerMethodField()
@@ -142,7 +143,7 @@ class StudentProfileSerializer(serializers.ModelSerializer):
             return obj.profile_picture.url 
         return None
 
-class TeacherProfileSerializer(serializers.ModelSerializer):
+class TeacherProfileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     school_name = serializers.CharField(source='school.name', read_only=True, allow_null=True)
     assigned_classes_details = serializers.SerializerMethodField()
     subject_expertise_details = serializers.SerializerMethodField()
@@ -173,7 +174,7 @@ class TeacherProfileSerializer(serializers.ModelSerializer):
             return obj.profile_picture.url
         return None
 
-class ParentProfileSerializer(serializers.ModelSerializer):
+class ParentProfileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     profile_picture_url = serializers.SerializerMethodField()
     class Meta:
         model = ParentProfile
@@ -191,7 +192,7 @@ class ParentProfileSerializer(serializers.ModelSerializer):
             return obj.profile_picture.url
         return None
 
-class CustomUserSerializer(serializers.ModelSerializer):
+class CustomUserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     student_profile = StudentProfileSerializer(read_only=True, context={'request': serializers.CurrentUserDefault()})
     teacher_profile = TeacherProfileSerializer(read_only=True, context={'request': serializers.CurrentUserDefault()})
     parent_profile = ParentProfileSerializer(read_only=True, context={'request': serializers.CurrentUserDefault()})
@@ -265,7 +266,7 @@ class UserSignupSerializer(serializers.ModelSerializer):
         send_verification_email(user, self.context['request'])
         return user
 
-class ParentStudentLinkSerializer(serializers.ModelSerializer):
+class ParentStudentLinkSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     parent_username = serializers.CharField(source='parent.username', read_only=True)
     student_username = serializers.CharField(source='student.username', read_only=True)
     student_details = StudentProfileSerializer(source='student.student_profile', read_only=True, context={'request': serializers.CurrentUserDefault()})
@@ -330,7 +331,7 @@ class ParentProfileCompletionSerializer(serializers.ModelSerializer):
         fields = ['full_name', 'mobile_number', 'address', 'profile_picture', 'profile_completed']
         read_only_fields = ['user']
 
-class RecentActivitySerializer(serializers.ModelSerializer):
+class RecentActivitySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user_username = serializers.CharField(source='user.username', read_only=True)
     user_avatar_url = serializers.SerializerMethodField()
 
@@ -348,12 +349,12 @@ class RecentActivitySerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(profile.profile_picture.url)
         return None
 
-class SyllabusSerializer(serializers.ModelSerializer):
+class SyllabusSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Syllabus
         fields = ['id', 'name', 'description']
 
-class UserDailyActivitySerializer(serializers.ModelSerializer):
+class UserDailyActivitySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for the UserDailyActivity model.
     """
@@ -362,14 +363,14 @@ class UserDailyActivitySerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'date', 'study_duration_minutes', 'library_study_duration_minutes', 'present']
         read_only_fields = ['user']
 
-class StudentTaskSerializer(serializers.ModelSerializer):
+class StudentTaskSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for the StudentTask model."""
     class Meta:
         model = StudentTask
         fields = ['id', 'student', 'title', 'description', 'due_date', 'completed', 'created_at']
         read_only_fields = ['student']
     
-class TeacherTaskSerializer(serializers.ModelSerializer):
+class TeacherTaskSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for the TeacherTask model."""
     class Meta:
         model = TeacherTask
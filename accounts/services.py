@@ -0,0 +1,217 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+from .models import UserAttendanceYear, UserDailyActivity, UserStudyStreak
+
+DEFAULT_STREAK_MINUTES = 240
+
+# --- Study Streaks ---
+
+def get_study_streak(user, threshold_minutes=DEFAULT_STREAK_MINUTES):
+    """Returns the length of the user's study streak, counting back from today."""
+    streak = get_study_streak_record(user, threshold_minutes)
+    if streak.last_qualifying_date != timezone.now().date():
+        return 0 # Today hasn't qualified yet, so there is no running streak
+    return streak.current_streak
+
+def get_study_streak_record(user, threshold_minutes=DEFAULT_STREAK_MINUTES):
+    """Returns the user's streak record, building it from their daily activity the first time."""
+    try:
+        return UserStudyStreak.objects.get(user=user, threshold_minutes=threshold_minutes)
+    except UserStudyStreak.DoesNotExist:
+        return rebuild_study_streak(user, threshold_minutes)
+
+def rebuild_study_streak(user, threshold_minutes=DEFAULT_STREAK_MINUTES):
+    """Recomputes the user's streak record from their UserDailyActivity rows."""
+    last_date, length = _qualifying_run(user.pk, threshold_minutes)
+    streak, _ = UserStudyStreak.objects.update_or_create(
+        user=user,
+        threshold_minutes=threshold_minutes,
+        defaults={'current_streak': length, 'last_qualifying_date': last_date}
+    )
+    return streak
+
+def _qualifying_run(user_id, threshold_minutes):
+    qualifying_dates = UserDailyActivity.objects.filter(
+        user_id=user_id,
+        study_duration_minutes__gte=threshold_minutes
+    ).order_by('-date').values_list('date', flat=True)
+    return trailing_run(qualifying_dates.iterator())
+
+def trailing_run(dates_newest_first):
+    """
+    Returns the most recent date and the length of the run of consecutive days
+    ending on it, from an iterable of distinct dates sorted newest first.
+    """
+    last_date = None
+    length = 0
+    for day in dates_newest_first:
+        if last_date is None:
+            last_date = day
+        elif day != last_date - timedelta(days=length):
+            break
+        length += 1
+    return last_date, length
+
+def record_study_minutes(user_id, day, previous_minutes, total_minutes, streaks=None):
+    """
+    Updates the user's streaks whose threshold was crossed, either way, when the
+    day's study total went from `previous_minutes` to `total_minutes`. A new
+    qualifying day after a streak's last one extends or restarts it; any other
+    crossing (an earlier day, or a day dropping below the threshold) can join
+    or split runs, so that streak is rebuilt from the daily activity. `streaks`
+    are the user's UserStudyStreak rows, when the caller has already loaded
+    them. Users without a streak record are left alone: get_study_streak_record
+    builds it from their history when it is first read.
+    """
+    if streaks is None:
+        streaks = UserStudyStreak.objects.filter(user_id=user_id)
+    for streak in streaks:
+        if previous_minutes < streak.threshold_minutes <= total_minutes:
+            last_date = streak.last_qualifying_date
+            if last_date == day:
+                continue
+            if last_date is None or last_date < day:
+                streak.current_streak = streak.current_streak + 1 if last_date == day - timedelta(days=1) else 1
+                streak.last_qualifying_date = day
+            else:
+                streak.last_qualifying_date, streak.current_streak = _qualifying_run(user_id, streak.threshold_minutes)
+        elif total_minutes < streak.threshold_minutes <= previous_minutes:
+            streak.last_qualifying_date, streak.current_streak = _qualifying_run(user_id, streak.threshold_minutes)
+        else:
+            continue
+        streak.save(update_fields=['current_streak', 'last_qualifying_date', 'updated_at'])
+
+def rebuild_study_streaks(user_id):
+    """Rebuilds every streak record the user has, e.g. after a change to their activity that wasn't tracked."""
+    for streak in UserStudyStreak.objects.filter(user_id=user_id):
+        streak.last_qualifying_date, streak.current_streak = _qualifying_run(user_id, streak.threshold_minutes)
+        streak.save(update_fields=['current_streak', 'last_qualifying_date', 'updated_at'])
+
+# --- Attendance ---
+
+def days_so_far(today=None):
+    """Returns the number of calendar days from January 1st up to and including `today`."""
+    today = today or timezone.now().date()
+    return (today - today.replace(month=1, day=1)).days + 1
+
+def get_attendance_year(user, year=None):
+    """Returns the user's attendance rollup for `year` (default: this year), unsaved and empty if they have none."""
+    year = year or timezone.now().year
+    record = UserAttendanceYear.objects.filter(user=user, year=year).first()
+    return record or UserAttendanceYear(user=user, year=year)
+
+def rebuild_attendance_year(user_id, year):
+    """Recounts the user's attendance for `year` from their UserDailyActivity rows."""
+    counts = UserDailyActivity.objects.filter(user_id=user_id, date__year=year).aggregate(
+        recorded=Count('id'),
+        present=Count('id', filter=Q(present=True)),
+    )
+    record, _ = UserAttendanceYear.objects.update_or_create(
+        user_id=user_id,
+        year=year,
+        defaults={'present_days': counts['present'], 'recorded_days': counts['recorded']}
+    )
+    return record
+
+def adjust_attendance_year(user_id, year, present_delta, recorded_delta):
+    """Applies a change in present and recorded days to the user's rollup for `year`."""
+    if not present_delta and not recorded_delta:
+        return
+    updated = UserAttendanceYear.objects.filter(user_id=user_id, year=year).update(
+        present_days=F('present_days') + present_delta,
+        recorded_days=F('recorded_days') + recorded_delta,
+        updated_at=timezone.now()
+    )
+    if not updated:
+        # The first record of the year; counting from the rows includes this change.
+        rebuild_attendance_year(user_id, year)
+
+def get_school_attendance(school_id, year=None):
+    """
+    Returns the attendance of a school's students for `year` (default: this year),
+    summed from their rollups.
+    """
+    year = year or timezone.now().year
+    totals = UserAttendanceYear.objects.filter(
+        user__school_id=school_id, user__role='Student', year=year
+    ).aggregate(
+        students=Count('user_id'),
+        present_days=Sum('present_days'),
+        recorded_days=Sum('recorded_days'),
+    )
+    present_days = totals['present_days'] or 0
+    recorded_days = totals['recorded_days'] or 0
+    return {
+        'year': year,
+        'students': totals['students'],
+        'present_days': present_days,
+        'recorded_days': recorded_days,
+        'percentage': (present_days / recorded_days) * 100 if recorded_days else 0.0,
+    }
+
+# --- Daily activity rollups ---
+
+def record_daily_activity_changes(changes):
+    """
+    Brings the attendance rollups and study streaks in step with saved
+    UserDailyActivity rows, given as (activity, created) pairs. The post_save
+    receiver calls it for each save; bulk writes, which send no signals, call
+    it with all of their rows. A row's previous state is the one it was loaded
+    with (see UserDailyActivity.from_db), and rows saved without one are
+    recounted from scratch.
+    """
+    attendance_deltas = defaultdict(lambda: [0, 0])
+    recount_years, rebuild_users, study_changes = set(), set(), []
+    for activity, created in changes:
+        user_id, day, minutes = activity.user_id, activity.date, activity.study_duration_minutes
+        previous_date = getattr(activity, '_loaded_date', None)
+        previous_present = getattr(activity, '_loaded_present', None)
+        previous_minutes = getattr(activity, '_loaded_study_minutes', None)
+        if created:
+            attendance_deltas[(user_id, day.year)][0] += int(activity.present)
+            attendance_deltas[(user_id, day.year)][1] += 1
+            study_changes.append((user_id, day, 0, minutes))
+        elif previous_date is None or previous_present is None or previous_minutes is None:
+            # Saved from an instance we didn't load, so the previous state is unknown.
+            recount_years.add((user_id, day.year))
+            rebuild_users.add(user_id)
+        else:
+            if previous_date.year != day.year:
+                attendance_deltas[(user_id, previous_date.year)][0] -= int(previous_present)
+                attendance_deltas[(user_id, previous_date.year)][1] -= 1
+                attendance_deltas[(user_id, day.year)][0] += int(activity.present)
+                attendance_deltas[(user_id, day.year)][1] += 1
+            elif previous_present != activity.present:
+                attendance_deltas[(user_id, day.year)][0] += 1 if activity.present else -1
+            if previous_date != day:
+                study_changes.append((user_id, previous_date, previous_minutes, 0))
+                study_changes.append((user_id, day, 0, minutes))
+            elif previous_minutes != minutes:
+                study_changes.append((user_id, day, previous_minutes, minutes))
+        activity._loaded_date = day
+        activity._loaded_present = activity.present
+        activity._loaded_study_minutes = minutes
+
+    # One adjustment per rollup, since the first one of a year recounts every row already written.
+    for (user_id, year), (present_delta, recorded_delta) in attendance_deltas.items():
+        if (user_id, year) not in recount_years:
+            adjust_attendance_year(user_id, year, present_delta, recorded_delta)
+    for user_id, year in recount_years:
+        rebuild_attendance_year(user_id, year)
+
+    study_changes = [change for change in study_changes if change[0] not in rebuild_users and change[2] != change[3]]
+    if study_changes:
+        streaks = defaultdict(list)
+        for streak in UserStudyStreak.objects.filter(user_id__in={user_id for user_id, *_ in study_changes}):
+            streaks[streak.user_id].append(streak)
+        for user_id, day, previous_minutes, minutes in sorted(study_changes, key=lambda change: change[1]):
+            record_study_minutes(user_id, day, previous_minutes, minutes, streaks=streaks[user_id])
+    for user_id in rebuild_users:
+        rebuild_study_streaks(user_id)
+
+def record_daily_activity_delete(activity):
+    """What a deleted UserDailyActivity row takes out of the attendance rollup and the study streaks."""
+    adjust_attendance_year(activity.user_id, activity.date.year, -int(activity.present), -1)
+    record_study_minutes(activity.user_id, activity.date, activity.study_duration_minutes, 0)
@@ -0,0 +1,16 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import UserDailyActivity
+from .services import record_daily_activity_changes, record_daily_activity_delete
+
+
+# --- Attendance rollup and study streaks ---
+
+@receiver(post_save, sender=UserDailyActivity)
+def update_rollups_on_activity_save(sender, instance, created, **kwargs):
+    record_daily_activity_changes([(instance, created)])
+
+
+@receiver(post_delete, sender=UserDailyActivity)
+def update_rollups_on_activity_delete(sender, instance, **kwargs):
+    record_daily_activity_delete(instance)
@@ -0,0 +1,268 @@
+"""
+Study pings, added up in a local buffer before they reach the database.
+
+The frontend pings every minute for every student studying. A ping only adds
+its minutes to the running totals kept in a small SQLite file on the server
+(settings.STUDY_PING_BUFFER_PATH), and those totals are what it answers with.
+A background job then moves the minutes that built up into UserDailyActivity
+and UserSubjectStudy, at most every settings.STUDY_PING_FLUSH_SECONDS, in a
+few bulk statements per flush. The flush also does what saving those rows one
+by one did: the attendance rollup for new days, the study streaks and the
+reward progress snapshots.
+
+Each buffer row holds the running `total` (what the activity tables will say
+once flushed) and the `pending` minutes not written yet. The first ping of a
+day reads the stored totals to start from; later pings don't touch the
+database at all.
+
+The buffer belongs to the machine it is on, so each flush job names the
+buffer (host and path) that asked for it and is deduplicated per buffer. A
+worker on another server puts the job back for the owner's workers, which is
+why every server taking pings also runs `python manage.py run_workers`.
+A flush commits the activity tables before the buffer, so a crash between the
+two commits counts that batch twice rather than losing it.
+"""
+import hashlib
+import socket
+import sqlite3
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date, timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from content.models import Subject
+from content.services import invalidate_reward_progress
+from jobs.queue import enqueue
+from .models import UserDailyActivity, UserSubjectStudy
+from .services import record_daily_activity_changes
+
+FLUSH_STUDY_PINGS_JOB = 'accounts.flush_study_pings'
+
+# Kinds of buffered totals: the day's study and library minutes, and one per subject studied.
+STUDY, LIBRARY, SUBJECT = 'study', 'library', 'subject'
+
+# A flush requested this long ago without happening (e.g. its job failed for good) is requested again.
+FLUSH_REQUEST_TIMEOUT = timedelta(minutes=15)
+
+# How long a flush job claimed by a worker on another server waits before it is up for grabs again.
+FLUSH_HANDBACK_DELAY = timedelta(seconds=2)
+
+_SCHEMA = """
+PRAGMA journal_mode = WAL;
+CREATE TABLE IF NOT EXISTS study_totals (
+    user_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    subject_id INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL,
+    pending INTEGER NOT NULL,
+    PRIMARY KEY (user_id, day, kind, subject_id)
+);
+CREATE TABLE IF NOT EXISTS flush_request (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    requested_at REAL NOT NULL
+);
+"""
+
+_prepared_paths = set()
+
+
+@contextmanager
+def _buffer():
+    """A connection to the buffer inside a write transaction, committed when the block succeeds."""
+    path = str(settings.STUDY_PING_BUFFER_PATH)
+    connection = sqlite3.connect(path, timeout=20, isolation_level=None)
+    try:
+        if path not in _prepared_paths:
+            connection.executescript(_SCHEMA)
+            _prepared_paths.add(path)
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+    finally:
+        connection.close()
+
+
+def buffer_id():
+    """Names this server's buffer: the host it is on and its path there."""
+    return f'{socket.gethostname()}:{settings.STUDY_PING_BUFFER_PATH}'
+
+
+def record_study_ping(user, minutes, subject_id=None):
+    """
+    Adds `minutes` of study today to the user's buffered totals: of the subject
+    (and the day) or, without one, of the library. Returns the running totals,
+    {'total_day_minutes', 'subject_minutes'} or {'library_minutes'}. Raises
+    Subject.DoesNotExist for an unknown subject.
+    """
+    day = timezone.now().date()
+    with _buffer() as buffer:
+        if subject_id is None:
+            totals = {'library_minutes': _add(buffer, user.id, day, LIBRARY, 0, minutes)}
+        else:
+            totals = {
+                'subject_minutes': _add(buffer, user.id, day, SUBJECT, subject_id, minutes),
+                'total_day_minutes': _add(buffer, user.id, day, STUDY, 0, minutes),
+            }
+        _request_flush(buffer)
+    return totals
+
+
+def _add(buffer, user_id, day, kind, subject_id, minutes):
+    key = (user_id, day.isoformat(), kind, subject_id)
+    row = buffer.execute(
+        'UPDATE study_totals SET total = total + ?, pending = pending + ?'
+        ' WHERE user_id = ? AND day = ? AND kind = ? AND subject_id = ? RETURNING total',
+        (minutes, minutes, *key)
+    ).fetchone()
+    if row is not None:
+        return row[0]
+    total = _stored_total(user_id, day, kind, subject_id) + minutes
+    buffer.execute(
+        'INSERT INTO study_totals (user_id, day, kind, subject_id, total, pending) VALUES (?, ?, ?, ?, ?, ?)',
+        (*key, total, minutes)
+    )
+    return total
+
+
+def _stored_total(user_id, day, kind, subject_id):
+    """The minutes the activity tables hold for a buffer row that doesn't exist yet."""
+    if kind == SUBJECT:
+        if not Subject.objects.filter(pk=subject_id).exists():
+            raise Subject.DoesNotExist(f"Subject {subject_id} does not exist.")
+        stored = UserSubjectStudy.objects.filter(
+            daily_activity__user_id=user_id, daily_activity__date=day, subject_id=subject_id
+        ).values_list('duration_minutes', flat=True).first()
+    else:
+        field = 'study_duration_minutes' if kind == STUDY else 'library_study_duration_minutes'
+        stored = UserDailyActivity.objects.filter(user_id=user_id, date=day).values_list(field, flat=True).first()
+    return stored or 0
+
+
+def _request_flush(buffer):
+    """Schedules a flush unless one is already on its way, so at most one job is queued per interval."""
+    row = buffer.execute('SELECT requested_at FROM flush_request').fetchone()
+    now = time.time()
+    if row is not None and now - row[0] < FLUSH_REQUEST_TIMEOUT.total_seconds():
+        return
+    buffer.execute('INSERT OR REPLACE INTO flush_request (id, requested_at) VALUES (1, ?)', (now,))
+    _enqueue_flush(buffer_id(), timedelta(seconds=settings.STUDY_PING_FLUSH_SECONDS))
+
+
+def _enqueue_flush(owner, delay):
+    enqueue(
+        FLUSH_STUDY_PINGS_JOB, {'buffer': owner},
+        # Hashed, since host names and paths can outgrow the key's column.
+        dedupe_key=f'{FLUSH_STUDY_PINGS_JOB}:{hashlib.sha256(owner.encode()).hexdigest()}',
+        run_after=timezone.now() + delay,
+    )
+
+
+def flush_study_pings(owner=None):
+    """
+    Writes the buffered minutes to the activity tables and forgets the totals
+    of days before yesterday. Returns the number of buffered totals written.
+    Given the `owner` buffer_id of another server's buffer, it queues the flush
+    again for that server's workers instead and returns 0.
+    """
+    if owner is not None and owner != buffer_id():
+        _enqueue_flush(owner, FLUSH_HANDBACK_DELAY)
+        return 0
+    with _buffer() as buffer:
+        rows = buffer.execute(
+            'SELECT user_id, day, kind, subject_id, pending FROM study_totals WHERE pending > 0'
+        ).fetchall()
+        if rows:
+            for key, total in _write_pending(rows).items():
+                buffer.execute(
+                    'UPDATE study_totals SET total = ?, pending = 0'
+                    ' WHERE user_id = ? AND day = ? AND kind = ? AND subject_id = ?',
+                    (total, *key)
+                )
+        yesterday = timezone.now().date() - timedelta(days=1)
+        buffer.execute('DELETE FROM study_totals WHERE day < ? AND pending = 0', (yesterday.isoformat(),))
+        buffer.execute('DELETE FROM flush_request')
+    return len(rows)
+
+
+def _write_pending(rows):
+    """
+    Adds the pending minutes of buffer rows to the activity tables. Returns the
+    stored totals afterwards, by buffer key, to resynchronise the buffer with.
+    """
+    day_minutes = defaultdict(lambda: {STUDY: 0, LIBRARY: 0})
+    subject_minutes = {}
+    for user_id, day, kind, subject_id, pending in rows:
+        day = date.fromisoformat(day)
+        if kind == SUBJECT:
+            subject_minutes[(user_id, day, subject_id)] = pending
+            day_minutes[(user_id, day)] # a subject's minutes need the day's row
+        else:
+            day_minutes[(user_id, day)][kind] += pending
+
+    totals = {}
+    with transaction.atomic():
+        activities = {
+            (activity.user_id, activity.date): activity
+            for activity in UserDailyActivity.objects.filter(
+                user_id__in={user_id for user_id, _ in day_minutes}, date__in={day for _, day in day_minutes}
+            )
+        }
+        new_activities, changed_activities = [], []
+        for (user_id, day), minutes in day_minutes.items():
+            activity = activities.get((user_id, day))
+            if activity is None:
+                activity = activities[(user_id, day)] = UserDailyActivity(user_id=user_id, date=day)
+                new_activities.append(activity)
+            else:
+                changed_activities.append(activity)
+            activity.study_duration_minutes += minutes[STUDY]
+            activity.library_study_duration_minutes += minutes[LIBRARY]
+            totals[(user_id, day.isoformat(), STUDY, 0)] = activity.study_duration_minutes
+            totals[(user_id, day.isoformat(), LIBRARY, 0)] = activity.library_study_duration_minutes
+        UserDailyActivity.objects.bulk_create(new_activities)
+        UserDailyActivity.objects.bulk_update(changed_activities, ['study_duration_minutes', 'library_study_duration_minutes'])
+
+        # Subjects deleted since their pings lose those minutes; the day's total keeps them.
+        subject_ids = set(Subject.objects.filter(
+            id__in={subject_id for _, _, subject_id in subject_minutes}
+        ).values_list('id', flat=True))
+        studies = {
+            (study.daily_activity_id, study.subject_id): study
+            for study in UserSubjectStudy.objects.filter(
+                daily_activity_id__in={activities[(user_id, day)].id for user_id, day, _ in subject_minutes},
+                subject_id__in=subject_ids,
+            )
+        }
+        new_studies, changed_studies = [], []
+        for (user_id, day, subject_id), minutes in subject_minutes.items():
+            if subject_id not in subject_ids:
+                continue
+            activity = activities[(user_id, day)]
+            study = studies.get((activity.id, subject_id))
+            if study is None:
+                study = UserSubjectStudy(daily_activity=activity, subject_id=subject_id)
+                new_studies.append(study)
+            else:
+                changed_studies.append(study)
+            study.duration_minutes += minutes
+            totals[(user_id, day.isoformat(), SUBJECT, subject_id)] = study.duration_minutes
+        UserSubjectStudy.objects.bulk_create(new_studies)
+        UserSubjectStudy.objects.bulk_update(changed_studies, ['duration_minutes'])
+
+        # What UserDailyActivity's post_save receiver does for each saved row; the
+        # changed rows were loaded from the database, so they know what they held.
+        record_daily_activity_changes(
+            [(activity, True) for activity in new_activities] + [(activity, False) for activity in changed_activities]
+        )
+
+    for user_id in {user_id for user_id, _ in day_minutes}:
+        invalidate_reward_progress(user_id)
+    return totals
+
@@ -1,3 +1,328 @@
-from django.test import TestCase
+import json
+import sqlite3
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from content.models import Class, Subject
+from jobs.models import Job
+from jobs.queue import run_pending_jobs
+from .models import (
+    CustomUser, School, StudentProfile, Syllabus, TeacherProfile, UserAttendanceYear, UserDailyActivity, UserStudyStreak,
+    UserSubjectStudy
+)
+from .services import DEFAULT_STREAK_MINUTES, get_study_streak, rebuild_attendance_year, rebuild_study_streak
+from .study_pings import FLUSH_STUDY_PINGS_JOB, buffer_id, flush_study_pings, record_study_ping
+
+
+# The configured cache is shared with the running server (see settings.CACHES),
+# so tests get a cache of their own: they neither clear the server's nor read its entries.
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'}}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class StudyStreakTests(TestCase):
+    """The materialized streak follows every save and delete of the user's daily activity."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='streaker', email='streaker@example.com', password='streak')
+        self.today = timezone.now().date()
+        rebuild_study_streak(self.user)
+
+    def study(self, days_ago, minutes=DEFAULT_STREAK_MINUTES):
+        activity, _ = UserDailyActivity.objects.get_or_create(user=self.user, date=self.today - timedelta(days=days_ago))
+        activity.study_duration_minutes = minutes
+        activity.save()
+        return activity
+
+    def assertStreak(self, length):
+        self.assertEqual(get_study_streak(self.user), length)
+        rebuilt = rebuild_study_streak(self.user)
+        self.assertEqual(rebuilt.current_streak if rebuilt.last_qualifying_date == self.today else 0, length)
+
+    def test_consecutive_days_extend_the_streak(self):
+        for days_ago in (2, 1, 0):
+            self.study(days_ago)
+        self.assertStreak(3)
+
+    def test_gap_day_breaks_the_streak(self):
+        self.study(3)
+        self.study(2)
+        self.study(0)
+        self.assertStreak(1)
+
+    def test_filling_the_gap_joins_the_runs(self):
+        self.study(2)
+        self.study(0)
+        self.study(1)
+        self.assertStreak(3)
+
+    def test_editing_a_day_below_the_threshold_breaks_the_streak(self):
+        for days_ago in (2, 1, 0):
+            self.study(days_ago)
+        self.study(1, DEFAULT_STREAK_MINUTES - 1)
+        self.assertStreak(1)
+
+    def test_deleting_a_day_breaks_the_streak(self):
+        for days_ago in (2, 1, 0):
+            self.study(days_ago)
+        UserDailyActivity.objects.get(user=self.user, date=self.today - timedelta(days=1)).delete()
+        self.assertStreak(1)
+
+    def test_moving_a_day_into_the_gap(self):
+        self.study(2)
+        activity = self.study(5)
+        self.study(0)
+        activity.date = self.today - timedelta(days=1)
+        activity.save()
+        self.assertStreak(3)
+
+    def test_save_without_a_loaded_state_rebuilds(self):
+        for days_ago in (2, 1, 0):
+            self.study(days_ago)
+        yesterday = UserDailyActivity.objects.get(user=self.user, date=self.today - timedelta(days=1))
+        UserDailyActivity(
+            pk=yesterday.pk, user=self.user, date=yesterday.date, study_duration_minutes=0
+        ).save()
+        self.assertStreak(1)
+        self.assertEqual(UserStudyStreak.objects.filter(user=self.user).count(), 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AttendanceRollupTests(TestCase):
+    """The year-to-date rollup matches a recount from the daily activity after every kind of change."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='attendee', email='attendee@example.com', password='attend')
+
+    def assertRollup(self, year, present_days, recorded_days):
+        rollup = UserAttendanceYear.objects.get(user=self.user, year=year)
+        self.assertEqual((rollup.present_days, rollup.recorded_days), (present_days, recorded_days))
+        rebuilt = rebuild_attendance_year(self.user.id, year)
+        self.assertEqual((rebuilt.present_days, rebuilt.recorded_days), (present_days, recorded_days))
+
+    def test_new_days(self):
+        UserDailyActivity.objects.create(user=self.user, date=date(2025, 3, 1), present=True)
+        UserDailyActivity.objects.create(user=self.user, date=date(2025, 3, 2), present=False)
+        UserDailyActivity.objects.create(user=self.user, date=date(2025, 3, 3), present=True)
+        self.assertRollup(2025, 2, 3)
+
+    def test_present_and_absent_toggles(self):
+        activity = UserDailyActivity.objects.create(user=self.user, date=date(2025, 3, 1), present=False)
+        UserDailyActivity.objects.create(user=self.user, date=date(2025, 3, 2), present=True)
+        activity.present = True
+        activity.save()
+        self.assertRollup(2025, 2, 2)
+        activity.present = False
+        activity.save()
+        self.assertRollup(2025, 1, 2)
+        activity.save() # Saving again without a change leaves the rollup alone.
+        self.assertRollup(2025, 1, 2)
+
+        reloaded = UserDailyActivity.objects.get(pk=activity.pk)
+        reloaded.present = True
+        reloaded.save()
+        self.assertRollup(2025, 2, 2)
+
+    def test_deletes(self):
+        present = UserDailyActivity.objects.create(user=self.user, date=date(2025, 3, 1), present=True)
+        absent = UserDailyActivity.objects.create(user=self.user, date=date(2025, 3, 2), present=False)
+        UserDailyActivity.objects.create(user=self.user, date=date(2025, 3, 3), present=True)
+        present.delete()
+        self.assertRollup(2025, 1, 2)
+        UserDailyActivity.objects.get(pk=absent.pk).delete()
+        self.assertRollup(2025, 1, 1)
+
+    def test_year_rollover(self):
+        UserDailyActivity.objects.create(user=self.user, date=date(2024, 12, 31), present=True)
+        new_year = UserDailyActivity.objects.create(user=self.user, date=date(2025, 1, 1), present=True)
+        UserDailyActivity.objects.create(user=self.user, date=date(2025, 1, 2), present=False)
+        self.assertRollup(2024, 1, 1)
+        self.assertRollup(2025, 1, 2)
+
+        # A day moved back across the new year leaves one rollup for the other.
+        new_year.date = date(2024, 12, 30)
+        new_year.save()
+        self.assertRollup(2024, 2, 2)
+        self.assertRollup(2025, 0, 1)
+
+    def test_save_without_a_loaded_state_recounts(self):
+        activity = UserDailyActivity.objects.create(user=self.user, date=date(2025, 3, 1), present=False)
+        UserDailyActivity(pk=activity.pk, user=self.user, date=activity.date, present=True).save()
+        self.assertRollup(2025, 1, 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class StudyPingBufferTests(TestCase):
+    """Pings add up in the server's buffer, and a flush leaves the tables as saving the same minutes row by row would."""
+
+    @classmethod
+    def setUpTestData(cls):
+        syllabus = Syllabus.objects.create(name='Ping Syllabus')
+        cls.subject = Subject.objects.create(master_class=Class.objects.create(syllabus=syllabus, name='Class 1'), name='Art')
+        cls.user = CustomUser.objects.create_user(username='pinger', email='pinger@example.com', password='ping')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.buffer_path = Path(directory.name) / 'study_pings.sqlite3'
+        settings_override = override_settings(STUDY_PING_BUFFER_PATH=self.buffer_path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.today = timezone.now().date()
+
+    def test_record_flush_and_totals(self):
+        self.assertEqual(record_study_ping(self.user, 5, self.subject.id), {'subject_minutes': 5, 'total_day_minutes': 5})
+        self.assertEqual(record_study_ping(self.user, 3, self.subject.id), {'subject_minutes': 8, 'total_day_minutes': 8})
+        self.assertEqual(record_study_ping(self.user, 4), {'library_minutes': 4})
+        self.assertFalse(UserDailyActivity.objects.exists())
+
+        self.assertEqual(flush_study_pings(), 3)
+        activity = UserDailyActivity.objects.get(user=self.user, date=self.today)
+        self.assertEqual((activity.study_duration_minutes, activity.library_study_duration_minutes), (8, 4))
+        self.assertEqual(UserSubjectStudy.objects.get(daily_activity=activity, subject=self.subject).duration_minutes, 8)
+        self.assertEqual(flush_study_pings(), 0)
+
+        # Later pings keep counting from the buffer, and the next flush adds only what is new.
+        self.assertEqual(record_study_ping(self.user, 2, self.subject.id), {'subject_minutes': 10, 'total_day_minutes': 10})
+        self.assertEqual(flush_study_pings(), 2)
+        activity.refresh_from_db()
+        self.assertEqual(activity.study_duration_minutes, 10)
+
+    def test_first_ping_starts_from_the_stored_totals(self):
+        activity = UserDailyActivity.objects.create(
+            user=self.user, date=self.today, study_duration_minutes=30, library_study_duration_minutes=7
+        )
+        UserSubjectStudy.objects.create(daily_activity=activity, subject=self.subject, duration_minutes=20)
+        self.assertEqual(record_study_ping(self.user, 5, self.subject.id), {'subject_minutes': 25, 'total_day_minutes': 35})
+        self.assertEqual(record_study_ping(self.user, 1), {'library_minutes': 8})
+        with self.assertRaises(Subject.DoesNotExist):
+            record_study_ping(self.user, 5, 999999)
+
+        flush_study_pings()
+        activity.refresh_from_db()
+        self.assertEqual((activity.study_duration_minutes, activity.library_study_duration_minutes), (35, 8))
+        self.assertEqual(UserSubjectStudy.objects.get(daily_activity=activity).duration_minutes, 25)
+
+    def test_flush_matches_saving_each_row(self):
+        other = CustomUser.objects.create_user(username='saver', email='saver@example.com', password='save')
+        for user in (self.user, other):
+            UserDailyActivity.objects.create(
+                user=user, date=self.today - timedelta(days=1), study_duration_minutes=DEFAULT_STREAK_MINUTES, present=True
+            )
+            UserDailyActivity.objects.create(user=user, date=self.today - timedelta(days=2), study_duration_minutes=10)
+            rebuild_study_streak(user)
+
+        # Yesterday gains minutes but stays qualified, the day before crosses the threshold, and today is new.
+        minutes = {2: DEFAULT_STREAK_MINUTES, 1: 15, 0: DEFAULT_STREAK_MINUTES}
+        self.buffer_study_minutes(minutes)
+        self.assertEqual(flush_study_pings(), 3)
+        for days_ago, added in minutes.items():
+            activity, _ = UserDailyActivity.objects.get_or_create(user=other, date=self.today - timedelta(days=days_ago))
+            activity.study_duration_minutes += added
+            activity.save()
+
+        def state(user):
+            streak = UserStudyStreak.objects.get(user=user, threshold_minutes=DEFAULT_STREAK_MINUTES)
+            return (
+                list(UserDailyActivity.objects.filter(user=user).order_by('date').values_list('date', 'study_duration_minutes')),
+                list(UserAttendanceYear.objects.filter(user=user).order_by('year').values_list('year', 'present_days', 'recorded_days')),
+                (streak.current_streak, streak.last_qualifying_date),
+            )
+        self.assertEqual(state(self.user), state(other))
+        self.assertEqual(get_study_streak(self.user), 3)
+
+    def buffer_study_minutes(self, minutes_by_days_ago):
+        # Pings only ever count towards today, so earlier days are written to the buffer as a flush would find them.
+        flush_study_pings() # Creates the buffer
+        with sqlite3.connect(self.buffer_path) as buffer:
+            buffer.executemany(
+                "INSERT INTO study_totals (user_id, day, kind, subject_id, total, pending) VALUES (?, ?, 'study', 0, 0, ?)",
+                [(self.user.id, (self.today - timedelta(days=days_ago)).isoformat(), minutes)
+                 for days_ago, minutes in minutes_by_days_ago.items()]
+            )
+        buffer.close()
+
+    def test_flush_jobs_name_their_buffer(self):
+        record_study_ping(self.user, 5)
+        record_study_ping(self.user, 5)
+        (job,) = Job.objects.filter(kind=FLUSH_STUDY_PINGS_JOB)
+        self.assertEqual(job.payload, {'buffer': buffer_id()})
+
+        # Another server's buffer gets a job of its own.
+        with override_settings(STUDY_PING_BUFFER_PATH=self.buffer_path.with_name('other.sqlite3')):
+            record_study_ping(self.user, 5)
+            other_buffer = buffer_id()
+        self.assertEqual(
+            sorted(job.payload['buffer'] for job in Job.objects.filter(kind=FLUSH_STUDY_PINGS_JOB)),
+            sorted([buffer_id(), other_buffer])
+        )
+
+        # A job claimed here for the other buffer is put back for its own workers, and writes nothing.
+        Job.objects.filter(kind=FLUSH_STUDY_PINGS_JOB).update(run_after=timezone.now())
+        run_pending_jobs()
+        self.assertEqual(UserDailyActivity.objects.get(user=self.user).library_study_duration_minutes, 10)
+        (handed_back,) = Job.objects.filter(kind=FLUSH_STUDY_PINGS_JOB)
+        self.assertEqual(handed_back.payload, {'buffer': other_buffer})
+        self.assertGreater(handed_back.run_after, timezone.now())
+
+        # Once flushed, the next ping here asks for a flush again.
+        record_study_ping(self.user, 5)
+        self.assertEqual(Job.objects.filter(kind=FLUSH_STUDY_PINGS_JOB).count(), 2)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SparseUserFieldsTests(TestCase):
+    """`?fields=` on the users endpoint, whose queryset only joins the rows the requested fields render."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_user(
+            username='sparse_admin', email='sparse_admin@example.com', password='sparse', role='Admin'
+        )
+        cls.school = School.objects.create(
+            name='Sparse School', school_id_code='SPARSE-1', official_email='office@sparse.example.com', admin_user=cls.admin
+        )
+        cls.student = CustomUser.objects.create_user(
+            username='sparse_pupil', email='sparse_pupil@example.com', password='sparse', role='Student', school=cls.school
+        )
+        StudentProfile.objects.create(user=cls.student, school=cls.school, full_name='Sparse Pupil', profile_completed=True)
+        cls.teacher = CustomUser.objects.create_user(
+            username='sparse_tutor', email='sparse_tutor@example.com', password='sparse', role='Teacher', school=cls.school
+        )
+        TeacherProfile.objects.create(user=cls.teacher, school=cls.school, full_name='Sparse Tutor')
+
+    def get(self, url, status=200):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.get(url)
+        self.assertEqual(response.status_code, status, response.data)
+        data = json.loads(json.dumps(response.data))
+        return data['results'] if isinstance(data, dict) and 'results' in data else data
+
+    def test_narrowed_queryset_renders_every_requested_field(self):
+        for fields in (
+            'id,username', 'school_name', 'student_profile', 'teacher_profile,role', 'profile_completed',
+            'administered_school', 'id,parent_profile,school_name',
+        ):
+            names = fields.split(',')
+            for user in (self.admin, self.student, self.teacher):
+                full = self.get(f'/api/users/{user.id}/')
+                self.assertEqual(self.get(f'/api/users/{user.id}/?fields={fields}'), {name: full[name] for name in names})
+
+    def test_nested_fields_and_depth(self):
+        user = self.get(f'/api/users/{self.student.id}/?fields=id,student_profile.full_name,student_profile.school_name')
+        self.assertEqual(user, {
+            'id': self.student.id, 'student_profile': {'full_name': 'Sparse Pupil', 'school_name': 'Sparse School'}
+        })
+        user = self.get(f'/api/users/{self.admin.id}/?depth=0')
+        for name in ('administered_school', 'student_profile', 'teacher_profile', 'parent_profile'):
+            self.assertNotIn(name, user)
+        self.assertEqual(user['school_name'], None)
+        user = self.get(f'/api/users/{self.admin.id}/?depth=0&expand=administered_school')
+        self.assertEqual(user['administered_school']['name'], 'Sparse School')
+        self.get(f'/api/users/{self.admin.id}/?depth=deep', status=400)
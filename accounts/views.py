@@ -8,8 +8,12 @@ from .models import (
     RecentActivity, Syllabus, SchoolClass, StudentRecommendation, StudentTask,
     TeacherTask
 )
-from content.models import Class as MasterClass, Subject as ContentSubject, Lesson, AILessonQuizAttempt, UserLessonProgress, UserQuizAttempt
-from content.services import check_and_award_rewards
+from content.models import Class as MasterClass, Subject as ContentSubject, Lesson, AILessonQuizAttempt, UserLessonProgress, UserQuizAttempt, UserSubjectCompletion
+from stepwise_backend.fieldsets import SparseFieldsViewMixin
+from content.curriculum import get_class_ids, get_class_trees
+from content.services import prefetch_class_tree, queue_reward_evaluation
+from .services import days_so_far, get_attendance_year, get_school_attendance
+from . import study_pings
 from rest_framework.decorators import action, api_view, permission_classes as dec_permission_classes, parser_classes
 import django_filters.rest_framework
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
@@ -28,7 +32,7 @@ from rest_framework.exceptions import PermissionDenied, NotFound, ValidationErro
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
 from django.utils import timezone
-from django.db.models import F, Sum, OuterRef, Subquery, Count, Avg
+from django.db.models import Sum, OuterRef, Subquery, Count, Avg
 from django.db import models as db_models
 from datetime import timedelta, datetime
 
@@ -105,7 +109,7 @@ class LoginView(ObtainAuthToken):
             UserLoginActivity.objects.create(user=user, activity_type='login')
             UserDailyActivity.objects.get_or_create(user=user, date=timezone.now().date(), defaults={'present': True})
             RecentActivity.objects.create(user=user, activity_type='Login', details='Logged in to the platform.')
-            check_and_award_rewards(user, trigger_event='LOGIN')
+            queue_reward_evaluation(user, trigger_event='LOGIN')
             
         return Response({'token': token.key})
 
@@ -137,25 +141,46 @@ class SchoolViewSet(viewsets.ModelViewSet):
             self.permission_classes = [permissions.IsAuthenticated, IsAdminOfThisSchoolOrPlatformStaff]
         elif self.action == 'destroy':
             self.permission_classes = [permissions.IsAdminUser] 
+        elif self.action == 'attendance':
+            self.permission_classes = [permissions.IsAuthenticated, IsAdminOfThisSchoolOrPlatformStaff]
         else:
             self.permission_classes = [permissions.IsAuthenticatedOrReadOnly]
         return super().get_permissions()
 
+    @action(detail=True, methods=['get'])
+    def attendance(self, request, pk=None):
+        """Year-to-date attendance of the school's students. Pass ?year= for another year."""
+        school = self.get_object()
+        year = request.query_params.get('year')
+        if year is not None and not year.isdigit():
+            raise ValidationError({'year': 'Must be a year, e.g. 2025.'})
+        return Response(get_school_attendance(school.id, int(year) if year else None))
+
 class SyllabusListView(ListAPIView):
     queryset = Syllabus.objects.all()
     serializer_class = SyllabusSerializer
     permission_classes = [AllowAny]
 
-class MasterClassListView(ListAPIView):
+class MasterClassListView(SparseFieldsViewMixin, ListAPIView):
     serializer_class = MasterClassSerializer
     permission_classes = [AllowAny]
     
     def get_queryset(self):
         syllabus_id = self.request.query_params.get('syllabus_id', None)
         if syllabus_id:
-            return MasterClass.objects.filter(syllabus_id=syllabus_id)
+            return prefetch_class_tree(MasterClass.objects.filter(syllabus_id=syllabus_id), self.request.user)
         return MasterClass.objects.none()
 
+    def list(self, request, *args, **kwargs):
+        syllabus_id = request.query_params.get('syllabus_id', None)
+        if not syllabus_id or not syllabus_id.isdigit():
+            return super().list(request, *args, **kwargs)
+        # Served from the shared curriculum cache.
+        class_ids = get_class_ids(syllabus_id)
+        page = self.paginate_queryset(class_ids)
+        trees = self.sparse_data(get_class_trees(page if page is not None else class_ids, request.user))
+        return self.get_paginated_response(trees) if page is not None else Response(trees)
+
 class SchoolClassListView(viewsets.ReadOnlyModelViewSet):
     serializer_class = SchoolClassSerializer
     permission_classes = [IsAuthenticated]
@@ -166,13 +191,24 @@ class SchoolClassListView(viewsets.ReadOnlyModelViewSet):
         return SchoolClass.objects.all().select_related('master_class')
 
 
-class CustomUserViewSet(viewsets.ModelViewSet):
-    queryset = CustomUser.objects.all().select_related('student_profile', 'teacher_profile', 'parent_profile', 'school', 'administered_school')
+class CustomUserViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
+    queryset = CustomUser.objects.all()
     serializer_class = CustomUserSerializer
     filter_backends = [django_filters.rest_framework.DjangoFilterBackend]
     filterset_fields = ['role', 'username', 'email', 'school'] 
     parser_classes = [MultiPartParser, FormParser, JSONParser]
 
+    def get_queryset(self):
+        # Only join the related rows the requested fields render.
+        related = ['school'] if self.wants('school_name') else []
+        for profile in ('student_profile', 'teacher_profile', 'parent_profile'):
+            if self.wants(profile) or self.wants('profile_completed'):
+                related.append(profile)
+        if self.wants('administered_school'):
+            related.append('administered_school')
+        users = super().get_queryset()
+        return users.select_related(*related) if related else users
+
     def get_serializer_context(self):
         return {'request': self.request, **super().get_serializer_context()}
 
@@ -412,9 +448,7 @@ class ProgressAnalyticsView(generics.GenericAPIView):
         today_activity = UserDailyActivity.objects.filter(user=target_user, date=today).first()
         today_study_minutes = today_activity.study_duration_minutes if today_activity else 0
 
-        total_days_in_year = (today - today.replace(month=1, day=1)).days + 1
-        present_days = UserDailyActivity.objects.filter(user=target_user, present=True, date__year=today.year).count()
-        attendance = {'total_days': total_days_in_year, 'present_days': present_days}
+        attendance = {'total_days': days_so_far(today), 'present_days': get_attendance_year(target_user, today.year).present_days}
 
         subject_distribution = UserSubjectStudy.objects.filter(daily_activity__user=target_user).values('subject__name').annotate(total_duration=Sum('duration_minutes')).order_by('-total_duration')
         
@@ -449,18 +483,17 @@ class ProgressAnalyticsView(generics.GenericAPIView):
         try:
             student_profile = StudentProfile.objects.get(user=target_user)
             if student_profile.enrolled_class:
-                subjects_in_class = ContentSubject.objects.filter(master_class=student_profile.enrolled_class.master_class)
-                subject_progress = []
-                for subject in subjects_in_class:
-                    total_lessons = Lesson.objects.filter(subject=subject).count()
-                    completed_lessons = UserLessonProgress.objects.filter(
-                        user=target_user, lesson__subject=subject, completed=True
-                    ).count()
-                    subject_progress.append({
-                        'subject__name': subject.name,
-                        'completed_lessons': completed_lessons,
-                        'total_lessons': total_lessons,
-                    })
+                subjects_in_class = ContentSubject.objects.filter(
+                    master_class=student_profile.enrolled_class.master_class
+                ).annotate(total_lessons=Count('lessons'))
+                completed_by_subject = dict(UserSubjectCompletion.objects.filter(
+                    user=target_user, subject__in=subjects_in_class
+                ).values_list('subject_id', 'completed_lessons'))
+                subject_progress = [{
+                    'subject__name': subject.name,
+                    'completed_lessons': completed_by_subject.get(subject.id, 0),
+                    'total_lessons': subject.total_lessons,
+                } for subject in subjects_in_class]
             else:
                 subject_progress = []
         except StudentProfile.DoesNotExist:
@@ -516,44 +549,14 @@ def record_study_ping(request):
     if user.role != 'Student':
         return Response({'error': 'Only students can record study time'}, status=status.HTTP_403_FORBIDDEN)
     
-    daily_activity, _ = UserDailyActivity.objects.get_or_create(user=user, date=timezone.now().date())
-
     if subject_id:
         try:
-            subject = ContentSubject.objects.get(pk=subject_id)
-            
-            subject_study, created = UserSubjectStudy.objects.get_or_create(
-                daily_activity=daily_activity,
-                subject=subject,
-                defaults={'duration_minutes': duration}
-            )
-            if not created:
-                subject_study.duration_minutes = F('duration_minutes') + duration
-                subject_study.save(update_fields=['duration_minutes'])
-
-            daily_activity.study_duration_minutes = F('study_duration_minutes') + duration
-            daily_activity.save(update_fields=['study_duration_minutes'])
-            
-            daily_activity.refresh_from_db()
-            subject_study.refresh_from_db()
-
-            return Response({
-                'status': 'ok',
-                'total_day_minutes': daily_activity.study_duration_minutes,
-                'subject_minutes': subject_study.duration_minutes
-            }, status=status.HTTP_200_OK)
-
-        except ContentSubject.DoesNotExist:
+            totals = study_pings.record_study_ping(user, duration, int(subject_id))
+        except (ContentSubject.DoesNotExist, TypeError, ValueError):
             return Response({'error': 'Subject not found'}, status=status.HTTP_404_NOT_FOUND)
-
     else:
-        daily_activity.library_study_duration_minutes = F('library_study_duration_minutes') + duration
-        daily_activity.save(update_fields=['library_study_duration_minutes'])
-        daily_activity.refresh_from_db()
-        return Response({
-            'status': 'ok',
-            'library_minutes': daily_activity.library_study_duration_minutes
-        }, status=status.HTTP_200_OK)
+        totals = study_pings.record_study_ping(user, duration)
+    return Response({'status': 'ok', **totals}, status=status.HTTP_200_OK)
 
 
 class StudentTaskViewSet(viewsets.ModelViewSet):
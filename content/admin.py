@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Class, Subject, Lesson, Quiz, Question, Choice, Book, Reward, UserReward, ProcessedNote, UserLessonProgress, UserQuizAttempt, Checkpoint, AILessonQuizAttempt, UserNote, TranslatedLessonContent, AILessonSummary, StudentResource, ManualReport
+from .models import Class, Subject, Lesson, Quiz, Question, Choice, Book, Reward, UserReward, UserRewardCounter, ProcessedNote, UserLessonProgress, UserPassedLesson, UserLessonUnlock, UserSubjectCompletion, UserQuizAttempt, QuizAnswer, Checkpoint, AILessonQuizAttempt, AIQuizCooldown, ExamSubmission, UserNote, TranslatedLessonContent, AILessonSummary, StudentResource, ManualReport
 
 # Register your models here.
 admin.site.register(Class)
@@ -11,11 +11,18 @@ admin.site.register(Choice)
 admin.site.register(Book)
 admin.site.register(Reward)
 admin.site.register(UserReward)
+admin.site.register(UserRewardCounter)
 admin.site.register(ProcessedNote)
 admin.site.register(UserLessonProgress)
+admin.site.register(UserPassedLesson)
+admin.site.register(UserLessonUnlock)
+admin.site.register(UserSubjectCompletion)
 admin.site.register(UserQuizAttempt)
+admin.site.register(QuizAnswer)
 admin.site.register(Checkpoint)
 admin.site.register(AILessonQuizAttempt)
+admin.site.register(AIQuizCooldown)
+admin.site.register(ExamSubmission)
 admin.site.register(UserNote)
 admin.site.register(TranslatedLessonContent)
 admin.site.register(AILessonSummary)
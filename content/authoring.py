@@ -0,0 +1,119 @@
+"""
+Nested quiz writes. The questions and choices a teacher submits are compared
+with the stored rows and only the differences are written, in bulk and in one
+transaction, so saving a quiz costs the same few statements however many
+questions it has and rows that are kept keep their ids (which attempts refer to).
+
+The bulk writes send no signals, so the quiz's answer key and the curriculum
+cache are retired here, once the transaction commits: retired any earlier, a
+request reading in the meantime could cache the old rows under the new version.
+"""
+from collections import defaultdict
+from django.db import transaction
+from .grading import bump_answer_key_version
+from .models import Choice, Question
+
+
+def save_quiz_questions(quiz, questions_data):
+    """
+    Makes the quiz's questions match `questions_data`, validated QuestionSerializer
+    items with their choices. An item with the id of one of the quiz's questions
+    updates it, an item without an id adds a question, and questions left out are
+    deleted. Raises ValueError for an id that isn't one of the quiz's questions
+    or is listed twice.
+    """
+    existing = Question.objects.filter(quiz=quiz).in_bulk()
+    _check_ids([data['id'] for data in questions_data if 'id' in data], existing, "this quiz's questions")
+
+    items, new_questions, changed_questions, changed_fields = [], [], [], set()
+    for data in questions_data:
+        fields = {name: value for name, value in data.items() if name not in ('id', 'choices')}
+        question = existing.get(data.get('id'))
+        if question is None:
+            question = Question(quiz=quiz, **fields)
+            new_questions.append(question)
+        else:
+            changed = _assign(question, fields)
+            if changed:
+                changed_questions.append(question)
+                changed_fields.update(changed)
+        items.append((question, data.get('choices')))
+    kept_ids = {question.id for question, _ in items if question.id}
+
+    with transaction.atomic():
+        removed_ids = set(existing) - kept_ids
+        if removed_ids:
+            Question.objects.filter(id__in=removed_ids).delete()
+        Question.objects.bulk_create(new_questions)
+        if changed_questions:
+            Question.objects.bulk_update(changed_questions, sorted(changed_fields))
+        _save_choices([(question, choices) for question, choices in items if choices is not None], kept_ids)
+        retire_quiz_caches_on_commit(quiz.id)
+
+
+def save_question_choices(question, choices_data):
+    """
+    Makes the question's choices match `choices_data` the same way
+    save_quiz_questions matches questions.
+    """
+    with transaction.atomic():
+        _save_choices([(question, choices_data)], {question.id})
+        retire_quiz_caches_on_commit(question.quiz_id)
+
+
+def retire_quiz_caches_on_commit(quiz_id):
+    """Retires the quiz's answer key and the curriculum trees once the current transaction commits."""
+    # Imported here because the curriculum module imports the serializers, which import this one.
+    from .curriculum import bump_curriculum_version
+    transaction.on_commit(lambda: bump_answer_key_version(quiz_id))
+    transaction.on_commit(bump_curriculum_version)
+
+
+def _save_choices(items, existing_question_ids):
+    """Applies (question, choices_data) pairs; only `existing_question_ids` can have stored choices."""
+    existing = defaultdict(dict)
+    if existing_question_ids:
+        for choice in Choice.objects.filter(question_id__in=existing_question_ids):
+            existing[choice.question_id][choice.id] = choice
+
+    new_choices, changed_choices, changed_fields, kept_ids = [], [], set(), set()
+    for question, choices_data in items:
+        stored = existing[question.id]
+        _check_ids([data['id'] for data in choices_data if 'id' in data], stored, f"question {question.id}'s choices")
+        for data in choices_data:
+            fields = {name: value for name, value in data.items() if name != 'id'}
+            choice = stored.get(data.get('id'))
+            if choice is None:
+                new_choices.append(Choice(question=question, **fields))
+                continue
+            kept_ids.add(choice.id)
+            changed = _assign(choice, fields)
+            if changed:
+                changed_choices.append(choice)
+                changed_fields.update(changed)
+
+    removed_ids = {
+        choice_id for question, _ in items for choice_id in existing[question.id] if choice_id not in kept_ids
+    }
+    if removed_ids:
+        Choice.objects.filter(id__in=removed_ids).delete()
+    Choice.objects.bulk_create(new_choices)
+    if changed_choices:
+        Choice.objects.bulk_update(changed_choices, sorted(changed_fields))
+
+
+def _check_ids(ids, stored, description):
+    unknown = set(ids) - set(stored)
+    if unknown:
+        raise ValueError(f"{sorted(unknown)} are not among {description}.")
+    if len(ids) != len(set(ids)):
+        raise ValueError(f"Each of {description} can only be listed once.")
+
+
+def _assign(instance, fields):
+    """Sets `fields` on `instance`. Returns the names of the fields whose value changed."""
+    changed = [name for name, value in fields.items() if getattr(instance, name) != value]
+    for name in changed:
+        setattr(instance, name, fields[name])
+    return changed
+
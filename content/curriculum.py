@@ -0,0 +1,99 @@
+"""
+Cache of serialized curriculum trees (Class -> Subject -> Lesson -> Quiz), shared
+by all users and retired as a whole whenever content changes. Per-user fields
+are filled in from the user's own tables on the way out.
+"""
+from django.core.cache import cache
+from .models import Class, UserLessonUnlock, UserSubjectCompletion
+from .serializers import ClassSerializer
+from .services import compute_lesson_gates, lesson_locks_apply, prefetch_class_tree
+
+CURRICULUM_VERSION_KEY = 'curriculum:version'
+CURRICULUM_CLASS_KEY = 'curriculum:{version}:class:{class_id}'
+CURRICULUM_CLASS_IDS_KEY = 'curriculum:{version}:class_ids:{syllabus_id}'
+
+# Old versions are never read again, so entries only need to outlive a busy day.
+CURRICULUM_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_curriculum_version():
+    return cache.get_or_set(CURRICULUM_VERSION_KEY, 1, None)
+
+
+def bump_curriculum_version():
+    """Retires every cached curriculum tree, e.g. after a lesson or quiz changes."""
+    try:
+        cache.incr(CURRICULUM_VERSION_KEY)
+    except ValueError:
+        cache.set(CURRICULUM_VERSION_KEY, 2, None)
+
+
+def get_class_ids(syllabus_id=None):
+    """Returns the ids of all classes, or of a syllabus' classes, in the default class ordering."""
+    key = CURRICULUM_CLASS_IDS_KEY.format(version=get_curriculum_version(), syllabus_id=syllabus_id or 'all')
+    class_ids = cache.get(key)
+    if class_ids is None:
+        classes = Class.objects.all()
+        if syllabus_id:
+            classes = classes.filter(syllabus_id=syllabus_id)
+        class_ids = list(classes.values_list('id', flat=True))
+        cache.set(key, class_ids, CURRICULUM_CACHE_TIMEOUT)
+    return class_ids
+
+
+def get_class_trees(class_ids, user=None):
+    """
+    Returns the serialized trees of `class_ids` (missing ids are skipped) with
+    `user`'s lock states and progress filled in.
+    """
+    version = get_curriculum_version()
+    keys = {class_id: CURRICULUM_CLASS_KEY.format(version=version, class_id=class_id) for class_id in class_ids}
+    cached = cache.get_many(keys.values())
+    trees = {class_id: cached[key] for class_id, key in keys.items() if key in cached}
+
+    missing = [class_id for class_id in class_ids if class_id not in trees]
+    if missing:
+        # Serialized without a request, so the per-user fields hold their anonymous defaults.
+        classes = prefetch_class_tree(Class.objects.filter(id__in=missing), None)
+        fresh = {tree['id']: tree for tree in ClassSerializer(classes, many=True).data}
+        cache.set_many({keys[class_id]: tree for class_id, tree in fresh.items()}, CURRICULUM_CACHE_TIMEOUT)
+        trees.update(fresh)
+
+    ordered = [trees[class_id] for class_id in class_ids if class_id in trees]
+    apply_user_overlay(ordered, user)
+    return ordered
+
+
+def apply_user_overlay(trees, user):
+    """Fills in `user`'s `is_locked` and `progress` fields of serialized class trees, in place."""
+    if not user or not user.is_authenticated:
+        return trees
+
+    subjects = [subject for tree in trees for subject in tree['subjects']]
+    completions = {
+        subject_id: (completed, total)
+        for subject_id, completed, total in UserSubjectCompletion.objects.filter(
+            user=user, subject_id__in=[subject['id'] for subject in subjects]
+        ).values_list('subject_id', 'completed_lessons', 'total_lessons')
+    }
+
+    locks = {}
+    if lesson_locks_apply(user):
+        lesson_rows = sorted(
+            ((lesson['id'], subject['id'], lesson['lesson_order'], lesson['requires_previous_quiz'])
+             for subject in subjects for lesson in subject['lessons']),
+            key=lambda row: (row[1], row[2], row[0])
+        )
+        gates = compute_lesson_gates(lesson_rows)
+        gated_ids = [lesson_id for lesson_id, gate_id in gates.items() if gate_id is not None]
+        unlocked = set(UserLessonUnlock.objects.filter(user=user, lesson_id__in=gated_ids).values_list(
+            'lesson_id', flat=True
+        ))
+        locks = {lesson_id: lesson_id not in unlocked for lesson_id in gated_ids}
+
+    for subject in subjects:
+        completed, total = completions.get(subject['id'], (0, 0))
+        subject['progress'] = (completed / total) * 100 if total else 0
+        for lesson in subject['lessons']:
+            lesson['is_locked'] = locks.get(lesson['id'], False)
+    return trees
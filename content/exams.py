@@ -0,0 +1,189 @@
+"""
+Exam-mode submissions, for a class handing in a quiz at the same moment.
+
+A submission sent with an idempotency key is graded in memory and stored as
+one ExamSubmission row under (user, key); a retry with the same key gets that
+row back instead of adding an attempt. The attempts themselves, and what their
+post_save signals would do (the passed-lesson index, reward counters, reward
+progress), the recent activity entry and the reward checks, are written by a
+background job for every waiting submission at once, in bulk.
+"""
+import uuid
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from accounts.models import RecentActivity
+from jobs.queue import enqueue
+from .grading import score_answers
+from .models import AILessonQuizAttempt, Choice, ExamSubmission, Question, QuizAnswer, UserQuizAttempt
+from .services import (
+    AI_QUIZ_REATTEMPT_DELAY, invalidate_reward_progress, queue_reward_evaluations, record_ai_quiz_passes,
+    record_lesson_passes, set_ai_quiz_cooldown
+)
+
+FLUSH_EXAM_SUBMISSIONS_JOB = 'content.flush_exam_submissions'
+
+# How long a burst of submissions gathers before its attempts are written.
+FLUSH_DELAY = timedelta(seconds=2)
+FLUSH_BATCH_SIZE = 500
+
+# A claim this old is taken to be from a worker that died, and the submissions are written again.
+STALE_CLAIM_AGE = timedelta(minutes=10)
+
+# Recorded submissions are kept this long to answer late retries.
+IDEMPOTENCY_WINDOW = timedelta(days=1)
+
+IDEMPOTENCY_KEY_LENGTH = ExamSubmission._meta.get_field('idempotency_key').max_length
+
+
+def submit_quiz_exam(user, quiz, idempotency_key, answers):
+    """
+    Grades a quiz submission and stores it for the next flush. Returns
+    (submission, created); when the key was used before, the submission stored
+    then, which may be for another quiz.
+    """
+    graded, score, passed = score_answers(quiz, answers)
+    return _submit(
+        user, idempotency_key, quiz=quiz, score=score, passed=passed, answers=answers,
+        graded_answers=[[question_id, choice_id, correct] for question_id, (choice_id, correct) in graded.items()],
+    )
+
+
+def submit_ai_quiz_exam(user, lesson, idempotency_key, score, passed, quiz_data):
+    """
+    Stores an AI quiz submission for the next flush, like submit_quiz_exam. Its
+    cooldown starts now rather than when the attempt is written.
+    """
+    submission, created = _submit(user, idempotency_key, lesson=lesson, score=score, passed=passed, answers=quiz_data)
+    if created:
+        set_ai_quiz_cooldown(
+            user.id, lesson.id, None if passed else submission.submitted_at + AI_QUIZ_REATTEMPT_DELAY
+        )
+    return submission, created
+
+
+def _submit(user, idempotency_key, **fields):
+    try:
+        with transaction.atomic():
+            submission = ExamSubmission.objects.create(user=user, idempotency_key=idempotency_key, **fields)
+    except IntegrityError:
+        return ExamSubmission.objects.get(user=user, idempotency_key=idempotency_key), False
+    enqueue(
+        FLUSH_EXAM_SUBMISSIONS_JOB, dedupe_key=FLUSH_EXAM_SUBMISSIONS_JOB,
+        run_after=timezone.now() + FLUSH_DELAY,
+    )
+    return submission, True
+
+
+def get_exam_submission(user, idempotency_key):
+    return ExamSubmission.objects.filter(user=user, idempotency_key=idempotency_key).first()
+
+
+def flush_exam_submissions(batch_size=FLUSH_BATCH_SIZE):
+    """
+    Writes the attempts of the waiting submissions, `batch_size` at a time, and
+    forgets submissions recorded longer ago than the idempotency window.
+    Returns the number of attempts written.
+    """
+    recorded = 0
+    while True:
+        submissions = _claim_submissions(batch_size)
+        if not submissions:
+            break
+        _record_submissions(submissions)
+        recorded += len(submissions)
+    ExamSubmission.objects.filter(recorded_at__lt=timezone.now() - IDEMPOTENCY_WINDOW).delete()
+    return recorded
+
+
+def _claim_submissions(limit):
+    """Marks up to `limit` waiting submissions as this worker's and returns them."""
+    now = timezone.now()
+    waiting = ExamSubmission.objects.filter(recorded_at__isnull=True).filter(
+        Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - STALE_CLAIM_AGE)
+    )
+    ids = list(waiting.values_list('id', flat=True)[:limit])
+    if not ids:
+        return []
+    claim = uuid.uuid4()
+    # Rows another worker claimed in the meantime no longer match `waiting`.
+    waiting.filter(id__in=ids).update(claim=claim, claimed_at=now)
+    return list(ExamSubmission.objects.filter(claim=claim).select_related('user', 'quiz', 'lesson'))
+
+
+def _record_submissions(submissions):
+    quiz_submissions = [submission for submission in submissions if submission.quiz_id]
+    ai_submissions = [submission for submission in submissions if submission.lesson_id]
+
+    with transaction.atomic():
+        quiz_attempts = UserQuizAttempt.objects.bulk_create([
+            UserQuizAttempt(
+                user=submission.user, quiz=submission.quiz, score=submission.score,
+                passed=submission.passed, answers=submission.answers,
+            )
+            for submission in quiz_submissions
+        ])
+        ai_attempts = AILessonQuizAttempt.objects.bulk_create([
+            AILessonQuizAttempt(
+                user=submission.user, lesson=submission.lesson, score=submission.score,
+                passed=submission.passed, quiz_data=submission.answers,
+                can_reattempt_at=None if submission.passed else submission.submitted_at + AI_QUIZ_REATTEMPT_DELAY,
+            )
+            for submission in ai_submissions
+        ])
+
+        # auto_now_add stamped the time of this flush; attempts date from their submission.
+        for submission, attempt in zip(quiz_submissions, quiz_attempts):
+            attempt.completed_at = submission.submitted_at
+            submission.quiz_attempt = attempt
+        for submission, attempt in zip(ai_submissions, ai_attempts):
+            attempt.attempted_at = submission.submitted_at
+            submission.ai_quiz_attempt = attempt
+        UserQuizAttempt.objects.bulk_update(quiz_attempts, ['completed_at'])
+        AILessonQuizAttempt.objects.bulk_update(ai_attempts, ['attempted_at'])
+        _record_graded_answers(quiz_submissions)
+
+        # What the attempts' post_save signals and AILessonQuizAttemptViewSet.perform_create do for one attempt.
+        record_lesson_passes(
+            [(submission.user_id, submission.quiz.lesson_id) for submission in quiz_submissions if submission.passed]
+            + [(submission.user_id, submission.lesson_id) for submission in ai_submissions if submission.passed]
+        )
+        record_ai_quiz_passes([attempt for attempt in ai_attempts if attempt.passed])
+        RecentActivity.objects.bulk_create([
+            RecentActivity(
+                user=submission.user, activity_type='Quiz',
+                details=f"Attempted quiz for '{submission.lesson.title}': Scored {submission.score:.0f}% - {'Passed' if submission.passed else 'Failed'}.",
+            )
+            for submission in ai_submissions
+        ])
+
+        recorded_at = timezone.now()
+        for submission in submissions:
+            submission.recorded_at = recorded_at
+        ExamSubmission.objects.bulk_update(submissions, ['quiz_attempt', 'ai_quiz_attempt', 'recorded_at'])
+
+    for user_id in {submission.user_id for submission in submissions}:
+        invalidate_reward_progress(user_id)
+    queue_reward_evaluations(
+        {submission.user_id: submission.user for submission in ai_submissions if submission.passed}.values(),
+        'QUIZ_PASSED',
+    )
+
+
+def _record_graded_answers(quiz_submissions):
+    """QuizAnswer rows for the submissions' graded answers, minus questions deleted since they were graded."""
+    question_ids = {question_id for submission in quiz_submissions for question_id, _, _ in submission.graded_answers}
+    if not question_ids:
+        return
+    remaining_questions = set(Question.objects.filter(id__in=question_ids).values_list('id', flat=True))
+    remaining_choices = set(Choice.objects.filter(question_id__in=remaining_questions).values_list('id', flat=True))
+    QuizAnswer.objects.bulk_create([
+        QuizAnswer(
+            attempt=submission.quiz_attempt, question_id=question_id,
+            choice_id=choice_id if choice_id in remaining_choices else None, correct=correct,
+        )
+        for submission in quiz_submissions
+        for question_id, choice_id, correct in submission.graded_answers
+        if question_id in remaining_questions
+    ])
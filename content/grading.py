@@ -0,0 +1,90 @@
+"""
+Quiz answer keys, cached per quiz so a submission is graded in memory instead
+of with a query per answer. Each quiz's key is versioned: changing one of its
+questions or choices moves the quiz to a new version, and old keys are never
+read again. Graded answers are also kept as QuizAnswer rows for item statistics.
+"""
+from django.core.cache import cache
+from .models import Question, QuizAnswer
+
+ANSWER_KEY_VERSION_KEY = 'quiz:{quiz_id}:answer_key_version'
+ANSWER_KEY_KEY = 'quiz:{quiz_id}:answer_key:{version}'
+
+# Keys only change when a teacher edits the quiz, so they can live as long as the curriculum trees.
+ANSWER_KEY_TIMEOUT = 60 * 60 * 24
+
+
+def get_answer_key_version(quiz_id):
+    return cache.get_or_set(ANSWER_KEY_VERSION_KEY.format(quiz_id=quiz_id), 1, None)
+
+
+def bump_answer_key_version(quiz_id):
+    """Retires the cached answer key of a quiz, e.g. after one of its questions or choices changes."""
+    key = ANSWER_KEY_VERSION_KEY.format(quiz_id=quiz_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, None)
+
+
+def get_answer_key(quiz_id):
+    """
+    Returns {question_id: {choice_id: is_correct}} for every question of the
+    quiz, from one query when it isn't cached yet.
+    """
+    key = ANSWER_KEY_KEY.format(quiz_id=quiz_id, version=get_answer_key_version(quiz_id))
+    answer_key = cache.get(key)
+    if answer_key is None:
+        answer_key = {}
+        # Questions without choices come back once with a null choice, and still count towards the total.
+        for question_id, choice_id, is_correct in Question.objects.filter(quiz_id=quiz_id).order_by().values_list(
+            'id', 'choices__id', 'choices__is_correct'
+        ):
+            choices = answer_key.setdefault(question_id, {})
+            if choice_id is not None:
+                choices[choice_id] = is_correct
+        cache.set(key, answer_key, ANSWER_KEY_TIMEOUT)
+    return answer_key
+
+
+def grade_answers(answer_key, answers):
+    """
+    Returns {question_id: (choice_id, correct)} for the answers ({'question_id': ...,
+    'choice_id': ...} items) that pick one of the choices of a question in
+    `answer_key`. Only the first answer to a question counts; answers naming
+    another quiz's question or choice, or missing either id, are left out.
+    """
+    graded = {}
+    for answer in answers:
+        if not isinstance(answer, dict):
+            continue
+        try:
+            question_id, choice_id = int(answer['question_id']), int(answer['choice_id'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        choices = answer_key.get(question_id, {})
+        if choice_id in choices and question_id not in graded:
+            graded[question_id] = (choice_id, choices[choice_id])
+    return graded
+
+
+def score_answers(quiz, answers):
+    """
+    Grades `answers` against the quiz's answer key. Returns (graded, score, passed),
+    with `graded` as grade_answers returns it and `score` a percentage. A quiz
+    without questions scores 0 and is not passed.
+    """
+    answer_key = get_answer_key(quiz.id)
+    graded = grade_answers(answer_key, answers)
+    if not answer_key:
+        return graded, 0, False
+    score = sum(correct for _, correct in graded.values()) / len(answer_key) * 100
+    return graded, score, score >= quiz.pass_mark_percentage
+
+
+def record_quiz_answers(attempt, graded):
+    """Writes the graded answers of an attempt to its QuizAnswer rows."""
+    QuizAnswer.objects.bulk_create([
+        QuizAnswer(attempt=attempt, question_id=question_id, choice_id=choice_id, correct=correct)
+        for question_id, (choice_id, correct) in graded.items()
+    ])
@@ -0,0 +1,97 @@
+"""
+Item analysis of a quiz's questions from the QuizAnswer rows of its attempts,
+computed in one pass over the answers. Each attempt counts as one examinee.
+
+    difficulty       share of the attempts answering the question that got it right
+    discrimination   difficulty among the top 27% of attempts by total score,
+                     minus difficulty among the bottom 27%
+    choices          how often each choice was picked, which shows the distractors
+                     that draw answers (and the ones nobody falls for)
+"""
+from collections import Counter, defaultdict
+from .models import Choice, Question, QuizAnswer
+
+# Share of attempts in each of the upper and lower groups used for discrimination.
+DISCRIMINATION_GROUP_SHARE = 0.27
+
+
+def quiz_item_statistics(quiz_id, school_class_id=None):
+    """
+    Returns {'attempts', 'questions': [...]} for the quiz, over all of its
+    attempts or those of the students enrolled in `school_class_id`. Figures
+    without any answers to base them on are None.
+    """
+    answers = QuizAnswer.objects.filter(question__quiz_id=quiz_id)
+    if school_class_id:
+        answers = answers.filter(attempt__user__student_profile__enrolled_class_id=school_class_id)
+
+    # {attempt_id: {question_id: correct}}, and how often each choice was picked.
+    # Answers whose choice was removed since have a null choice and match none.
+    results = defaultdict(dict)
+    picks = Counter()
+    for attempt_id, question_id, choice_id, correct in answers.order_by().values_list(
+        'attempt_id', 'question_id', 'choice_id', 'correct'
+    ).iterator():
+        results[attempt_id][question_id] = correct
+        picks[choice_id] += 1
+
+    questions = list(Question.objects.filter(quiz_id=quiz_id).values_list('id', 'text'))
+    choices_by_question = defaultdict(list)
+    for choice_id, question_id, text, is_correct in Choice.objects.filter(
+        question__quiz_id=quiz_id
+    ).order_by('question_id', 'id').values_list('id', 'question_id', 'text', 'is_correct'):
+        choices_by_question[question_id].append((choice_id, text, is_correct))
+
+    # Attempts ranked by total score, ties in attempt order.
+    ranked = sorted(sorted(results), key=lambda attempt_id: sum(results[attempt_id].values()))
+    group_size = int(round(len(ranked) * DISCRIMINATION_GROUP_SHARE))
+    everyone = _tally(results, ranked)
+    lower = _tally(results, ranked[:group_size])
+    upper = _tally(results, ranked[len(ranked) - group_size:] if group_size else [])
+
+    return {
+        'attempts': len(ranked),
+        'questions': [
+            {
+                'question_id': question_id,
+                'text': text,
+                'responses': everyone[question_id][0],
+                'difficulty': _number(_ratio(*everyone[question_id])),
+                'discrimination': _number(_difference(_ratio(*upper[question_id]), _ratio(*lower[question_id]))),
+                'choices': [
+                    {
+                        'choice_id': choice_id,
+                        'text': choice_text,
+                        'is_correct': is_correct,
+                        'picks': picks[choice_id],
+                        'frequency': _number(_ratio(everyone[question_id][0], picks[choice_id])),
+                    }
+                    for choice_id, choice_text, is_correct in choices_by_question[question_id]
+                ],
+            }
+            for question_id, text in questions
+        ],
+    }
+
+
+def _tally(results, attempt_ids):
+    """Returns {question_id: [answered, correct]} over `attempt_ids`."""
+    tally = defaultdict(lambda: [0, 0])
+    for attempt_id in attempt_ids:
+        for question_id, correct in results[attempt_id].items():
+            tally[question_id][0] += 1
+            tally[question_id][1] += int(correct)
+    return tally
+
+
+def _ratio(total, count):
+    """Returns `count` as a share of `total`, or None when there is nothing to share."""
+    return count / total if total else None
+
+
+def _difference(upper, lower):
+    return None if upper is None or lower is None else upper - lower
+
+
+def _number(value):
+    return None if value is None else round(value, 4)
@@ -0,0 +1,22 @@
+from accounts.models import CustomUser
+from jobs.queue import register
+from .exams import FLUSH_EXAM_SUBMISSIONS_JOB, flush_exam_submissions
+from .sections import REBUILD_SECTIONS_JOB, rebuild_lesson_sections
+from .services import EVALUATE_REWARDS_JOB, check_and_award_rewards
+
+
+@register(EVALUATE_REWARDS_JOB)
+def evaluate_rewards(payload):
+    user = CustomUser.objects.filter(pk=payload['user_id']).first()
+    if user is not None:
+        check_and_award_rewards(user, payload['trigger_event'])
+
+
+@register(REBUILD_SECTIONS_JOB)
+def rebuild_sections(payload):
+    rebuild_lesson_sections(payload['lesson_id'], payload['language_code'])
+
+
+@register(FLUSH_EXAM_SUBMISSIONS_JOB)
+def flush_exams(payload):
+    flush_exam_submissions()
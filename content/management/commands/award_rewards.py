@@ -0,0 +1,70 @@
+from multiprocessing import Pool
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from accounts.models import School
+from content.models import Reward
+from content.services import SWEEP_METRICS, sweep_rewards
+
+
+def _sweep_school_group(args):
+    reward_ids, school_ids, include_unassigned, chunk_size = args
+    # Each worker process opens its own database connections.
+    connections.close_all()
+    return sweep_rewards(reward_ids, school_ids=school_ids, include_unassigned=include_unassigned, chunk_size=chunk_size)
+
+
+class Command(BaseCommand):
+    help = "Awards attendance- and quiz-based rewards to all eligible students with set-based queries."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--criteria', nargs='+', choices=[choice for choice, _ in Reward.CRITERIA_TYPE_CHOICES],
+                            help="Only sweep the rewards of these criteria types.")
+        parser.add_argument('--reward', type=int, nargs='+', dest='reward_ids',
+                            help="Only sweep these reward ids.")
+        parser.add_argument('--school', type=int, nargs='+', dest='school_ids',
+                            help="Only sweep students of these school ids.")
+        parser.add_argument('--processes', type=int, default=1,
+                            help="Split schools across this many worker processes.")
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help="Rows inserted per bulk_create batch.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        processes = options['processes']
+        if processes < 1:
+            raise CommandError("--processes must be at least 1.")
+
+        rewards = Reward.objects.filter(is_active=True, metric__in=SWEEP_METRICS)
+        if options['criteria']:
+            rewards = rewards.filter(criteria_type__in=options['criteria'])
+        if options['reward_ids']:
+            rewards = rewards.filter(id__in=options['reward_ids'])
+        rewards = rewards.in_bulk()
+        if not rewards:
+            raise CommandError("No active rewards with a sweepable metric match the given options.")
+        reward_ids = list(rewards)
+
+        if processes == 1:
+            totals = sweep_rewards(
+                reward_ids,
+                school_ids=options['school_ids'],
+                include_unassigned=not options['school_ids'],
+                chunk_size=chunk_size,
+            )
+        else:
+            school_ids = options['school_ids'] or list(School.objects.values_list('id', flat=True))
+            groups = [school_ids[i::processes] for i in range(processes)]
+            # Students without a school are swept once, by the first group.
+            jobs = [
+                (reward_ids, group, index == 0 and not options['school_ids'], chunk_size)
+                for index, group in enumerate(groups)
+                if group or index == 0
+            ]
+            connections.close_all()
+            with Pool(processes=len(jobs)) as pool:
+                results = pool.map(_sweep_school_group, jobs)
+            totals = {reward_id: sum(result.get(reward_id, 0) for result in results) for reward_id in reward_ids}
+
+        for reward_id, awarded in totals.items():
+            self.stdout.write(f"{rewards[reward_id]}: {awarded} awarded")
+        self.stdout.write(self.style.SUCCESS(f"Awarded {sum(totals.values())} rewards."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from content.models import Lesson, TranslatedLessonContent
+from content.sections import rebuild_lesson_sections
+
+
+class Command(BaseCommand):
+    help = "Builds the precompressed content sections of lessons and their translations."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lesson', type=int, nargs='+', dest='lesson_ids',
+                            help="Only build the sections of these lesson ids.")
+
+    def handle(self, *args, **options):
+        lessons = Lesson.objects.all()
+        translations = TranslatedLessonContent.objects.all()
+        if options['lesson_ids']:
+            lessons = lessons.filter(id__in=options['lesson_ids'])
+            translations = translations.filter(lesson_id__in=options['lesson_ids'])
+
+        targets = [(lesson_id, '') for lesson_id in lessons.values_list('id', flat=True)]
+        targets += list(translations.values_list('lesson_id', 'language_code'))
+        for lesson_id, language_code in targets:
+            rebuild_lesson_sections(lesson_id, language_code)
+        self.stdout.write(self.style.SUCCESS(f"Built sections for {len(targets)} lesson texts."))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from content.question_bank import DEFAULT_CHUNK_SIZE, QUESTION_BANK_FORMATS, import_question_bank, question_bank_format
+
+
+class Command(BaseCommand):
+    help = "Imports quiz questions and choices from a CSV or JSON Lines question bank (see content/question_bank.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="The question bank file.")
+        parser.add_argument('--format', choices=sorted(set(QUESTION_BANK_FORMATS.values())), dest='file_format',
+                            help="The file's format; taken from its extension by default.")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help="Rows validated and written per transaction.")
+
+    def handle(self, *args, **options):
+        file_format = options['file_format'] or question_bank_format(options['path'])
+        if not file_format:
+            raise CommandError("Can't tell the file's format from its extension; pass --format.")
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+
+        try:
+            bank = open(options['path'], encoding='utf-8-sig', newline='')
+        except OSError as exc:
+            raise CommandError(str(exc))
+        with bank:
+            for report in import_question_bank(bank, file_format, options['chunk_size']):
+                self.stdout.write(
+                    f"{report['rows']} rows read, {report['imported']} questions imported, "
+                    f"{report['error_count']} rejected"
+                )
+
+        for error in report['errors']:
+            self.stderr.write(f"Line {error['line']}: {error['error']}")
+        if report['error_count'] > len(report['errors']):
+            self.stderr.write(f"... and {report['error_count'] - len(report['errors'])} more rejected rows.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['imported']} questions ({report['quizzes_created']} new quizzes) "
+            f"from {report['rows']} rows."
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from content.curriculum import bump_curriculum_version
+from content.models import Lesson, Subject, UserLessonUnlock
+from content.services import rebuild_lesson_unlocks, relink_subject_lessons
+
+
+class Command(BaseCommand):
+    help = "Recomputes lesson gates and rewrites every user's lesson unlocks from the passed-lesson index."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subject', type=int, nargs='+', dest='subject_ids',
+                            help="Only rebuild the lessons of these subject ids.")
+
+    def handle(self, *args, **options):
+        subject_ids = options['subject_ids'] or list(Subject.objects.values_list('id', flat=True))
+        relinked = 0
+        for subject_id in subject_ids:
+            relinked += relink_subject_lessons(subject_id)
+            lesson_ids = list(Lesson.objects.filter(subject_id=subject_id).values_list('id', flat=True))
+            rebuild_lesson_unlocks(lesson_ids)
+        if relinked:
+            bump_curriculum_version()
+        unlocked = UserLessonUnlock.objects.filter(lesson__subject_id__in=subject_ids).count()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt unlocks for {len(subject_ids)} subjects ({relinked} lessons relinked, {unlocked} unlocks)."
+        ))
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.9 on 2026-10-17 09:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0005_lesson_created_by'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserRewardCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ai_quizzes_passed', models.PositiveIntegerField(default=0)),
+                ('ai_quiz_passed_score_total', models.FloatField(default=0.0, help_text='Sum of the scores of all passed AI quiz attempts.')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reward_counter', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.9 on 2026-10-17 11:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_passed_lessons(apps, schema_editor):
+    AILessonQuizAttempt = apps.get_model('content', 'AILessonQuizAttempt')
+    UserQuizAttempt = apps.get_model('content', 'UserQuizAttempt')
+    UserPassedLesson = apps.get_model('content', 'UserPassedLesson')
+
+    passed = set(AILessonQuizAttempt.objects.filter(passed=True).values_list('user_id', 'lesson_id').distinct())
+    passed.update(UserQuizAttempt.objects.filter(passed=True).values_list('user_id', 'quiz__lesson_id').distinct())
+    UserPassedLesson.objects.bulk_create(
+        [UserPassedLesson(user_id=user_id, lesson_id=lesson_id) for user_id, lesson_id in passed],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0006_userrewardcounter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserPassedLesson',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('passed_at', models.DateTimeField(auto_now_add=True)),
+                ('lesson', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='passed_by', to='content.lesson')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='passed_lessons', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['user', 'lesson'],
+                'unique_together': {('user', 'lesson')},
+            },
+        ),
+        migrations.RunPython(backfill_passed_lessons, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.9 on 2026-10-17 12:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_subject_completions(apps, schema_editor):
+    Lesson = apps.get_model('content', 'Lesson')
+    UserLessonProgress = apps.get_model('content', 'UserLessonProgress')
+    UserSubjectCompletion = apps.get_model('content', 'UserSubjectCompletion')
+
+    totals = dict(Lesson.objects.values('subject_id').annotate(total=models.Count('id')).values_list('subject_id', 'total'))
+    completed_counts = UserLessonProgress.objects.filter(completed=True).values('user_id', 'lesson__subject_id').annotate(
+        completed=models.Count('id')
+    )
+    UserSubjectCompletion.objects.bulk_create([
+        UserSubjectCompletion(
+            user_id=row['user_id'],
+            subject_id=row['lesson__subject_id'],
+            completed_lessons=row['completed'],
+            total_lessons=totals.get(row['lesson__subject_id'], 0),
+        )
+        for row in completed_counts
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0007_userpassedlesson'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSubjectCompletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_lessons', models.PositiveIntegerField(default=0)),
+                ('total_lessons', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_completions', to='content.subject')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subject_completions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['user', 'subject'],
+                'unique_together': {('user', 'subject')},
+            },
+        ),
+        migrations.RunPython(backfill_subject_completions, migrations.RunPython.noop),
+    ]
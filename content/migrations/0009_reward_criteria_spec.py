@@ -0,0 +1,63 @@
+# Generated by Django 5.1.9 on 2026-10-17 15:05
+
+from django.db import migrations, models
+
+# Reward.CRITERIA_TYPE_SPECS as of this migration.
+CRITERIA_TYPE_SPECS = {
+    'WEEK_WARRIOR': ('STUDY_STREAK_DAYS', 7, {'min_minutes': 240}),
+    'CONSISTENCY_CHAMPION': ('STUDY_STREAK_DAYS', 14, {'min_minutes': 240}),
+    'MASTER_OF_CONSISTENCY': ('STUDY_STREAK_DAYS', 90, {'min_minutes': 240}),
+    'PERFECT_ATTENDANCE_STAR': ('ATTENDANCE_PERCENTAGE', 95, {}),
+    'QUIZ_MASTER': ('AI_QUIZ_AVERAGE', 95, {'min_passed': 40}),
+    'COMPLETION_CROWN': ('QUIZZES_PASSED_PERCENTAGE', 100, {}),
+    'PIONEER_GRADUATE': ('SUBJECTS_COMPLETED', 1, {}),
+}
+
+
+def fill_criteria_specs(apps, schema_editor):
+    Reward = apps.get_model('content', 'Reward')
+    for reward in Reward.objects.filter(metric=''):
+        if reward.criteria_type in CRITERIA_TYPE_SPECS:
+            reward.metric, reward.threshold, reward.criteria_filter = CRITERIA_TYPE_SPECS[reward.criteria_type]
+            reward.save(update_fields=['metric', 'threshold', 'criteria_filter'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0008_usersubjectcompletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reward',
+            name='criteria_filter',
+            field=models.JSONField(blank=True, default=dict, help_text='Extra conditions, e.g. {"subject": 3}, {"min_passed": 40} or {"min_minutes": 240}.'),
+        ),
+        migrations.AddField(
+            model_name='reward',
+            name='is_active',
+            field=models.BooleanField(default=True, help_text='Inactive rewards are no longer awarded or shown with progress.'),
+        ),
+        migrations.AddField(
+            model_name='reward',
+            name='metric',
+            field=models.CharField(blank=True, choices=[('STUDY_STREAK_DAYS', 'Study streak (days)'), ('ATTENDANCE_PERCENTAGE', 'Year-to-date attendance (%)'), ('AI_QUIZZES_PASSED', 'AI quizzes passed'), ('AI_QUIZ_AVERAGE', 'Average score of passed AI quizzes (%)'), ('QUIZZES_PASSED', 'Lesson quizzes passed'), ('QUIZZES_PASSED_PERCENTAGE', 'Lesson quizzes passed (% of all)'), ('SUBJECTS_COMPLETED', 'Subjects completed')], help_text='Filled in from the criteria type when left empty.', max_length=40),
+        ),
+        migrations.AddField(
+            model_name='reward',
+            name='threshold',
+            field=models.FloatField(default=1, help_text='Value the metric must reach for the reward to be earned.'),
+        ),
+        migrations.AddField(
+            model_name='reward',
+            name='window_days',
+            field=models.PositiveIntegerField(blank=True, help_text='Only count activity from the last N days. Leave empty to count all of it.', null=True),
+        ),
+        migrations.AlterField(
+            model_name='reward',
+            name='criteria_type',
+            field=models.CharField(blank=True, choices=[('WEEK_WARRIOR', 'Week Warrior'), ('CONSISTENCY_CHAMPION', 'Consistency Champion'), ('MASTER_OF_CONSISTENCY', 'Master of Consistency'), ('PERFECT_ATTENDANCE_STAR', 'Perfect Attendance Star'), ('QUIZ_MASTER', 'Quiz Master'), ('COMPLETION_CROWN', 'Completion Crown'), ('PIONEER_GRADUATE', 'Pioneer Graduate')], help_text='Built-in criteria this reward stands for. Leave empty for a reward defined only by its spec below.', max_length=50, null=True, unique=True),
+        ),
+        migrations.RunPython(fill_criteria_specs, migrations.RunPython.noop),
+    ]
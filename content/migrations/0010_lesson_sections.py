@@ -0,0 +1,40 @@
+# Generated by Django 5.1.9 on 2026-10-17 16:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0009_reward_criteria_spec'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SectionBody',
+            fields=[
+                ('hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('text', models.TextField()),
+                ('size', models.PositiveIntegerField(help_text='Length of the text in UTF-8 bytes.')),
+                ('gzip_body', models.BinaryField()),
+                ('brotli_body', models.BinaryField(blank=True, help_text='Only stored when the brotli package is installed.', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LessonSection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('language_code', models.CharField(blank=True, help_text="Empty for the lesson's own content.", max_length=10)),
+                ('position', models.PositiveIntegerField()),
+                ('name', models.CharField(blank=True, help_text='The top-level key, when the content is a JSON object.', max_length=100)),
+                ('lesson', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sections', to='content.lesson')),
+                ('body', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='sections', to='content.sectionbody')),
+            ],
+            options={
+                'ordering': ['lesson', 'language_code', 'position'],
+                'unique_together': {('lesson', 'language_code', 'position')},
+            },
+        ),
+    ]
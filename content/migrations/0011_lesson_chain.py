@@ -0,0 +1,36 @@
+# Generated by Django 5.1.9 on 2026-10-17 16:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def link_lessons(apps, schema_editor):
+    Lesson = apps.get_model('content', 'Lesson')
+    lessons = list(Lesson.objects.order_by('subject_id', 'lesson_order', 'id').only('id', 'subject_id'))
+    for index, lesson in enumerate(lessons):
+        previous = lessons[index - 1] if index > 0 else None
+        following = lessons[index + 1] if index + 1 < len(lessons) else None
+        lesson.previous_lesson_id = previous.id if previous and previous.subject_id == lesson.subject_id else None
+        lesson.next_lesson_id = following.id if following and following.subject_id == lesson.subject_id else None
+    Lesson.objects.bulk_update(lessons, ['previous_lesson', 'next_lesson'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0010_lesson_sections'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='next_lesson',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='content.lesson'),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='previous_lesson',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='content.lesson'),
+        ),
+        migrations.RunPython(link_lessons, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.1.9 on 2026-10-17 17:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def gate_lessons(apps, schema_editor):
+    Lesson = apps.get_model('content', 'Lesson')
+    UserLessonUnlock = apps.get_model('content', 'UserLessonUnlock')
+    UserPassedLesson = apps.get_model('content', 'UserPassedLesson')
+
+    lessons = list(Lesson.objects.order_by('subject_id', 'lesson_order', 'id').only(
+        'id', 'subject_id', 'lesson_order', 'requires_previous_quiz'
+    ))
+    previous = last_seen = None
+    for index, lesson in enumerate(lessons):
+        if index == 0 or lessons[index - 1].subject_id != lesson.subject_id:
+            previous = last_seen = None
+        elif lesson.lesson_order != lessons[index - 1].lesson_order:
+            previous = last_seen
+        last_seen = lesson
+        gated = lesson.lesson_order != 0 and previous is not None and previous.requires_previous_quiz
+        lesson.gate_lesson_id = previous.id if gated else None
+    Lesson.objects.bulk_update(lessons, ['gate_lesson'], batch_size=500)
+
+    UserLessonUnlock.objects.bulk_create([
+        UserLessonUnlock(user_id=user_id, lesson_id=lesson_id)
+        for user_id, lesson_id in UserPassedLesson.objects.filter(
+            lesson__gated_lessons__isnull=False
+        ).values_list('user_id', 'lesson__gated_lessons')
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0011_lesson_chain'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='gate_lesson',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='gated_lessons', to='content.lesson'),
+        ),
+        migrations.CreateModel(
+            name='UserLessonUnlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unlocked_at', models.DateTimeField(auto_now_add=True)),
+                ('lesson', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unlocks', to='content.lesson')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lesson_unlocks', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['user', 'lesson'],
+                'unique_together': {('user', 'lesson')},
+            },
+        ),
+        migrations.RunPython(gate_lessons, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.1.9 on 2026-10-17 18:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_attempt_answers(apps, schema_editor):
+    Choice = apps.get_model('content', 'Choice')
+    QuizAnswer = apps.get_model('content', 'QuizAnswer')
+    UserQuizAttempt = apps.get_model('content', 'UserQuizAttempt')
+
+    # {quiz_id: {question_id: {choice_id: is_correct}}}, as content.grading builds it.
+    answer_keys = {}
+    for quiz_id, question_id, choice_id, is_correct in Choice.objects.values_list(
+        'question__quiz_id', 'question_id', 'id', 'is_correct'
+    ):
+        answer_keys.setdefault(quiz_id, {}).setdefault(question_id, {})[choice_id] = is_correct
+
+    rows = []
+    for attempt_id, quiz_id, answers in UserQuizAttempt.objects.values_list('id', 'quiz_id', 'answers').iterator():
+        answer_key = answer_keys.get(quiz_id, {})
+        graded = {}
+        for answer in answers if isinstance(answers, list) else []:
+            if not isinstance(answer, dict):
+                continue
+            try:
+                question_id, choice_id = int(answer['question_id']), int(answer['choice_id'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            choices = answer_key.get(question_id, {})
+            if choice_id in choices and question_id not in graded:
+                graded[question_id] = (choice_id, choices[choice_id])
+        rows.extend(
+            QuizAnswer(attempt_id=attempt_id, question_id=question_id, choice_id=choice_id, correct=correct)
+            for question_id, (choice_id, correct) in graded.items()
+        )
+        if len(rows) >= 1000:
+            QuizAnswer.objects.bulk_create(rows)
+            rows = []
+    QuizAnswer.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0012_lesson_unlocks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('correct', models.BooleanField()),
+                ('attempt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='graded_answers', to='content.userquizattempt')),
+                ('choice', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='answers', to='content.choice')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answers', to='content.question')),
+            ],
+            options={
+                'unique_together': {('attempt', 'question')},
+            },
+        ),
+        migrations.RunPython(copy_attempt_answers, migrations.RunPython.noop),
+    ]
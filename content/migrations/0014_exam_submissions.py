@@ -0,0 +1,41 @@
+# Generated by Django 5.1.9 on 2026-10-17 19:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0013_quiz_answers'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExamSubmission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(max_length=64)),
+                ('score', models.FloatField(default=0.0, help_text='Score as a percentage (0-100).')),
+                ('passed', models.BooleanField(default=False)),
+                ('answers', models.JSONField(help_text='The submitted answers, or the AI quiz data.')),
+                ('graded_answers', models.JSONField(blank=True, default=list, help_text='[question_id, choice_id, correct] rows of a quiz submission.')),
+                ('submitted_at', models.DateTimeField(auto_now_add=True)),
+                ('claim', models.UUIDField(blank=True, help_text="Set by the worker writing this submission's attempt.", null=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('recorded_at', models.DateTimeField(blank=True, null=True)),
+                ('ai_quiz_attempt', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='exam_submission', to='content.ailessonquizattempt')),
+                ('lesson', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='exam_submissions', to='content.lesson')),
+                ('quiz', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='exam_submissions', to='content.quiz')),
+                ('quiz_attempt', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='exam_submission', to='content.userquizattempt')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exam_submissions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['recorded_at', 'claimed_at'], name='content_exa_recorde_2e1b99_idx')],
+                'unique_together': {('user', 'idempotency_key')},
+            },
+        ),
+    ]
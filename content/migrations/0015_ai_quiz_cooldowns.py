@@ -0,0 +1,57 @@
+# Generated by Django 5.1.9 on 2026-10-17 20:10
+
+import django.db.models.deletion
+from datetime import timedelta
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def record_current_cooldowns(apps, schema_editor):
+    AILessonQuizAttempt = apps.get_model('content', 'AILessonQuizAttempt')
+    AIQuizCooldown = apps.get_model('content', 'AIQuizCooldown')
+    ExamSubmission = apps.get_model('content', 'ExamSubmission')
+    now = timezone.now()
+
+    # The latest attempt per (user, lesson) decides, as the reattempt check did.
+    available = {}
+    for user_id, lesson_id, can_reattempt_at in AILessonQuizAttempt.objects.order_by(
+        'user_id', 'lesson_id', '-attempted_at'
+    ).values_list('user_id', 'lesson_id', 'can_reattempt_at').iterator():
+        available.setdefault((user_id, lesson_id), can_reattempt_at)
+    # Failed exam submissions still waiting for their attempt start a cooldown too.
+    for user_id, lesson_id, submitted_at in ExamSubmission.objects.filter(
+        lesson__isnull=False, passed=False, recorded_at__isnull=True
+    ).values_list('user_id', 'lesson_id', 'submitted_at'):
+        available_at = submitted_at + timedelta(hours=2)
+        if not available.get((user_id, lesson_id)) or available[(user_id, lesson_id)] < available_at:
+            available[(user_id, lesson_id)] = available_at
+
+    AIQuizCooldown.objects.bulk_create([
+        AIQuizCooldown(user_id=user_id, lesson_id=lesson_id, available_at=available_at)
+        for (user_id, lesson_id), available_at in available.items() if available_at and available_at > now
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0014_exam_submissions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIQuizCooldown',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('available_at', models.DateTimeField()),
+                ('lesson', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ai_quiz_cooldowns', to='content.lesson')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ai_quiz_cooldowns', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'lesson')},
+            },
+        ),
+        migrations.RunPython(record_current_cooldowns, migrations.RunPython.noop),
+    ]
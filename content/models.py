@@ -2,6 +2,7 @@
 from django.db import models
 from django.db.models import JSONField # Corrected import
 from django.conf import settings
+from django.core.exceptions import ValidationError
 # Use string reference to avoid circular import
 # from accounts.models import Syllabus
 
@@ -43,6 +44,13 @@ class Lesson(models.Model):
     lesson_order = models.PositiveIntegerField(default=0)
     requires_previous_quiz = models.BooleanField(default=True, help_text="If true, student must pass the quiz of the previous lesson in order to access this one.")
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='created_lessons')
+    # The neighbouring lessons of the subject in (lesson_order, id) order, kept by
+    # services.relink_subject_lessons whenever a lesson is added, moved or removed.
+    previous_lesson = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='+')
+    next_lesson = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='+')
+    # The lesson whose quiz must be passed to open this one (see services.compute_lesson_gates),
+    # kept alongside the chain. UserLessonUnlock records who has passed it.
+    gate_lesson = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='gated_lessons')
 
 
     class Meta:
@@ -51,6 +59,19 @@ class Lesson(models.Model):
     def __str__(self):
         return f"{self.title} ({self.subject.name})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so subject completion totals, the lesson chain and the gates can follow a lesson that moves.
+        instance._loaded_subject_id = instance.subject_id if 'subject_id' in field_names else None
+        instance._loaded_lesson_order = instance.lesson_order if 'lesson_order' in field_names else None
+        instance._loaded_requires_previous_quiz = (
+            instance.requires_previous_quiz if 'requires_previous_quiz' in field_names else None
+        )
+        # Kept (by reference, not copied) so saves that don't change the content don't rebuild its sections.
+        instance._loaded_content = instance.content if 'content' in field_names else None
+        return instance
+
 class Quiz(models.Model):
     lesson = models.OneToOneField(Lesson, related_name='quiz', on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
@@ -99,6 +120,30 @@ class UserQuizAttempt(models.Model):
     def __str__(self):
         return f"{self.user.username}'s attempt on {self.quiz.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so the passed-lesson index can tell when `passed` flips.
+        instance._loaded_passed = instance.passed if 'passed' in field_names else None
+        return instance
+
+class QuizAnswer(models.Model):
+    """
+    One graded answer of a quiz attempt: the attempt's `answers` JSON as rows,
+    so per-question statistics are read from plain columns.
+    """
+    attempt = models.ForeignKey(UserQuizAttempt, on_delete=models.CASCADE, related_name='graded_answers')
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='answers')
+    # Kept when the choice is later removed from the question, so the answer still counts.
+    choice = models.ForeignKey(Choice, on_delete=models.SET_NULL, null=True, blank=True, related_name='answers')
+    correct = models.BooleanField()
+
+    class Meta:
+        unique_together = ('attempt', 'question')
+
+    def __str__(self):
+        return f"Answer to question {self.question_id} in attempt {self.attempt_id}"
+
 class UserLessonProgress(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='lesson_progress')
     lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='user_progress')
@@ -113,6 +158,70 @@ class UserLessonProgress(models.Model):
     def __str__(self):
         return f"{self.user.username}'s progress in {self.lesson.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so subject completion counts can tell when `completed` flips.
+        instance._loaded_completed = instance.completed if 'completed' in field_names else None
+        return instance
+
+class UserSubjectCompletion(models.Model):
+    """
+    Per-(user, subject) lesson completion counts, kept in sync as lesson progress
+    is completed and as lessons are added to or removed from the subject.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='subject_completions')
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='user_completions')
+    completed_lessons = models.PositiveIntegerField(default=0)
+    total_lessons = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'subject')
+        ordering = ['user', 'subject']
+
+    def __str__(self):
+        return f"{self.user.username} completed {self.completed_lessons}/{self.total_lessons} in {self.subject.name}"
+
+    @property
+    def percentage(self):
+        if not self.total_lessons:
+            return 0
+        return (self.completed_lessons / self.total_lessons) * 100
+
+class UserPassedLesson(models.Model):
+    """
+    Index of the lessons a user has passed a quiz for, either an AI quiz attempt
+    or the lesson's regular quiz. Written when a passing attempt is recorded.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='passed_lessons')
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='passed_by')
+    passed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'lesson')
+        ordering = ['user', 'lesson']
+
+    def __str__(self):
+        return f"{self.user.username} passed {self.lesson.title}"
+
+class UserLessonUnlock(models.Model):
+    """
+    The gated lessons a user has opened by passing their gate lesson's quiz.
+    Written with the passed-lesson index and rewritten for a lesson whenever
+    its gate changes, so a lesson is locked exactly when it has a gate and no row here.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='lesson_unlocks')
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='unlocks')
+    unlocked_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'lesson')
+        ordering = ['user', 'lesson']
+
+    def __str__(self):
+        return f"{self.user.username} unlocked {self.lesson.title}"
+
 class ProcessedNote(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='processed_notes')
     lesson = models.ForeignKey(Lesson, on_delete=models.SET_NULL, related_name='processed_notes', null=True, blank=True)
@@ -155,14 +264,51 @@ class Reward(models.Model):
         ('COMPLETION_CROWN', 'Completion Crown'),
         ('PIONEER_GRADUATE', 'Pioneer Graduate'),
     ]
+    METRIC_CHOICES = [
+        ('STUDY_STREAK_DAYS', 'Study streak (days)'),
+        ('ATTENDANCE_PERCENTAGE', 'Year-to-date attendance (%)'),
+        ('AI_QUIZZES_PASSED', 'AI quizzes passed'),
+        ('AI_QUIZ_AVERAGE', 'Average score of passed AI quizzes (%)'),
+        ('QUIZZES_PASSED', 'Lesson quizzes passed'),
+        ('QUIZZES_PASSED_PERCENTAGE', 'Lesson quizzes passed (% of all)'),
+        ('SUBJECTS_COMPLETED', 'Subjects completed'),
+    ]
+    # Keys each metric accepts in `criteria_filter`, and the metrics that can be limited with `window_days`.
+    METRIC_FILTERS = {
+        'STUDY_STREAK_DAYS': {'min_minutes'},
+        'ATTENDANCE_PERCENTAGE': set(),
+        'AI_QUIZZES_PASSED': {'subject'},
+        'AI_QUIZ_AVERAGE': {'subject', 'min_passed'},
+        'QUIZZES_PASSED': {'subject'},
+        'QUIZZES_PASSED_PERCENTAGE': {'subject'},
+        'SUBJECTS_COMPLETED': set(),
+    }
+    WINDOWED_METRICS = {'AI_QUIZZES_PASSED', 'AI_QUIZ_AVERAGE', 'QUIZZES_PASSED', 'QUIZZES_PASSED_PERCENTAGE'}
+    # The spec of each built-in criteria type, filled in when such a reward is saved without a metric.
+    CRITERIA_TYPE_SPECS = {
+        'WEEK_WARRIOR': {'metric': 'STUDY_STREAK_DAYS', 'threshold': 7, 'criteria_filter': {'min_minutes': 240}},
+        'CONSISTENCY_CHAMPION': {'metric': 'STUDY_STREAK_DAYS', 'threshold': 14, 'criteria_filter': {'min_minutes': 240}},
+        'MASTER_OF_CONSISTENCY': {'metric': 'STUDY_STREAK_DAYS', 'threshold': 90, 'criteria_filter': {'min_minutes': 240}},
+        'PERFECT_ATTENDANCE_STAR': {'metric': 'ATTENDANCE_PERCENTAGE', 'threshold': 95, 'criteria_filter': {}},
+        'QUIZ_MASTER': {'metric': 'AI_QUIZ_AVERAGE', 'threshold': 95, 'criteria_filter': {'min_passed': 40}},
+        'COMPLETION_CROWN': {'metric': 'QUIZZES_PASSED_PERCENTAGE', 'threshold': 100, 'criteria_filter': {}},
+        'PIONEER_GRADUATE': {'metric': 'SUBJECTS_COMPLETED', 'threshold': 1, 'criteria_filter': {}},
+    }
 
     title = models.CharField(max_length=255)
     description = models.TextField()
     icon = models.ImageField(upload_to='rewards_icons/', help_text="Image for the badge or reward.")
     reward_type = models.CharField(max_length=10, choices=REWARD_TYPE_CHOICES, default='Badge')
     category = models.CharField(max_length=50, choices=CATEGORY_CHOICES)
-    criteria_type = models.CharField(max_length=50, choices=CRITERIA_TYPE_CHOICES, unique=True)
+    criteria_type = models.CharField(max_length=50, choices=CRITERIA_TYPE_CHOICES, unique=True, blank=True, null=True, help_text="Built-in criteria this reward stands for. Leave empty for a reward defined only by its spec below.")
     priority = models.CharField(max_length=20, choices=[('High', 'High'), ('Medium', 'Medium')], default='Medium')
+    # Criteria spec: the reward is earned once `metric`, limited by `window_days`
+    # and `criteria_filter`, reaches `threshold`.
+    metric = models.CharField(max_length=40, choices=METRIC_CHOICES, blank=True, help_text="Filled in from the criteria type when left empty.")
+    threshold = models.FloatField(default=1, help_text="Value the metric must reach for the reward to be earned.")
+    window_days = models.PositiveIntegerField(null=True, blank=True, help_text="Only count activity from the last N days. Leave empty to count all of it.")
+    criteria_filter = models.JSONField(default=dict, blank=True, help_text='Extra conditions, e.g. {"subject": 3}, {"min_passed": 40} or {"min_minutes": 240}.')
+    is_active = models.BooleanField(default=True, help_text="Inactive rewards are no longer awarded or shown with progress.")
 
     class Meta:
         ordering = ['category', 'priority']
@@ -170,6 +316,28 @@ class Reward(models.Model):
     def __str__(self):
         return self.title
 
+    def clean(self):
+        self.apply_criteria_type_spec()
+        if not self.metric:
+            raise ValidationError({'metric': "Choose a metric, or a criteria type to take it from."})
+        unknown = set(self.criteria_filter or {}) - self.METRIC_FILTERS[self.metric]
+        if unknown:
+            raise ValidationError({'criteria_filter': f"Not supported for {self.metric}: {', '.join(sorted(unknown))}."})
+        if self.window_days and self.metric not in self.WINDOWED_METRICS:
+            raise ValidationError({'window_days': f"{self.metric} cannot be limited to a window."})
+
+    def save(self, *args, **kwargs):
+        self.apply_criteria_type_spec()
+        super().save(*args, **kwargs)
+
+    def apply_criteria_type_spec(self):
+        """Fills in the spec of the reward's built-in criteria type when no metric is set."""
+        if not self.metric and self.criteria_type in self.CRITERIA_TYPE_SPECS:
+            spec = self.CRITERIA_TYPE_SPECS[self.criteria_type]
+            self.metric = spec['metric']
+            self.threshold = spec['threshold']
+            self.criteria_filter = dict(spec['criteria_filter'])
+
 
 class UserReward(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='achieved_rewards')
@@ -183,6 +351,25 @@ class UserReward(models.Model):
     def __str__(self):
         return f"{self.user.username} achieved {self.reward.title}"
 
+class UserRewardCounter(models.Model):
+    """
+    Running per-user totals maintained as events happen, so the reward engine
+    does not have to re-scan the user's attempt history on every check.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reward_counter')
+    ai_quizzes_passed = models.PositiveIntegerField(default=0)
+    ai_quiz_passed_score_total = models.FloatField(default=0.0, help_text="Sum of the scores of all passed AI quiz attempts.")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Reward counters for {self.user.username}"
+
+    @property
+    def ai_quiz_average(self):
+        if not self.ai_quizzes_passed:
+            return 0.0
+        return self.ai_quiz_passed_score_total / self.ai_quizzes_passed
+
 class Checkpoint(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='checkpoints')
     lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='checkpoints')
@@ -207,11 +394,67 @@ class AILessonQuizAttempt(models.Model):
 
     class Meta:
         ordering = ['-attempted_at']
+        # Its index on (user, lesson, attempted_at) also serves the latest-attempt lookups.
         unique_together = ('user', 'lesson', 'attempted_at')
 
     def __str__(self):
         return f"{self.user.username}'s AI quiz attempt for {self.lesson.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so the reward counters can tell when `passed` (or a passed score) changes.
+        instance._loaded_passed = instance.passed if 'passed' in field_names else None
+        instance._loaded_score = instance.score if 'score' in field_names else None
+        return instance
+
+class AIQuizCooldown(models.Model):
+    """
+    When a user may next attempt a lesson's AI quiz, kept from their latest
+    failed attempt (or exam submission) so the reattempt check is a lookup by
+    (user, lesson). No row, or one in the past, means no cooldown.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='ai_quiz_cooldowns')
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='ai_quiz_cooldowns')
+    available_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'lesson')
+
+    def __str__(self):
+        return f"{self.user.username} can retry {self.lesson.title} from {self.available_at}"
+
+class ExamSubmission(models.Model):
+    """
+    A quiz or AI quiz attempt submitted in exam mode, under the idempotency key
+    the client sent with it. It is graded and stored as it arrives; its attempt
+    is written later together with the other waiting submissions. A retry with
+    the same key finds this row instead of adding another attempt.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='exam_submissions')
+    idempotency_key = models.CharField(max_length=64)
+    # Exactly one of quiz (a quiz attempt) and lesson (an AI quiz attempt) is set.
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, null=True, blank=True, related_name='exam_submissions')
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, null=True, blank=True, related_name='exam_submissions')
+    score = models.FloatField(default=0.0, help_text="Score as a percentage (0-100).")
+    passed = models.BooleanField(default=False)
+    answers = JSONField(help_text="The submitted answers, or the AI quiz data.")
+    graded_answers = JSONField(default=list, blank=True, help_text="[question_id, choice_id, correct] rows of a quiz submission.")
+    submitted_at = models.DateTimeField(auto_now_add=True)
+    claim = models.UUIDField(null=True, blank=True, help_text="Set by the worker writing this submission's attempt.")
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    recorded_at = models.DateTimeField(null=True, blank=True)
+    quiz_attempt = models.OneToOneField(UserQuizAttempt, on_delete=models.SET_NULL, null=True, blank=True, related_name='exam_submission')
+    ai_quiz_attempt = models.OneToOneField(AILessonQuizAttempt, on_delete=models.SET_NULL, null=True, blank=True, related_name='exam_submission')
+
+    class Meta:
+        ordering = ['id']
+        unique_together = ('user', 'idempotency_key')
+        indexes = [models.Index(fields=['recorded_at', 'claimed_at'])]
+
+    def __str__(self):
+        return f"{self.user.username}'s exam submission {self.idempotency_key}"
+
 class UserNote(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='user_notes')
     lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='user_notes')
@@ -249,6 +492,39 @@ class AILessonSummary(models.Model):
     def __str__(self):
         return f"AI Summary for {self.lesson.title}"
 
+class SectionBody(models.Model):
+    """
+    The text of a lesson section, stored once per distinct text under its
+    SHA-256 and compressed when first stored, never again.
+    """
+    hash = models.CharField(max_length=64, primary_key=True)
+    text = models.TextField()
+    size = models.PositiveIntegerField(help_text="Length of the text in UTF-8 bytes.")
+    gzip_body = models.BinaryField()
+    brotli_body = models.BinaryField(null=True, blank=True, help_text="Only stored when the brotli package is installed.")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.hash
+
+class LessonSection(models.Model):
+    """
+    One addressable part of a lesson's content, or of a translation of it
+    (see content.sections). Rebuilt whenever that text changes.
+    """
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='sections')
+    language_code = models.CharField(max_length=10, blank=True, help_text="Empty for the lesson's own content.")
+    position = models.PositiveIntegerField()
+    name = models.CharField(max_length=100, blank=True, help_text="The top-level key, when the content is a JSON object.")
+    body = models.ForeignKey(SectionBody, on_delete=models.PROTECT, related_name='sections')
+
+    class Meta:
+        unique_together = ('lesson', 'language_code', 'position')
+        ordering = ['lesson', 'language_code', 'position']
+
+    def __str__(self):
+        return f"Section {self.position} of {self.lesson.title}"
+
 class StudentResource(models.Model):
     """
     A personal resource saved by a student, can be a file, a note, or a video link.
@@ -0,0 +1,206 @@
+"""
+Question bank imports: questions and their choices streamed from a CSV or
+JSON Lines file, validated and written one chunk at a time so memory use
+stays the same however large the file is.
+
+JSON Lines holds one question per line:
+
+    {"lesson": 12, "text": "...", "choices": [{"text": "...", "is_correct": true}, ...]}
+
+CSV holds one question per row, under a header naming the columns
+
+    lesson, question, choice_1, ..., choice_N, correct
+
+where `correct` lists the numbers of the correct choices, e.g. "2" or "1|3".
+Either format may add a `quiz_title`. Questions are added to their lesson's
+quiz, which is created (named `quiz_title`, or after the lesson) when the
+lesson has none yet.
+"""
+import csv
+import json
+from django.db import transaction
+from .curriculum import bump_curriculum_version
+from .grading import bump_answer_key_version
+from .models import Choice, Lesson, Question, Quiz
+from .services import invalidate_all_reward_progress
+
+QUESTION_BANK_FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+DEFAULT_CHUNK_SIZE = 500
+MIN_CHOICES = 2
+
+# Only the first errors are kept in the report; the rest are just counted.
+MAX_REPORTED_ERRORS = 100
+
+_CHOICE_TEXT_LENGTH = Choice._meta.get_field('text').max_length
+_QUIZ_TITLE_LENGTH = Quiz._meta.get_field('title').max_length
+
+
+def question_bank_format(filename):
+    """Returns the format ('csv' or 'jsonl') of a file from its extension, or None."""
+    for extension, file_format in QUESTION_BANK_FORMATS.items():
+        if filename.lower().endswith(extension):
+            return file_format
+    return None
+
+
+def iter_question_rows(lines, file_format):
+    """
+    Yields (line_number, row) for every question in an iterable of text lines.
+    Rows are dicts shaped like the JSON Lines format. A line that can't be read
+    as one is yielded as the ValueError saying why, so it is reported like any
+    other invalid row.
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            try:
+                yield reader.line_num, _csv_row(record)
+            except ValueError as exc:
+                yield reader.line_num, exc
+        return
+
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, ValueError("Not valid JSON.")
+
+
+def _csv_row(record):
+    choice_columns = sorted(
+        (int(name[len('choice_'):]), name) for name in record
+        if name and name.startswith('choice_') and name[len('choice_'):].isdigit()
+    )
+    try:
+        correct = {int(number) for number in (record.get('correct') or '').replace(',', '|').split('|') if number.strip()}
+    except ValueError:
+        raise ValueError("`correct` must list choice numbers, e.g. 2 or 1|3.")
+    missing = correct - {number for number, name in choice_columns if (record[name] or '').strip()}
+    if missing:
+        raise ValueError(f"`correct` names empty or missing choices {sorted(missing)}.")
+    return {
+        'lesson': record.get('lesson'),
+        'quiz_title': record.get('quiz_title'),
+        'text': record.get('question'),
+        'choices': [
+            {'text': record[name], 'is_correct': number in correct}
+            for number, name in choice_columns if (record[name] or '').strip()
+        ],
+    }
+
+
+def clean_question_row(row):
+    """Returns a row as {'lesson_id', 'quiz_title', 'text', 'choices': [(text, is_correct)]}. Raises ValueError."""
+    if isinstance(row, ValueError):
+        raise row
+    if not isinstance(row, dict):
+        raise ValueError("Not a JSON object.")
+
+    try:
+        lesson_id = int(row.get('lesson'))
+    except (TypeError, ValueError):
+        raise ValueError("`lesson` must be a lesson id.")
+    text = row.get('text')
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError("The question text is missing.")
+    quiz_title = row.get('quiz_title') or ''
+    if not isinstance(quiz_title, str) or len(quiz_title) > _QUIZ_TITLE_LENGTH:
+        raise ValueError(f"`quiz_title` must be text of at most {_QUIZ_TITLE_LENGTH} characters.")
+
+    choices = row.get('choices')
+    if not isinstance(choices, list) or len(choices) < MIN_CHOICES:
+        raise ValueError(f"A question needs at least {MIN_CHOICES} choices.")
+    cleaned_choices = []
+    for choice in choices:
+        choice_text = choice.get('text') if isinstance(choice, dict) else None
+        if not isinstance(choice_text, str) or not choice_text.strip() or len(choice_text) > _CHOICE_TEXT_LENGTH:
+            raise ValueError(f"Each choice needs a text of at most {_CHOICE_TEXT_LENGTH} characters.")
+        cleaned_choices.append((choice_text.strip(), bool(choice.get('is_correct'))))
+    if not any(is_correct for _, is_correct in cleaned_choices):
+        raise ValueError("At least one choice must be correct.")
+
+    return {'lesson_id': lesson_id, 'quiz_title': quiz_title.strip(), 'text': text.strip(), 'choices': cleaned_choices}
+
+
+def import_question_bank(lines, file_format, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Imports the questions in `lines` (an iterable of text lines, read lazily)
+    `chunk_size` rows at a time. Each chunk is validated and written in its own
+    transaction; invalid rows are skipped and reported. Yields the running
+    report after every chunk, the last one being the final report:
+    {'rows', 'imported', 'quizzes_created', 'error_count', 'errors': [{'line', 'error'}]}.
+    """
+    report = {'rows': 0, 'imported': 0, 'quizzes_created': 0, 'error_count': 0, 'errors': []}
+    chunk = []
+    for line_number, row in iter_question_rows(lines, file_format):
+        report['rows'] += 1
+        try:
+            chunk.append((line_number, clean_question_row(row)))
+        except ValueError as exc:
+            _report_error(report, line_number, str(exc))
+        if report['rows'] % chunk_size == 0:
+            _import_chunk(chunk, report)
+            chunk = []
+            yield report
+    if report['rows'] % chunk_size or not report['rows']:
+        _import_chunk(chunk, report)
+        yield report
+
+
+def _import_chunk(chunk, report):
+    if not chunk:
+        return
+    lesson_ids = {row['lesson_id'] for _, row in chunk}
+    lessons = {
+        lesson_id: (title, quiz_id)
+        for lesson_id, title, quiz_id in Lesson.objects.filter(id__in=lesson_ids).values_list('id', 'title', 'quiz__id')
+    }
+
+    rows = []
+    for line_number, row in chunk:
+        if row['lesson_id'] in lessons:
+            rows.append(row)
+        else:
+            _report_error(report, line_number, f"Lesson {row['lesson_id']} does not exist.")
+    if not rows:
+        return
+
+    with transaction.atomic():
+        new_quizzes = {}
+        for row in rows:
+            title, quiz_id = lessons[row['lesson_id']]
+            if quiz_id is None and row['lesson_id'] not in new_quizzes:
+                new_quizzes[row['lesson_id']] = Quiz(
+                    lesson_id=row['lesson_id'], title=row['quiz_title'] or f"{title} Quiz"[:_QUIZ_TITLE_LENGTH]
+                )
+        Quiz.objects.bulk_create(new_quizzes.values())
+        quiz_ids = {lesson_id: quiz_id for lesson_id, (_, quiz_id) in lessons.items() if quiz_id}
+        quiz_ids.update({lesson_id: quiz.id for lesson_id, quiz in new_quizzes.items()})
+
+        questions = Question.objects.bulk_create([
+            Question(quiz_id=quiz_ids[row['lesson_id']], text=row['text']) for row in rows
+        ])
+        Choice.objects.bulk_create([
+            Choice(question=question, text=text, is_correct=is_correct)
+            for question, row in zip(questions, rows) for text, is_correct in row['choices']
+        ])
+
+    # Retired after every committed chunk (bulk_create sends no signals), so an
+    # import the caller stops early, e.g. an upload whose client went away, leaves
+    # no cache behind the rows it already wrote.
+    for quiz_id in {quiz_ids[row['lesson_id']] for row in rows}:
+        bump_answer_key_version(quiz_id)
+    bump_curriculum_version()
+    if new_quizzes:
+        invalidate_all_reward_progress()
+    report['imported'] += len(rows)
+    report['quizzes_created'] += len(new_quizzes)
+
+
+def _report_error(report, line_number, message):
+    report['error_count'] += 1
+    if len(report['errors']) < MAX_REPORTED_ERRORS:
+        report['errors'].append({'line': line_number, 'error': message})
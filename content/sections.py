@@ -0,0 +1,156 @@
+"""
+Lesson content split into sections that clients can fetch one at a time. Each
+section's text is stored once under its hash, already gzip (and, when the
+brotli package is installed, brotli) compressed.
+"""
+import gzip
+import hashlib
+import json
+import re
+from django.db import connection, transaction
+from jobs.queue import enqueue
+from .models import Lesson, LessonSection, SectionBody, TranslatedLessonContent
+
+try:
+    import brotli
+except ImportError: # Optional: sections are then served gzip or uncompressed only.
+    brotli = None
+
+REBUILD_SECTIONS_JOB = 'content.rebuild_lesson_sections'
+
+# Plain text lessons are cut at paragraph breaks into sections of about this many bytes.
+SECTION_TARGET_BYTES = 4096
+
+_PARAGRAPH_BREAK = re.compile(r'(\n\s*\n)')
+
+
+def split_sections(text):
+    """
+    Returns the (name, text) sections of a lesson's content: one per top-level
+    member, as JSON, when the content is a JSON object, and otherwise runs of
+    whole paragraphs that join back into the original text.
+    """
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    if isinstance(data, dict) and data:
+        return [(name[:100], json.dumps(value, ensure_ascii=False)) for name, value in data.items()]
+
+    sections = []
+    current = ''
+    parts = _PARAGRAPH_BREAK.split(text)
+    # Odd positions hold the breaks, which stay with the paragraph before them.
+    for paragraph, separator in zip(parts[::2], parts[1::2] + ['']):
+        current += paragraph + separator
+        if len(current.encode()) >= SECTION_TARGET_BYTES:
+            sections.append(('', current))
+            current = ''
+    if current or not sections:
+        sections.append(('', current))
+    return sections
+
+
+def section_hash(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def compress_section(text):
+    """Returns the gzip and brotli (None without the brotli package) encodings of `text`."""
+    data = text.encode()
+    return gzip.compress(data, compresslevel=9, mtime=0), brotli.compress(data) if brotli else None
+
+
+def store_section_bodies(texts):
+    """Stores the texts that aren't stored yet, compressing only those. Returns their hashes in order."""
+    by_hash = {section_hash(text): text for text in texts}
+    stored = set(SectionBody.objects.filter(hash__in=by_hash).values_list('hash', flat=True))
+    new_bodies = []
+    for body_hash, text in by_hash.items():
+        if body_hash not in stored:
+            gzip_body, brotli_body = compress_section(text)
+            new_bodies.append(SectionBody(
+                hash=body_hash, text=text, size=len(text.encode()), gzip_body=gzip_body, brotli_body=brotli_body
+            ))
+    SectionBody.objects.bulk_create(new_bodies, ignore_conflicts=True)
+    return [section_hash(text) for text in texts]
+
+
+def source_text(lesson_id, language_code=''):
+    """Returns the text a lesson's sections are cut from, or None when it doesn't exist."""
+    if language_code:
+        return TranslatedLessonContent.objects.filter(
+            lesson_id=lesson_id, language_code=language_code
+        ).values_list('translated_content', flat=True).first()
+    return Lesson.objects.filter(pk=lesson_id).values_list('content', flat=True).first()
+
+
+def rebuild_lesson_sections(lesson_id, language_code=''):
+    """Brings the lesson's sections in line with its text. Nothing is written when the text is unchanged."""
+    text = source_text(lesson_id, language_code)
+    sections = split_sections(text) if text is not None else []
+    wanted = [(name, section_hash(section_text)) for name, section_text in sections]
+
+    existing = LessonSection.objects.filter(lesson_id=lesson_id, language_code=language_code)
+    current = list(existing.values_list('name', 'body_id'))
+    if current == wanted:
+        return
+
+    with transaction.atomic():
+        # Stored in the same transaction as the sections pointing to them, so a
+        # concurrent delete_unused_section_bodies either runs first (and the bodies
+        # are stored again here) or finds them in use.
+        hashes = store_section_bodies([section_text for _, section_text in sections])
+        existing.delete()
+        LessonSection.objects.bulk_create([
+            LessonSection(lesson_id=lesson_id, language_code=language_code, position=position, name=name, body_id=body_hash)
+            for position, ((name, _), body_hash) in enumerate(zip(sections, hashes))
+        ])
+    delete_unused_section_bodies({body_hash for _, body_hash in current} - set(hashes))
+
+
+def delete_unused_section_bodies(hashes=None):
+    """
+    Deletes the bodies (of `hashes`, or all of them) that no section points to
+    any more. The check and the delete are one statement, so a body that a
+    section starts pointing to meanwhile is never removed from under it.
+    """
+    if hashes is not None and not hashes:
+        return
+    quote = connection.ops.quote_name
+    bodies, sections = quote(SectionBody._meta.db_table), quote(LessonSection._meta.db_table)
+    body_hash, section_body = quote(SectionBody._meta.pk.column), quote(LessonSection._meta.get_field('body').column)
+    sql = (
+        f'DELETE FROM {bodies} WHERE NOT EXISTS '
+        f'(SELECT 1 FROM {sections} WHERE {sections}.{section_body} = {bodies}.{body_hash})'
+    )
+    params = []
+    if hashes is not None:
+        hashes = list(hashes)
+        sql += f' AND {body_hash} IN ({", ".join(["%s"] * len(hashes))})'
+        params = hashes
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def get_lesson_sections(lesson_id, language_code=''):
+    """
+    Returns the lesson's sections with their body sizes, building them first
+    when the text has none yet (e.g. before the rebuild job has run).
+    """
+    sections = LessonSection.objects.filter(
+        lesson_id=lesson_id, language_code=language_code
+    ).select_related('body').only('position', 'name', 'body__hash', 'body__size')
+    if not sections:
+        rebuild_lesson_sections(lesson_id, language_code)
+        sections = sections.all()
+    return list(sections)
+
+
+def queue_section_rebuild(lesson_id, language_code=''):
+    """Schedules rebuild_lesson_sections for the background workers; repeated edits collapse into one job."""
+    enqueue(
+        REBUILD_SECTIONS_JOB,
+        {'lesson_id': lesson_id, 'language_code': language_code},
+        dedupe_key=f'{REBUILD_SECTIONS_JOB}:{lesson_id}:{language_code}',
+    )
@@ -1,22 +1,109 @@
 
+from django.db import models, transaction
 from rest_framework import serializers
 from .models import (
     Class, Subject, Lesson, Quiz, Question, Choice, UserLessonProgress, 
     ProcessedNote, Book, UserQuizAttempt, Reward, UserReward, Checkpoint, 
-    AILessonQuizAttempt, UserNote, TranslatedLessonContent, AILessonSummary,
+    AILessonQuizAttempt, ExamSubmission, UserNote, TranslatedLessonContent, AILessonSummary,
     StudentResource, ManualReport
 )
 from accounts.models import School, Syllabus # Import School model
+from stepwise_backend.fieldsets import SparseFieldsMixin, renders
+from .authoring import retire_quiz_caches_on_commit, save_question_choices, save_quiz_questions
+from .services import get_lesson_locks, get_subject_completion, lesson_locks_apply
+
+
+def _lock_user(context):
+    """Returns the user lesson locks apply to, or None when the request isn't a student's."""
+    request = context.get('request')
+    user = getattr(request, 'user', None)
+    if not user or not user.is_authenticated or not lesson_locks_apply(user):
+        return None
+    return user
+
+
+def prime_lesson_locks(context, **lesson_filter):
+    """
+    Works out the lock state of every lesson matching `lesson_filter` in one pass
+    and keeps it in the serializer context, where LessonSerializer.get_is_locked
+    looks it up.
+    """
+    user = _lock_user(context)
+    if user is None:
+        return
+    context.setdefault('lesson_locks', {}).update(get_lesson_locks(user, **lesson_filter))
+
+
+class LockPrimingListSerializer(serializers.ListSerializer):
+    """
+    Primes lesson locks for every item of the list before serializing it, so
+    nested lessons cost the same few queries however many there are. The
+    items are lessons unless a subclass says otherwise, returning the lesson
+    filter covering its items from `lesson_filter`.
+    """
+
+    # The path from an item to the lessons' is_locked field; nothing is primed when it isn't rendered.
+    is_locked_path = 'is_locked'
+
+    def lesson_filter(self, items):
+        known = self.context.get('lesson_locks', {})
+        lesson_ids = {lesson.id for lesson in items if lesson.id not in known}
+        return {'id__in': lesson_ids} if lesson_ids else None
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        if items and _lock_user(self.context) and renders(self.child, self.is_locked_path):
+            lesson_filter = self.lesson_filter(items)
+            if lesson_filter:
+                prime_lesson_locks(self.context, **lesson_filter)
+        return super().to_representation(items)
+
+
+class SubjectListSerializer(LockPrimingListSerializer):
+    is_locked_path = 'lessons.is_locked'
+
+    def lesson_filter(self, items):
+        return {'subject_id__in': {subject.id for subject in items}}
+
+
+class ClassListSerializer(LockPrimingListSerializer):
+    is_locked_path = 'subjects.lessons.is_locked'
+
+    def lesson_filter(self, items):
+        return {'subject__master_class_id__in': {master_class.id for master_class in items}}
+
+
+def _shows_answer_keys(context):
+    """Whether the request's user may see which choices are correct: teachers, admins and staff."""
+    request = context.get('request')
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_authenticated and (user.is_staff or user.role in ('Teacher', 'Admin')))
+
+
+class ChoiceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # Writable so nested items can name the choice they update.
+    id = serializers.IntegerField(required=False)
 
-class ChoiceSerializer(serializers.ModelSerializer):
     class Meta:
         model = Choice
         fields = ['id', 'text', 'is_correct']
         # For creating choices under a question, 'question' field is not needed in request body
         extra_kwargs = {'question': {'required': False, 'allow_null': True}}
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if not _shows_answer_keys(self.context):
+            data.pop('is_correct', None) # Submissions are graded on the server.
+        return data
+
+    def validate(self, attrs):
+        if self.parent is None:
+            attrs.pop('id', None) # Only nested items pick their row by id.
+        return attrs
 
-class QuestionSerializer(serializers.ModelSerializer):
+
+class QuestionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
     choices = ChoiceSerializer(many=True, required=True) # For creation, choices are required
 
     class Meta:
@@ -24,27 +111,39 @@ class QuestionSerializer(serializers.ModelSerializer):
         fields = ['id', 'text', 'choices']
         extra_kwargs = {'quiz': {'required': False, 'allow_null': True}}
 
+    def validate(self, attrs):
+        if self.parent is None:
+            attrs.pop('id', None)
+        return attrs
 
+    @transaction.atomic
     def create(self, validated_data):
         choices_data = validated_data.pop('choices')
         question = Question.objects.create(**validated_data)
-        for choice_data in choices_data:
-            Choice.objects.create(question=question, **choice_data)
+        try:
+            save_question_choices(question, choices_data)
+        except ValueError as exc:
+            raise serializers.ValidationError({'choices': str(exc)})
         return question
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         choices_data = validated_data.pop('choices', None)
         instance = super().update(instance, validated_data)
 
         if choices_data is not None:
-            # Simple approach: clear existing and add new. More complex merging logic could be implemented.
-            instance.choices.all().delete()
-            for choice_data in choices_data:
-                Choice.objects.create(question=instance, **choice_data)
+            # Choices sent with an id are updated in place, those without one added, and the rest removed.
+            try:
+                save_question_choices(instance, choices_data)
+            except ValueError as exc:
+                raise serializers.ValidationError({'choices': str(exc)})
+        else:
+            # The save's own signals retire the caches inside the transaction; retire them again after it.
+            retire_quiz_caches_on_commit(instance.quiz_id)
         return instance
 
 
-class QuizSerializer(serializers.ModelSerializer):
+class QuizSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     questions = QuestionSerializer(many=True, required=False) # Optional for creation/update from quiz level
     lesson_id = serializers.PrimaryKeyRelatedField(source='lesson', queryset=Lesson.objects.all(), write_only=True, required=False)
 
@@ -53,101 +152,114 @@ class QuizSerializer(serializers.ModelSerializer):
         fields = ['id', 'lesson', 'lesson_id', 'title', 'description', 'pass_mark_percentage', 'questions']
         read_only_fields = ['lesson'] # Lesson is set via lesson_id or directly by LessonSerializer
 
+    def to_representation(self, instance):
+        if 'questions' in self.fields:
+            # A no-op when the view prefetched them; after a write the view has dropped its prefetch.
+            models.prefetch_related_objects([instance], 'questions__choices')
+        return super().to_representation(instance)
+
+    @transaction.atomic
     def create(self, validated_data):
         questions_data = validated_data.pop('questions', [])
         quiz = Quiz.objects.create(**validated_data)
-        for question_data in questions_data:
-            choices_data = question_data.pop('choices', []) # Pop choices from question_data
-            question = Question.objects.create(quiz=quiz, **question_data)
-            for choice_data in choices_data:
-                Choice.objects.create(question=question, **choice_data)
+        try:
+            save_quiz_questions(quiz, questions_data)
+        except ValueError as exc:
+            raise serializers.ValidationError({'questions': str(exc)})
         return quiz
     
+    @transaction.atomic
     def update(self, instance, validated_data):
         questions_data = validated_data.pop('questions', None)
         instance = super().update(instance, validated_data)
 
         if questions_data is not None:
-            # Simple approach: clear existing and add new questions.
-            instance.questions.all().delete()
-            for question_data in questions_data:
-                choices_data = question_data.pop('choices', [])
-                question = Question.objects.create(quiz=instance, **question_data)
-                for choice_data in choices_data:
-                    Choice.objects.create(question=question, **choice_data)
+            # Questions sent with an id are updated in place, those without one added, and the rest removed.
+            try:
+                save_quiz_questions(instance, questions_data)
+            except ValueError as exc:
+                raise serializers.ValidationError({'questions': str(exc)})
+        else:
+            retire_quiz_caches_on_commit(instance.id)
         return instance
 
-class AILessonSummarySerializer(serializers.ModelSerializer):
+class AILessonSummarySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = AILessonSummary
         fields = ['id', 'lesson', 'summary', 'created_at']
         read_only_fields = ['id', 'created_at']
 
-class TranslatedLessonContentSerializer(serializers.ModelSerializer):
+class TranslatedLessonContentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = TranslatedLessonContent
         fields = '__all__'
         read_only_fields = ['created_at']
 
-class LessonSerializer(serializers.ModelSerializer):
+class LessonSummarySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """A lesson without its body or quiz, for listings. The body comes from `/lessons/{id}/body/`."""
     is_locked = serializers.SerializerMethodField()
-    quiz = QuizSerializer(read_only=True, context={'request': serializers.CurrentUserDefault()}) 
-    subject_id = serializers.PrimaryKeyRelatedField(source='subject', queryset=Subject.objects.all(), write_only=True)
+    has_quiz = serializers.SerializerMethodField()
     subject_name = serializers.CharField(source='subject.name', read_only=True)
-    ai_summary = AILessonSummarySerializer(read_only=True)
-    translations = TranslatedLessonContentSerializer(many=True, read_only=True)
-
 
     class Meta:
         model = Lesson
         fields = [
-            'id', 'subject', 'subject_id', 'subject_name', 'title', 'content', 'video_url', 'audio_url', 'image_url',
-            'simplified_content', 'lesson_order', 'requires_previous_quiz', 'is_locked', 'quiz', 'ai_summary', 'translations'
+            'id', 'subject', 'subject_name', 'title', 'video_url', 'audio_url', 'image_url',
+            'lesson_order', 'previous_lesson', 'next_lesson', 'requires_previous_quiz', 'is_locked', 'has_quiz'
         ]
-        read_only_fields = ['subject', 'ai_summary', 'translations']
+        read_only_fields = ['subject']
+        list_serializer_class = LockPrimingListSerializer
 
     def get_is_locked(self, obj):
         request = self.context.get('request')
         if not request or not request.user or not request.user.is_authenticated:
             return obj.requires_previous_quiz
-        
-        user = request.user
-        if user.role in ['Teacher', 'Admin'] or user.is_staff:
-             return False
-
-        if obj.lesson_order == 0:
-            return False
-
-        previous_lesson = Lesson.objects.filter(
-            subject=obj.subject, 
-            lesson_order__lt=obj.lesson_order
-        ).order_by('-lesson_order').first()
-
-        if not previous_lesson:
-            return False
-
-        if not previous_lesson.requires_previous_quiz:
-             return False # If previous lesson doesn't require a quiz, this one is unlocked by default
-
-        passed_ai_attempt_exists = AILessonQuizAttempt.objects.filter(
-            user=user,
-            lesson=previous_lesson,
-            passed=True
-        ).exists()
-        
-        if not passed_ai_attempt_exists and hasattr(previous_lesson, 'quiz'):
-             passed_normal_attempt_exists = UserQuizAttempt.objects.filter(
-                user=user, 
-                quiz=previous_lesson.quiz, 
-                passed=True
-            ).exists()
-             return not passed_normal_attempt_exists
-
-        return not passed_ai_attempt_exists
-
-
-class SubjectSerializer(serializers.ModelSerializer):
-    lessons = LessonSerializer(many=True, read_only=True, context={'request': serializers.CurrentUserDefault()}) 
+
+        if _lock_user(self.context) is None:
+            return False # Teachers, admins and staff see every lesson
+
+        if obj.id not in self.context.get('lesson_locks', {}):
+            prime_lesson_locks(self.context, id=obj.id)
+        return self.context['lesson_locks'].get(obj.id, False)
+
+    def get_has_quiz(self, obj):
+        if hasattr(obj, 'quiz_exists'):
+            return obj.quiz_exists # Annotated by services.lesson_summary_queryset
+        return hasattr(obj, 'quiz')
+
+
+class LessonSerializer(LessonSummarySerializer):
+    quiz = QuizSerializer(read_only=True, context={'request': serializers.CurrentUserDefault()}) 
+    subject_id = serializers.PrimaryKeyRelatedField(source='subject', queryset=Subject.objects.all(), write_only=True)
+    ai_summary = AILessonSummarySerializer(read_only=True)
+    translations = TranslatedLessonContentSerializer(many=True, read_only=True)
+
+
+    class Meta(LessonSummarySerializer.Meta):
+        fields = [
+            'id', 'subject', 'subject_id', 'subject_name', 'title', 'content', 'video_url', 'audio_url', 'image_url',
+            'simplified_content', 'lesson_order', 'previous_lesson', 'next_lesson', 'requires_previous_quiz', 'is_locked',
+            'has_quiz', 'quiz',
+            'ai_summary', 'translations'
+        ]
+        read_only_fields = ['subject', 'ai_summary', 'translations']
+
+
+class LessonBodySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """The large parts of a lesson that listings leave out."""
+    quiz = QuizSerializer(read_only=True)
+    ai_summary = AILessonSummarySerializer(read_only=True)
+    translations = TranslatedLessonContentSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Lesson
+        fields = ['id', 'content', 'simplified_content', 'quiz', 'ai_summary', 'translations']
+        read_only_fields = fields
+
+
+class SubjectSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # Summaries only: bodies and quizzes come from the lesson endpoints.
+    lessons = LessonSummarySerializer(many=True, read_only=True)
     master_class = serializers.PrimaryKeyRelatedField(queryset=Class.objects.all(), write_only=True)
     master_class_name = serializers.CharField(source='master_class.name', read_only=True)
     progress = serializers.SerializerMethodField()
@@ -155,27 +267,23 @@ class SubjectSerializer(serializers.ModelSerializer):
     class Meta:
         model = Subject
         fields = ['id', 'master_class', 'master_class_name', 'name', 'description', 'lessons', 'progress']
+        list_serializer_class = SubjectListSerializer
 
     def get_progress(self, obj):
         request = self.context.get('request')
         if not request or not request.user or not request.user.is_authenticated:
             return 0
 
-        user = request.user
-        total_lessons = obj.lessons.count()
-        if total_lessons == 0:
-            return 0
-        
-        completed_lessons = UserLessonProgress.objects.filter(
-            user=user,
-            lesson__subject=obj,
-            completed=True
-        ).count()
+        if hasattr(obj, 'progress_total_lessons'):
+            # Annotated by the viewset (see services.annotate_subject_progress).
+            total = obj.progress_total_lessons
+            return (obj.progress_completed_lessons / total) * 100 if total else 0
 
-        return (completed_lessons / total_lessons) * 100
+        completion = get_subject_completion(request.user, obj.id)
+        return completion.percentage if completion else 0
 
 
-class ClassSerializer(serializers.ModelSerializer): # This is now MasterClassSerializer
+class ClassSerializer(SparseFieldsMixin, serializers.ModelSerializer): # This is now MasterClassSerializer
     subjects = SubjectSerializer(many=True, read_only=True, context={'request': serializers.CurrentUserDefault()}) 
     school_name = serializers.SerializerMethodField() 
     syllabus_name = serializers.CharField(source='syllabus.name', read_only=True, allow_null=True)
@@ -185,6 +293,7 @@ class ClassSerializer(serializers.ModelSerializer): # This is now MasterClassSer
         model = Class
         fields = ['id', 'name', 'description', 'subjects', 'syllabus', 'syllabus_id', 'syllabus_name', 'school_name']
         read_only_fields = ['syllabus']
+        list_serializer_class = ClassListSerializer
 
     def get_school_name(self, obj):
         # This is a bit of a workaround since a MasterClass isn't tied to ONE school
@@ -194,7 +303,7 @@ class ClassSerializer(serializers.ModelSerializer): # This is now MasterClassSer
         return school.name if school else None
 
 
-class UserLessonProgressSerializer(serializers.ModelSerializer):
+class UserLessonProgressSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user_id = serializers.ReadOnlyField(source='user.id')
     lesson_id = serializers.PrimaryKeyRelatedField(queryset=Lesson.objects.all(), source='lesson', write_only=True)
     lesson_title = serializers.CharField(source='lesson.title', read_only=True)
@@ -204,7 +313,7 @@ class UserLessonProgressSerializer(serializers.ModelSerializer):
         fields = ['id', 'user_id', 'lesson', 'lesson_id', 'lesson_title', 'completed', 'progress_data', 'last_updated']
         read_only_fields = ['user_id', 'lesson', 'last_updated']
 
-class ProcessedNoteSerializer(serializers.ModelSerializer):
+class ProcessedNoteSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user_id = serializers.ReadOnlyField(source='user.id')
     lesson_id = serializers.PrimaryKeyRelatedField(queryset=Lesson.objects.all(), source='lesson', allow_null=True, required=False, write_only=True)
     lesson_title = serializers.CharField(source='lesson.title', read_only=True, allow_null=True)
@@ -214,7 +323,7 @@ class ProcessedNoteSerializer(serializers.ModelSerializer):
         fields = ['id', 'user_id', 'lesson', 'lesson_id', 'lesson_title', 'original_notes', 'processed_output', 'created_at', 'updated_at']
         read_only_fields = ['user_id', 'lesson', 'created_at', 'updated_at', 'processed_output']
 
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class_name = serializers.CharField(source='master_class.name', read_only=True, allow_null=True)
     subject_name = serializers.CharField(source='subject.name', read_only=True, allow_null=True)
     file_url = serializers.SerializerMethodField()
@@ -239,7 +348,7 @@ class BookSerializer(serializers.ModelSerializer):
             return obj.file.url
         return None
 
-class UserQuizAttemptSerializer(serializers.ModelSerializer):
+class UserQuizAttemptSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     quiz_title = serializers.CharField(source='quiz.title', read_only=True)
     quiz_details = QuizSerializer(source='quiz', read_only=True)
     lesson_title = serializers.CharField(source='quiz.lesson.title', read_only=True)
@@ -255,13 +364,13 @@ class UserQuizAttemptSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class RewardSerializer(serializers.ModelSerializer):
+class RewardSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Reward
         fields = '__all__'
 
 
-class UserRewardSerializer(serializers.ModelSerializer):
+class UserRewardSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     reward_details = RewardSerializer(source='reward', read_only=True)
     user_username = serializers.CharField(source='user.username', read_only=True)
 
@@ -271,7 +380,7 @@ class UserRewardSerializer(serializers.ModelSerializer):
         read_only_fields = ['user', 'reward', 'achieved_at']
 
 
-class CheckpointSerializer(serializers.ModelSerializer):
+class CheckpointSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user_id = serializers.ReadOnlyField(source='user.id')
     lesson_id = serializers.PrimaryKeyRelatedField(queryset=Lesson.objects.all(), source='lesson', write_only=True)
     lesson_title = serializers.CharField(source='lesson.title', read_only=True)
@@ -281,7 +390,7 @@ class CheckpointSerializer(serializers.ModelSerializer):
         fields = ['id', 'user_id', 'lesson', 'lesson_id', 'lesson_title', 'name', 'progress_data', 'created_at']
         read_only_fields = ['user_id', 'lesson', 'created_at']
 
-class AILessonQuizAttemptSerializer(serializers.ModelSerializer):
+class AILessonQuizAttemptSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     lesson_id = serializers.PrimaryKeyRelatedField(source='lesson', queryset=Lesson.objects.all(), write_only=True)
     lesson_title = serializers.CharField(source='lesson.title', read_only=True)
     lesson_subject_name = serializers.CharField(source='lesson.subject.name', read_only=True)
@@ -291,7 +400,14 @@ class AILessonQuizAttemptSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'lesson', 'lesson_id', 'lesson_title', 'lesson_subject_name', 'score', 'passed', 'quiz_data', 'attempted_at', 'can_reattempt_at']
         read_only_fields = ['user', 'lesson_title', 'lesson_subject_name', 'attempted_at', 'can_reattempt_at']
 
-class UserNoteSerializer(serializers.ModelSerializer):
+class ExamSubmissionSerializer(serializers.ModelSerializer):
+    """An exam-mode submission; its attempt fields stay null until the attempt is written."""
+    class Meta:
+        model = ExamSubmission
+        fields = ['id', 'idempotency_key', 'quiz', 'lesson', 'score', 'passed', 'submitted_at', 'recorded_at', 'quiz_attempt', 'ai_quiz_attempt']
+        read_only_fields = fields
+
+class UserNoteSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source='user.username')
 
     class Meta:
@@ -299,7 +415,7 @@ class UserNoteSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'lesson', 'notes', 'created_at', 'updated_at']
         read_only_fields = ['user', 'created_at', 'updated_at']
 
-class StudentResourceSerializer(serializers.ModelSerializer):
+class StudentResourceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     file_url = serializers.SerializerMethodField()
 
     class Meta:
@@ -336,7 +452,7 @@ class StudentResourceSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({"content": "Content is required for the 'Note' resource type."})
         return data
 
-class ManualReportSerializer(serializers.ModelSerializer):
+class ManualReportSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     student_username = serializers.CharField(source='student.username', read_only=True)
     created_by_username = serializers.CharField(source='created_by.username', read_only=True)
 
@@ -1,213 +1,821 @@
+import math
+from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models import Avg, Count
-from .models import Reward, UserReward, AILessonQuizAttempt, Lesson, Subject, UserLessonProgress
-from accounts.models import UserDailyActivity, RecentActivity
+from django.db import transaction
+from django.db.models import (
+    Avg, Case, Count, Exists, F, FilteredRelation, FloatField, OuterRef, PositiveIntegerField, Prefetch, Q, Subquery, Sum,
+    Value, When
+)
+from .models import (
+    Reward, UserReward, UserRewardCounter, AILessonQuizAttempt, AIQuizCooldown, UserQuizAttempt, Lesson, Quiz, Subject,
+    UserLessonProgress, UserLessonUnlock, UserPassedLesson, UserSubjectCompletion
+)
+from accounts.models import CustomUser, RecentActivity, UserAttendanceYear
+from accounts.services import DEFAULT_STREAK_MINUTES, days_so_far, get_attendance_year, get_study_streak
+from jobs.queue import enqueue, enqueue_many
+
+# --- Reward Rule Engine ---
+
+# Rewards are defined by a criteria spec (see Reward.metric): the reward is
+# earned once the metric, limited by the spec's window and filter, reaches the
+# threshold. Each metric is read from one source table.
+METRIC_SOURCES = {
+    'STUDY_STREAK_DAYS': 'study_streak',
+    'ATTENDANCE_PERCENTAGE': 'attendance',
+    'AI_QUIZZES_PASSED': 'ai_quizzes',
+    'AI_QUIZ_AVERAGE': 'ai_quizzes',
+    'QUIZZES_PASSED': 'passed_lessons',
+    'QUIZZES_PASSED_PERCENTAGE': 'passed_lessons',
+    'SUBJECTS_COMPLETED': 'subject_completion',
+}
+
+# Which trigger events can change each metric. An event only re-checks the
+# unearned rewards whose metric it can move.
+METRIC_TRIGGERS = {
+    'STUDY_STREAK_DAYS': ('LOGIN',),
+    'ATTENDANCE_PERCENTAGE': ('LOGIN',),
+    'AI_QUIZZES_PASSED': ('QUIZ_PASSED',),
+    'AI_QUIZ_AVERAGE': ('QUIZ_PASSED',),
+    'QUIZZES_PASSED': ('QUIZ_PASSED',),
+    'QUIZZES_PASSED_PERCENTAGE': ('QUIZ_PASSED',),
+    'SUBJECTS_COMPLETED': ('QUIZ_PASSED', 'LESSON_COMPLETED'),
+}
+
+# Snapshots expire at the end of the day at the latest, since streaks and
+# attendance percentages move with the calendar.
+REWARD_PROGRESS_CACHE_KEY = 'reward_progress:{generation}:{user_id}'
+REWARD_PROGRESS_GENERATION_KEY = 'reward_progress:generation'
+
+
+# Job kind handled by content.jobs.evaluate_rewards.
+EVALUATE_REWARDS_JOB = 'content.evaluate_rewards'
+
+# Metrics that can be evaluated for every student at once by `manage.py award_rewards`.
+SWEEP_METRICS = ('ATTENDANCE_PERCENTAGE', 'AI_QUIZZES_PASSED', 'AI_QUIZ_AVERAGE', 'QUIZZES_PASSED', 'QUIZZES_PASSED_PERCENTAGE')
+
+
+def metrics_for_trigger(trigger_event):
+    """Returns the metrics that `trigger_event` can change."""
+    return [metric for metric, triggers in METRIC_TRIGGERS.items() if trigger_event in triggers]
+
+
+def rewards_for_trigger(trigger_event):
+    """
+    Returns the active rewards whose metric `trigger_event` can change, leaving
+    out the criteria types settings.REWARD_SWEEP_ONLY_CRITERIA hands to the nightly sweep.
+    """
+    return Reward.objects.filter(is_active=True, metric__in=metrics_for_trigger(trigger_event)).exclude(
+        criteria_type__in=getattr(settings, 'REWARD_SWEEP_ONLY_CRITERIA', ())
+    )
+
+
+def criteria_scope(reward):
+    """
+    Returns the (source, parameters) the reward's metric is read with. Rewards
+    sharing a scope are evaluated from the same query.
+    """
+    source = METRIC_SOURCES[reward.metric]
+    criteria_filter = reward.criteria_filter or {}
+    if source == 'study_streak':
+        return source, (criteria_filter.get('min_minutes', DEFAULT_STREAK_MINUTES),)
+    if source in ('ai_quizzes', 'passed_lessons'):
+        return source, (reward.window_days, criteria_filter.get('subject'))
+    return source, ()
+
+
+class RewardEvaluation:
+    """
+    Evaluates reward criteria specs for a single user. Each metric source is
+    queried once per scope, however many rewards read it, and the same values
+    serve both awarding and progress.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._metrics = {}
+
+    def metrics(self, reward):
+        scope = criteria_scope(reward)
+        if scope not in self._metrics:
+            source, params = scope
+            self._metrics[scope] = METRIC_LOADERS[source](self.user, *params)
+        return self._metrics[scope]
+
+    def is_met(self, reward):
+        metrics = self.metrics(reward)
+        if reward.metric == 'QUIZZES_PASSED_PERCENTAGE' and not metrics['quiz_lessons']:
+            return False # Nothing to complete yet
+        min_passed = (reward.criteria_filter or {}).get('min_passed')
+        if min_passed and metrics['AI_QUIZZES_PASSED'] < min_passed:
+            return False
+        return metrics[reward.metric] >= reward.threshold
+
+    def progress(self, reward):
+        metrics = self.metrics(reward)
+        metric = reward.metric
+        current, target = metrics[metric], _whole(reward.threshold)
+        progress = {'reward': reward.id, 'current': current, 'target': target, 'text': 'Not started'}
+
+        if metric == 'STUDY_STREAK_DAYS':
+            progress['text'] = f'{current}/{target} days'
+
+        elif metric == 'ATTENDANCE_PERCENTAGE':
+            progress['text'] = f"{current:.1f}% of {metrics['days']} days"
+
+        elif metric == 'AI_QUIZZES_PASSED':
+            progress['text'] = f'{current}/{target} quizzes passed'
+
+        elif metric == 'AI_QUIZ_AVERAGE':
+            quizzes_passed = metrics['AI_QUIZZES_PASSED']
+            min_passed = (reward.criteria_filter or {}).get('min_passed')
+            if min_passed:
+                progress.update({'current': quizzes_passed, 'target': min_passed, 'text': f'{quizzes_passed}/{min_passed} quizzes passed (Avg: {current:.1f}%)'})
+            else:
+                progress['text'] = f'Avg: {current:.1f}% over {quizzes_passed} quizzes passed'
+
+        elif metric == 'QUIZZES_PASSED':
+            progress['text'] = f'{current}/{target} quizzes completed'
+
+        elif metric == 'QUIZZES_PASSED_PERCENTAGE':
+            completed = metrics['QUIZZES_PASSED']
+            required = max(_at_least(metrics['quiz_lessons'], reward.threshold), 1)
+            progress.update({'current': completed, 'target': required, 'text': f'{completed}/{required} quizzes completed'})
+
+        elif metric == 'SUBJECTS_COMPLETED':
+            progress['text'] = f"Complete {target} subject{'' if target == 1 else 's'}"
+
+        return progress
+
+
+def _whole(value):
+    return int(value) if float(value).is_integer() else value
+
+
+def _at_least(total, percentage):
+    """Returns the smallest count that is at least `percentage` percent of `total`."""
+    return math.ceil(round(total * percentage / 100, 9))
+
 
 def check_and_award_rewards(user, trigger_event):
     """
     Checks and awards rewards to a user based on a specific trigger.
     `trigger_event` can be 'LOGIN', 'QUIZ_PASSED', 'LESSON_COMPLETED'.
     """
-    if user.role != 'Student':
+    if user.role != 'Student' or not metrics_for_trigger(trigger_event):
+        return []
+
+    candidate_rewards = rewards_for_trigger(trigger_event).exclude(user_achievements__user=user)
+    evaluation = RewardEvaluation(user)
+    awarded = [reward for reward in candidate_rewards if evaluation.is_met(reward)]
+
+    if awarded:
+        UserReward.objects.bulk_create([UserReward(user=user, reward=reward) for reward in awarded], ignore_conflicts=True)
+        RecentActivity.objects.bulk_create([
+            RecentActivity(user=user, activity_type='Reward', details=f"Earned a new reward: '{reward.title}'")
+            for reward in awarded
+        ])
+        invalidate_reward_progress(user.id)
+    return awarded
+
+
+# --- Bulk Reward Sweep ---
+
+def sweep_rewards(reward_ids=None, school_ids=None, include_unassigned=True, chunk_size=500):
+    """
+    Awards the active rewards with a sweepable metric (only those in
+    `reward_ids`, if given) to every eligible student, in one grouped aggregate
+    query per reward. `school_ids` limits the sweep to those schools' students;
+    `include_unassigned` also covers students without a school.
+    Returns the number of users awarded per reward id.
+    """
+    students = CustomUser.objects.filter(role='Student')
+    if school_ids is not None:
+        school_filter = Q(school_id__in=school_ids)
+        if include_unassigned:
+            school_filter |= Q(school__isnull=True)
+        students = students.filter(school_filter)
+
+    rewards = Reward.objects.filter(is_active=True, metric__in=SWEEP_METRICS)
+    if reward_ids is not None:
+        rewards = rewards.filter(id__in=reward_ids)
+
+    awarded_counts = {}
+    for reward in rewards:
+        holders = UserReward.objects.filter(reward=reward).values('user_id')
+        eligible = eligible_user_ids(reward).filter(
+            user_id__in=students.values('id')
+        ).exclude(user_id__in=holders)
+        awarded_counts[reward.id] = _bulk_award(reward, eligible.iterator(chunk_size=chunk_size), chunk_size)
+    return awarded_counts
+
+
+def eligible_user_ids(reward):
+    """
+    Returns a `values('user_id')` queryset of the users meeting the reward's
+    spec, grouped per user. Only metrics in SWEEP_METRICS can be evaluated this way.
+    """
+    source, params = criteria_scope(reward)
+    if source == 'attendance':
+        today = timezone.now().date()
+        return UserAttendanceYear.objects.filter(
+            year=today.year, present_days__gte=_at_least(days_so_far(today), reward.threshold)
+        ).values('user_id')
+
+    if source == 'ai_quizzes':
+        rows = _ai_quiz_passes(*params).values('user_id').annotate(passed_count=Count('id'), average_score=Avg('score'))
+        if reward.metric == 'AI_QUIZ_AVERAGE':
+            rows = rows.filter(
+                average_score__gte=reward.threshold,
+                passed_count__gte=(reward.criteria_filter or {}).get('min_passed') or 1
+            )
+        else:
+            rows = rows.filter(passed_count__gte=reward.threshold)
+        return rows.values('user_id')
+
+    if source == 'passed_lessons':
+        window_days, subject_id = params
+        required = reward.threshold
+        if reward.metric == 'QUIZZES_PASSED_PERCENTAGE':
+            total_quizzes = _quiz_lessons(subject_id).count()
+            if total_quizzes == 0:
+                return AILessonQuizAttempt.objects.none().values('user_id')
+            required = _at_least(total_quizzes, reward.threshold)
+        return _quiz_lesson_passes(window_days, subject_id).values('user_id').annotate(
+            completed_lessons=Count('lesson_id', distinct=True)
+        ).filter(completed_lessons__gte=required).values('user_id')
+
+    raise ValueError(f"{reward.metric} cannot be evaluated by the reward sweep.")
+
+
+def _bulk_award(reward, user_rows, chunk_size):
+    awarded = 0
+    for chunk in _chunked((row['user_id'] for row in user_rows), chunk_size):
+        with transaction.atomic():
+            UserReward.objects.bulk_create([UserReward(user_id=user_id, reward=reward) for user_id in chunk], ignore_conflicts=True)
+            RecentActivity.objects.bulk_create([
+                RecentActivity(user_id=user_id, activity_type='Reward', details=f"Earned a new reward: '{reward.title}'")
+                for user_id in chunk
+            ])
+        for user_id in chunk:
+            invalidate_reward_progress(user_id)
+        awarded += len(chunk)
+    return awarded
+
+
+def _chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def queue_reward_evaluation(user, trigger_event):
+    """
+    Schedules check_and_award_rewards for the background workers instead of
+    running it in the request. Repeated events collapse into one pending job
+    per user and trigger.
+    """
+    if user.role != 'Student' or not metrics_for_trigger(trigger_event):
         return
+    enqueue(
+        EVALUATE_REWARDS_JOB,
+        {'user_id': user.id, 'trigger_event': trigger_event},
+        dedupe_key=f'{EVALUATE_REWARDS_JOB}:{user.id}:{trigger_event}',
+    )
+
+
+def queue_reward_evaluations(users, trigger_event):
+    """queue_reward_evaluation for many users at once, in one insert."""
+    if not metrics_for_trigger(trigger_event):
+        return
+    enqueue_many(EVALUATE_REWARDS_JOB, [
+        ({'user_id': user.id, 'trigger_event': trigger_event}, f'{EVALUATE_REWARDS_JOB}:{user.id}:{trigger_event}')
+        for user in users if user.role == 'Student'
+    ])
+
+
+def get_reward_counter(user):
+    """Returns the user's reward counters, building them from history the first time."""
+    try:
+        return UserRewardCounter.objects.get(user=user)
+    except UserRewardCounter.DoesNotExist:
+        return rebuild_reward_counter(user)
 
-    earned_reward_ids = UserReward.objects.filter(user=user).values_list('reward_id', flat=True)
-    potential_rewards = Reward.objects.exclude(id__in=earned_reward_ids)
-
-    for reward in potential_rewards:
-        awarded = False
-        criteria = reward.criteria_type
-        
-        if trigger_event == 'LOGIN':
-            if criteria == 'WEEK_WARRIOR':
-                awarded = check_study_streak(user, 7, 240)
-            elif criteria == 'CONSISTENCY_CHAMPION':
-                awarded = check_study_streak(user, 14, 240)
-            elif criteria == 'MASTER_OF_CONSISTENCY':
-                awarded = check_study_streak(user, 90, 240)
-            elif criteria == 'PERFECT_ATTENDANCE_STAR':
-                awarded = check_perfect_attendance(user)
-        
-        elif trigger_event == 'QUIZ_PASSED':
-            if criteria == 'QUIZ_MASTER':
-                awarded = check_quiz_master(user)
-            elif criteria == 'COMPLETION_CROWN':
-                awarded = check_quiz_completion(user)
-            elif criteria == 'PIONEER_GRADUATE':
-                awarded = check_pioneer_graduate(user)
-        
-        elif trigger_event == 'LESSON_COMPLETED':
-            if criteria == 'SUBJECT_COMPLETION': # Assuming a criteria type for this
-                # This needs to know which subject was completed
-                pass
-
-
-        if awarded:
-            UserReward.objects.create(user=user, reward=reward)
-            RecentActivity.objects.create(
-                user=user,
-                activity_type='Reward',
-                details=f"Earned a new reward: '{reward.title}'"
+
+def rebuild_reward_counter(user):
+    """Recomputes the user's reward counters from their attempt history."""
+    totals = AILessonQuizAttempt.objects.filter(user=user, passed=True).aggregate(passed=Count('id'), score_total=Sum('score'))
+    counter, _ = UserRewardCounter.objects.update_or_create(
+        user=user,
+        defaults={
+            'ai_quizzes_passed': totals['passed'],
+            'ai_quiz_passed_score_total': totals['score_total'] or 0.0,
+        }
+    )
+    return counter
+
+
+def record_ai_quiz_pass(attempt):
+    """Adds a newly passed AI quiz attempt to the user's reward counters."""
+    adjust_ai_quiz_passes(attempt.user, 1, attempt.score)
+
+
+def adjust_ai_quiz_passes(user, passed_delta, score_delta):
+    """
+    Applies a change in the user's passed AI quiz attempts and their score total
+    to the reward counters, e.g. after an attempt was deleted or its result edited.
+    """
+    if not passed_delta and not score_delta:
+        return
+    updated = UserRewardCounter.objects.filter(user_id=user.pk).update(
+        ai_quizzes_passed=F('ai_quizzes_passed') + passed_delta,
+        ai_quiz_passed_score_total=F('ai_quiz_passed_score_total') + score_delta,
+    )
+    if not updated and passed_delta > 0:
+        # The first pass; counting from the history includes this change. Without
+        # a counter a removed pass needs nothing: it is built from history when read.
+        rebuild_reward_counter(user)
+
+
+def record_ai_quiz_passes(attempts, chunk_size=250):
+    """
+    record_ai_quiz_pass for a batch of newly passed attempts: one update per
+    `chunk_size` users with counters, and one insert for the counters of users
+    who have none yet, rebuilt from their attempt history.
+    """
+    totals = defaultdict(lambda: [0, 0.0])
+    for attempt in attempts:
+        totals[attempt.user_id][0] += 1
+        totals[attempt.user_id][1] += attempt.score
+    if not totals:
+        return
+    counted = set(UserRewardCounter.objects.filter(user_id__in=totals).values_list('user_id', flat=True))
+    for user_ids in _chunked(sorted(counted), chunk_size):
+        UserRewardCounter.objects.filter(user_id__in=user_ids).update(
+            ai_quizzes_passed=F('ai_quizzes_passed') + Case(
+                *[When(user_id=user_id, then=Value(totals[user_id][0])) for user_id in user_ids],
+                output_field=PositiveIntegerField(),
+            ),
+            ai_quiz_passed_score_total=F('ai_quiz_passed_score_total') + Case(
+                *[When(user_id=user_id, then=Value(totals[user_id][1])) for user_id in user_ids],
+                output_field=FloatField(),
+            ),
+        )
+    uncounted = set(totals) - counted
+    if uncounted:
+        UserRewardCounter.objects.bulk_create([
+            UserRewardCounter(user_id=row['user_id'], ai_quizzes_passed=row['passed'], ai_quiz_passed_score_total=row['score_total'])
+            for row in AILessonQuizAttempt.objects.filter(user_id__in=uncounted, passed=True).order_by().values('user_id').annotate(
+                passed=Count('id'), score_total=Sum('score')
             )
+        ], ignore_conflicts=True)
 
-# --- Reward Criteria Check Functions ---
+# --- AI Quiz Cooldowns ---
+
+# A failed AI quiz can be attempted again after this long.
+AI_QUIZ_REATTEMPT_DELAY = timedelta(hours=2)
+
+
+def get_ai_quiz_reattempt_at(user, lesson_id):
+    """Returns when the user may attempt the lesson's AI quiz again, or None if they may now."""
+    if lesson_id is None:
+        return None
+    return AIQuizCooldown.objects.filter(
+        user=user, lesson_id=lesson_id, available_at__gt=timezone.now()
+    ).values_list('available_at', flat=True).first()
+
+
+def lock_ai_quiz_cooldown(user, lesson_id):
+    """
+    get_ai_quiz_reattempt_at for a new attempt: call it inside transaction.atomic()
+    and write the attempt in the same transaction. The user's cooldown row for
+    the lesson (added, already expired, when they have none) stays locked until
+    the transaction ends, so a concurrent attempt waits and then sees the
+    cooldown this one leaves behind.
+    """
+    if lesson_id is None:
+        return None
+    now = timezone.now()
+    AIQuizCooldown.objects.bulk_create(
+        [AIQuizCooldown(user=user, lesson_id=lesson_id, available_at=now)], ignore_conflicts=True
+    )
+    available_at = AIQuizCooldown.objects.select_for_update().filter(
+        user=user, lesson_id=lesson_id
+    ).values_list('available_at', flat=True).get()
+    return available_at if available_at > now else None
 
-def check_study_streak(user, required_days, required_minutes):
-    """Checks for an uninterrupted study streak of `required_days` with at least `required_minutes` each day."""
-    today = timezone.now().date()
-    for i in range(required_days):
-        check_date = today - timedelta(days=i)
-        try:
-            activity = UserDailyActivity.objects.get(user=user, date=check_date)
-            if activity.study_duration_minutes < required_minutes:
-                return False
-        except UserDailyActivity.DoesNotExist:
-            return False
-    return True
 
-def check_perfect_attendance(user):
-    """Checks if the user has 95% attendance for the year-to-date."""
+def get_subject_ai_quiz_cooldowns(user, subject_id):
+    """Returns [(lesson_id, reattempt_at or None)] for every lesson of the subject, in lesson order, from one query."""
+    return list(Lesson.objects.filter(subject_id=subject_id).order_by('lesson_order', 'id').annotate(
+        reattempt_at=Subquery(AIQuizCooldown.objects.filter(
+            user=user, lesson=OuterRef('pk'), available_at__gt=timezone.now()
+        ).values('available_at')[:1])
+    ).values_list('id', 'reattempt_at'))
+
+
+def set_ai_quiz_cooldown(user_id, lesson_id, available_at):
+    """Records the cooldown left by the user's latest attempt at the lesson's AI quiz; None clears it."""
+    if available_at is None:
+        AIQuizCooldown.objects.filter(user_id=user_id, lesson_id=lesson_id).delete()
+    else:
+        AIQuizCooldown.objects.bulk_create(
+            [AIQuizCooldown(user_id=user_id, lesson_id=lesson_id, available_at=available_at)],
+            update_conflicts=True, unique_fields=['user', 'lesson'], update_fields=['available_at'],
+        )
+
+
+def sync_ai_quiz_cooldown(user_id, lesson_id):
+    """Re-reads the cooldown from the latest remaining attempt, e.g. after one was edited or deleted."""
+    latest = AILessonQuizAttempt.objects.filter(user_id=user_id, lesson_id=lesson_id).order_by('-attempted_at').first()
+    set_ai_quiz_cooldown(user_id, lesson_id, latest.can_reattempt_at if latest else None)
+
+# --- Passed Lesson Index ---
+
+def record_lesson_pass(user_id, lesson_id):
+    """Adds a lesson to the user's passed-lesson index and unlocks the lessons it gates."""
+    record_lesson_passes([(user_id, lesson_id)])
+
+
+def record_lesson_passes(passes):
+    """record_lesson_pass for many (user_id, lesson_id) pairs, in the same three queries."""
+    passes = set(passes)
+    if not passes:
+        return
+    UserPassedLesson.objects.bulk_create([
+        UserPassedLesson(user_id=user_id, lesson_id=lesson_id) for user_id, lesson_id in passes
+    ], ignore_conflicts=True)
+    gated = defaultdict(list)
+    for gated_id, gate_id in Lesson.objects.filter(gate_lesson_id__in={lesson_id for _, lesson_id in passes}).values_list('id', 'gate_lesson_id'):
+        gated[gate_id].append(gated_id)
+    UserLessonUnlock.objects.bulk_create([
+        UserLessonUnlock(user_id=user_id, lesson_id=gated_id)
+        for user_id, lesson_id in passes for gated_id in gated[lesson_id]
+    ], ignore_conflicts=True)
+
+
+def forget_lesson_pass(user_id, lesson_id):
+    """Removes a lesson, and the unlocks it gave, from the index once no passing attempt for it remains."""
+    still_passed = (
+        AILessonQuizAttempt.objects.filter(user_id=user_id, lesson_id=lesson_id, passed=True).exists()
+        or UserQuizAttempt.objects.filter(user_id=user_id, quiz__lesson_id=lesson_id, passed=True).exists()
+    )
+    if not still_passed:
+        UserPassedLesson.objects.filter(user_id=user_id, lesson_id=lesson_id).delete()
+        UserLessonUnlock.objects.filter(user_id=user_id, lesson__gate_lesson_id=lesson_id).delete()
+
+
+def get_passed_lesson_ids(user):
+    """Returns the set of lesson ids the user has passed a quiz for."""
+    return set(UserPassedLesson.objects.filter(user=user).values_list('lesson_id', flat=True))
+
+def lesson_locks_apply(user):
+    """Whether lessons can be locked for `user`. Teachers, admins and staff see every lesson."""
+    return not (user.role in ['Teacher', 'Admin'] or user.is_staff)
+
+
+def get_lesson_locks(user, **lesson_filter):
+    """
+    Returns {lesson_id: is_locked} for `user` and every lesson matching
+    `lesson_filter`, read from the lessons' gates and the user's unlocks in one query.
+    """
+    lesson_rows = Lesson.objects.filter(**lesson_filter).order_by().annotate(
+        unlocked=Exists(UserLessonUnlock.objects.filter(user=user, lesson_id=OuterRef('pk')))
+    ).values_list('id', 'gate_lesson_id', 'unlocked')
+    return {
+        lesson_id: gate_lesson_id is not None and not unlocked
+        for lesson_id, gate_lesson_id, unlocked in lesson_rows
+    }
+
+
+def compute_lesson_gates(lesson_rows):
+    """
+    Works out each lesson's gate from (id, subject_id, lesson_order, requires_previous_quiz)
+    rows sorted by subject, order and id: the last lesson of the preceding
+    lesson_order when that lesson requires its quiz, or None when nothing gates it.
+    """
+    gates = {}
+    for _, subject_rows in groupby(lesson_rows, key=itemgetter(1)):
+        previous = None # Last lesson of the preceding lesson_order
+        last_seen = None
+        current_order = None
+        for lesson_id, _, lesson_order, requires_previous_quiz in subject_rows:
+            if lesson_order != current_order:
+                previous, current_order = last_seen, lesson_order
+            last_seen = (lesson_id, requires_previous_quiz)
+            if lesson_order == 0 or previous is None or not previous[1]:
+                gates[lesson_id] = None
+            else:
+                gates[lesson_id] = previous[0]
+    return gates
+
+
+def rebuild_lesson_unlocks(lesson_ids):
+    """
+    Rewrites the unlock rows of `lesson_ids` from their gates and the
+    passed-lesson index, e.g. after their gates changed.
+    """
+    unlocks = UserPassedLesson.objects.filter(lesson__gated_lessons__in=lesson_ids).order_by().values_list(
+        'user_id', 'lesson__gated_lessons'
+    )
+    with transaction.atomic():
+        UserLessonUnlock.objects.filter(lesson_id__in=lesson_ids).delete()
+        UserLessonUnlock.objects.bulk_create([
+            UserLessonUnlock(user_id=user_id, lesson_id=lesson_id) for user_id, lesson_id in unlocks
+        ], batch_size=1000)
+
+# --- Lesson Order Chain ---
+
+def _link_lessons(lessons):
+    """
+    Sets the chain pointers and gates of one subject's `lessons`, given in
+    (lesson_order, id) order. Returns the lessons whose pointers or gate changed
+    and the ids of those whose gate did.
+    """
+    gates = compute_lesson_gates(
+        (lesson.id, lesson.subject_id, lesson.lesson_order, lesson.requires_previous_quiz) for lesson in lessons
+    )
+    changed, regated = [], []
+    for index, lesson in enumerate(lessons):
+        previous_id = lessons[index - 1].id if index > 0 else None
+        next_id = lessons[index + 1].id if index + 1 < len(lessons) else None
+        links = (previous_id, next_id, gates[lesson.id])
+        if (lesson.previous_lesson_id, lesson.next_lesson_id, lesson.gate_lesson_id) != links:
+            if lesson.gate_lesson_id != gates[lesson.id]:
+                regated.append(lesson.id)
+            lesson.previous_lesson_id, lesson.next_lesson_id, lesson.gate_lesson_id = links
+            changed.append(lesson)
+    return changed, regated
+
+
+def relink_subject_lessons(subject_id):
+    """
+    Points each of the subject's lessons at its neighbours in (lesson_order, id)
+    order and at its gate, writing only the lessons whose pointers changed and
+    rebuilding the unlocks of those whose gate did. Returns how many changed.
+    """
+    lessons = list(Lesson.objects.filter(subject_id=subject_id).order_by('lesson_order', 'id').only(
+        'id', 'subject_id', 'lesson_order', 'requires_previous_quiz', 'previous_lesson_id', 'next_lesson_id',
+        'gate_lesson_id'
+    ))
+    changed, regated = _link_lessons(lessons)
+    with transaction.atomic():
+        Lesson.objects.bulk_update(changed, ['previous_lesson', 'next_lesson', 'gate_lesson'])
+        if regated:
+            rebuild_lesson_unlocks(regated)
+    return len(changed)
+
+
+def reorder_subject_lessons(subject_id, lesson_ids):
+    """
+    Puts the subject's lessons in the order of `lesson_ids`, which must name
+    each of them once, numbering them from 1. Orders, pointers and gates are
+    written with one bulk_update. Returns the lessons in their new order.
+    """
+    lessons = Lesson.objects.filter(subject_id=subject_id).only(
+        'id', 'subject_id', 'lesson_order', 'requires_previous_quiz', 'previous_lesson_id', 'next_lesson_id',
+        'gate_lesson_id'
+    ).in_bulk()
+    if len(lesson_ids) != len(set(lesson_ids)) or set(lesson_ids) != set(lessons):
+        raise ValueError("lesson_ids must list every lesson of the subject exactly once.")
+
+    ordered = [lessons[lesson_id] for lesson_id in lesson_ids]
+    for index, lesson in enumerate(ordered):
+        lesson.lesson_order = index + 1
+    _, regated = _link_lessons(ordered)
+    with transaction.atomic():
+        Lesson.objects.bulk_update(ordered, ['lesson_order', 'previous_lesson', 'next_lesson', 'gate_lesson'])
+        if regated:
+            rebuild_lesson_unlocks(regated)
+    return ordered
+
+# --- Subject Completion Aggregates ---
+
+def get_subject_completion(user, subject_id):
+    """Returns the user's completion row for a subject, or None if they haven't completed any of it."""
+    return UserSubjectCompletion.objects.filter(user=user, subject_id=subject_id).first()
+
+
+def record_lesson_completion_change(user_id, subject_id, delta):
+    """Applies a +1/-1 change in completed lessons to the user's subject aggregate."""
+    completions = UserSubjectCompletion.objects.filter(user_id=user_id, subject_id=subject_id)
+    if delta < 0:
+        completions = completions.filter(completed_lessons__gt=0)
+    if not completions.update(completed_lessons=F('completed_lessons') + delta) and delta > 0:
+        rebuild_user_subject_completion(user_id, subject_id)
+
+
+def rebuild_user_subject_completion(user_id, subject_id):
+    """Recomputes one user's completion aggregate for a subject from their lesson progress."""
+    completion, _ = UserSubjectCompletion.objects.update_or_create(
+        user_id=user_id,
+        subject_id=subject_id,
+        defaults={
+            'total_lessons': Lesson.objects.filter(subject_id=subject_id).count(),
+            'completed_lessons': UserLessonProgress.objects.filter(user_id=user_id, lesson__subject_id=subject_id, completed=True).count(),
+        }
+    )
+    return completion
+
+
+def adjust_subject_lesson_total(subject_id, delta):
+    """Applies a lesson being added to or removed from a subject to every user's aggregate for it."""
+    completions = UserSubjectCompletion.objects.filter(subject_id=subject_id)
+    if delta < 0:
+        completions = completions.filter(total_lessons__gt=0)
+    completions.update(total_lessons=F('total_lessons') + delta)
+
+
+def rebuild_subject_completions(subject_id):
+    """Recomputes every user's completion aggregate for a subject in bulk."""
+    total_lessons = Lesson.objects.filter(subject_id=subject_id).count()
+    completed_counts = UserLessonProgress.objects.filter(lesson__subject_id=subject_id, completed=True).values('user_id').annotate(
+        completed_lessons=Count('id')
+    )
+    with transaction.atomic():
+        UserSubjectCompletion.objects.filter(subject_id=subject_id).delete()
+        UserSubjectCompletion.objects.bulk_create([
+            UserSubjectCompletion(user_id=row['user_id'], subject_id=subject_id, completed_lessons=row['completed_lessons'], total_lessons=total_lessons)
+            for row in completed_counts
+        ], batch_size=1000)
+
+# --- Curriculum Querysets ---
+
+# Lesson columns worth leaving out of the query when they aren't rendered.
+LESSON_TEXT_COLUMNS = ('content', 'simplified_content')
+
+
+def lesson_tree_queryset(wants=None):
+    """
+    Lessons with everything LessonSerializer nests loaded up front, for use as a
+    prefetch. `wants`, when given, tells whether a LessonSerializer field path is
+    rendered; nested objects and text columns that aren't are not loaded.
+    """
+    if wants is None:
+        wants = lambda path: True
+    lessons = Lesson.objects.select_related('subject').defer(
+        *[column for column in LESSON_TEXT_COLUMNS if not wants(column)]
+    )
+    if wants('quiz') or wants('has_quiz'):
+        lessons = lessons.select_related('quiz')
+        if wants('quiz.questions'):
+            lessons = lessons.prefetch_related('quiz__questions__choices')
+    if wants('ai_summary'):
+        lessons = lessons.select_related('ai_summary')
+    if wants('translations'):
+        lessons = lessons.prefetch_related('translations')
+    return lessons
+
+
+def lesson_summary_queryset():
+    """Lessons for LessonSummarySerializer: no text columns, and whether each has a quiz from the same query."""
+    return Lesson.objects.select_related('subject').defer(*LESSON_TEXT_COLUMNS).annotate(
+        quiz_exists=Exists(Quiz.objects.filter(lesson=OuterRef('pk')))
+    )
+
+
+def annotate_subject_progress(subjects, user):
+    """
+    Annotates `subjects` with the user's completed and total lesson counts
+    (progress_completed_lessons, progress_total_lessons) from their completion
+    aggregates, joined into the same query.
+    """
+    if not user or not user.is_authenticated:
+        return subjects
+    return subjects.annotate(
+        user_completion=FilteredRelation('user_completions', condition=Q(user_completions__user=user)),
+        progress_completed_lessons=F('user_completion__completed_lessons'),
+        progress_total_lessons=F('user_completion__total_lessons'),
+    )
+
+
+def prefetch_class_tree(classes, user):
+    """Prefetches the subjects (with the user's progress) and lessons that ClassSerializer nests."""
+    return classes.prefetch_related(
+        Prefetch('subjects', queryset=annotate_subject_progress(Subject.objects.select_related('master_class'), user)),
+        Prefetch('subjects__lessons', queryset=lesson_summary_queryset()),
+    )
+
+# --- Criteria Metric Sources ---
+# One loader per source. Each returns the metrics of its source for one user,
+# plus whatever progress text needs, from a single query.
+
+def _load_study_streak(user, min_minutes):
+    return {'STUDY_STREAK_DAYS': get_study_streak(user, min_minutes)}
+
+
+def _load_attendance(user):
     today = timezone.now().date()
-    # This check could be resource-intensive, maybe run it less often or only at year end.
-    # For MVP, we'll allow it on any login.
-    year_start = today.replace(month=1, day=1)
-    total_days_in_year = (today - year_start).days + 1
-    
-    present_days = UserDailyActivity.objects.filter(
-        user=user, 
-        date__year=today.year, 
-        present=True
-    ).count()
-
-    if total_days_in_year == 0:
-        return False
-    
-    attendance_percentage = (present_days / total_days_in_year) * 100
-    return attendance_percentage >= 95
-
-def check_quiz_master(user):
-    """Checks if the user has a 95% average score across at least 40 passed AI quizzes."""
-    passed_quizzes = AILessonQuizAttempt.objects.filter(user=user, passed=True)
-    if passed_quizzes.count() >= 40:
-        avg_score = passed_quizzes.aggregate(Avg('score'))['score__avg']
-        return avg_score is not None and avg_score >= 95
-    return False
-
-def check_quiz_completion(user):
-    """Checks if the user has passed a quiz for every lesson that has one."""
-    lessons_with_quizzes = Lesson.objects.filter(quiz__isnull=False).values_list('id', flat=True)
-    if not lessons_with_quizzes.exists():
-        return False # No quizzes to complete
-
-    # Check for a passed attempt for each of these lessons
-    for lesson_id in lessons_with_quizzes:
-        if not AILessonQuizAttempt.objects.filter(user=user, lesson_id=lesson_id, passed=True).exists():
-            return False # Missing a passed quiz
-    return True
-
-def check_pioneer_graduate(user):
-    """Checks if the user has completed their first subject."""
-    # This logic assumes 'subject completion' is defined as completing all its lessons.
-    subjects = Subject.objects.filter(master_class__schools_offering=user.school)
-    for subject in subjects:
-        total_lessons = subject.lessons.count()
-        if total_lessons > 0:
-            completed_lessons = UserLessonProgress.objects.filter(user=user, lesson__subject=subject, completed=True).count()
-            if total_lessons == completed_lessons:
-                return True # At least one subject is fully completed
-    return False
+    total_days = days_so_far(today)
+    present_days = get_attendance_year(user, today.year).present_days
+    return {'ATTENDANCE_PERCENTAGE': (present_days / total_days) * 100, 'days': total_days}
+
+
+def _load_ai_quizzes(user, window_days, subject_id):
+    if window_days is None and subject_id is None:
+        counter = get_reward_counter(user)
+        return {'AI_QUIZZES_PASSED': counter.ai_quizzes_passed, 'AI_QUIZ_AVERAGE': counter.ai_quiz_average}
+    totals = _ai_quiz_passes(window_days, subject_id).filter(user=user).aggregate(passed=Count('id'), average=Avg('score'))
+    return {'AI_QUIZZES_PASSED': totals['passed'], 'AI_QUIZ_AVERAGE': totals['average'] or 0.0}
+
+
+def _load_passed_lessons(user, window_days, subject_id):
+    passes = _quiz_lesson_passes(window_days, subject_id).filter(user=user, lesson=OuterRef('pk'))
+    totals = _quiz_lessons(subject_id).aggregate(total=Count('id'), passed=Count('id', filter=Q(Exists(passes))))
+    total, passed = totals['total'], totals['passed']
+    return {
+        'QUIZZES_PASSED': passed,
+        'QUIZZES_PASSED_PERCENTAGE': (passed / total) * 100 if total else 0.0,
+        'quiz_lessons': total,
+    }
+
+
+def _load_subject_completion(user):
+    # A subject counts as completed once all of its lessons are, among the subjects the user's school offers.
+    completed = UserSubjectCompletion.objects.filter(
+        user=user,
+        subject__master_class__schools_offering=user.school,
+        total_lessons__gt=0,
+        completed_lessons__gte=F('total_lessons')
+    ).values('subject_id').distinct().count()
+    return {'SUBJECTS_COMPLETED': completed}
+
+
+METRIC_LOADERS = {
+    'study_streak': _load_study_streak,
+    'attendance': _load_attendance,
+    'ai_quizzes': _load_ai_quizzes,
+    'passed_lessons': _load_passed_lessons,
+    'subject_completion': _load_subject_completion,
+}
+
+
+def _ai_quiz_passes(window_days, subject_id):
+    attempts = AILessonQuizAttempt.objects.filter(passed=True)
+    if window_days:
+        attempts = attempts.filter(attempted_at__gte=timezone.now() - timedelta(days=window_days))
+    if subject_id:
+        attempts = attempts.filter(lesson__subject_id=subject_id)
+    return attempts
+
+
+def _quiz_lessons(subject_id):
+    lessons = Lesson.objects.filter(quiz__isnull=False)
+    if subject_id:
+        lessons = lessons.filter(subject_id=subject_id)
+    return lessons
+
+
+def _quiz_lesson_passes(window_days, subject_id):
+    # Lessons with a quiz count as passed through their AI quiz only, as COMPLETION_CROWN always has;
+    # the regular quiz passes in UserPassedLesson do not earn these rewards.
+    return _ai_quiz_passes(window_days, subject_id).filter(lesson__quiz__isnull=False)
 
 
 # --- Progress Calculation Functions ---
 
 def get_reward_progress(user):
-    """Calculates and returns the progress for all unearned rewards for a user."""
-    earned_reward_ids = UserReward.objects.filter(user=user).values_list('reward_id', flat=True)
-    potential_rewards = Reward.objects.exclude(id__in=earned_reward_ids)
-    
-    progress_data = []
-
-    for reward in potential_rewards:
-        progress = {'reward': reward.id, 'current': 0, 'target': 1, 'text': 'Not started'}
-        
-        if reward.criteria_type in ['WEEK_WARRIOR', 'CONSISTENCY_CHAMPION', 'MASTER_OF_CONSISTENCY']:
-            target_days = {'WEEK_WARRIOR': 7, 'CONSISTENCY_CHAMPION': 14, 'MASTER_OF_CONSISTENCY': 90}[reward.criteria_type]
-            current_streak = get_study_streak_progress(user, 240)
-            progress.update({'current': current_streak, 'target': target_days, 'text': f'{current_streak}/{target_days} days'})
-        
-        elif reward.criteria_type == 'PERFECT_ATTENDANCE_STAR':
-            current_perc, total_days = get_attendance_progress(user)
-            progress.update({'current': current_perc, 'target': 95, 'text': f'{current_perc:.1f}% of {total_days} days'})
-            
-        elif reward.criteria_type == 'QUIZ_MASTER':
-            current_avg, quizzes_passed = get_quiz_master_progress(user)
-            progress.update({'current': quizzes_passed, 'target': 40, 'text': f'{quizzes_passed}/40 quizzes passed (Avg: {current_avg:.1f}%)'})
-
-        elif reward.criteria_type == 'COMPLETION_CROWN':
-            completed, total = get_quiz_completion_progress(user)
-            progress.update({'current': completed, 'target': total, 'text': f'{completed}/{total} quizzes completed'})
-            
-        elif reward.criteria_type == 'PIONEER_GRADUATE':
-             # This is a one-and-done, so progress is 0 until it's 1
-            completed_any_subject = check_pioneer_graduate(user)
-            progress.update({'current': 1 if completed_any_subject else 0, 'target': 1, 'text': 'Complete 1 subject'})
-
-
-        progress_data.append(progress)
-        
+    """
+    Returns the progress for all unearned rewards for a user, served from a
+    per-user snapshot that the events changing it invalidate.
+    """
+    cache_key = REWARD_PROGRESS_CACHE_KEY.format(generation=cache.get(REWARD_PROGRESS_GENERATION_KEY, 0), user_id=user.id)
+    progress_data = cache.get(cache_key)
+    if progress_data is None:
+        progress_data = compute_reward_progress(user)
+        cache.set(cache_key, progress_data, _seconds_until_midnight())
     return progress_data
 
 
-def get_study_streak_progress(user, required_minutes):
-    """Returns the current length of a user's study streak."""
-    streak = 0
-    today = timezone.now().date()
-    while True:
-        check_date = today - timedelta(days=streak)
-        try:
-            activity = UserDailyActivity.objects.get(user=user, date=check_date)
-            if activity.study_duration_minutes < required_minutes:
-                break # Streak broken
-            streak += 1
-        except UserDailyActivity.DoesNotExist:
-            break # Day is missing, so streak is broken
-    return streak
-
-def get_attendance_progress(user):
-    """Returns the current attendance percentage and total days so far."""
-    today = timezone.now().date()
-    year_start = today.replace(month=1, day=1)
-    total_days_so_far = (today - year_start).days + 1
-    
-    present_days = UserDailyActivity.objects.filter(
-        user=user, 
-        date__year=today.year, 
-        present=True
-    ).count()
-    
-    if total_days_so_far == 0: return 0.0, 0
-    
-    return (present_days / total_days_so_far) * 100, total_days_so_far
-
-def get_quiz_master_progress(user):
-    """Returns current quiz average and number of passed quizzes."""
-    passed_quizzes = AILessonQuizAttempt.objects.filter(user=user, passed=True)
-    count = passed_quizzes.count()
-    avg_score = passed_quizzes.aggregate(Avg('score'))['score__avg'] or 0.0
-    return avg_score, count
-
-def get_quiz_completion_progress(user):
-    """Returns number of unique quizzes completed vs. total available."""
-    lessons_with_quizzes = Lesson.objects.filter(quiz__isnull=False).values_list('id', flat=True)
-    total_quizzes = lessons_with_quizzes.count()
-    if total_quizzes == 0:
-        return 0, 40
-        
-    completed_count = AILessonQuizAttempt.objects.filter(
-        user=user, 
-        lesson_id__in=lessons_with_quizzes, 
-        passed=True
-    ).values('lesson_id').distinct().count()
-    
-    return completed_count, total_quizzes
+def compute_reward_progress(user):
+    """Calculates the progress for all unearned active rewards in a single evaluation pass."""
+    evaluation = RewardEvaluation(user)
+    return [evaluation.progress(reward) for reward in Reward.objects.filter(is_active=True, metric__in=METRIC_SOURCES).exclude(user_achievements__user=user)]
+
+
+def invalidate_reward_progress(user_id):
+    """Drops the user's progress snapshot after an event that changes it."""
+    cache.delete(REWARD_PROGRESS_CACHE_KEY.format(generation=cache.get(REWARD_PROGRESS_GENERATION_KEY, 0), user_id=user_id))
+
+
+def invalidate_all_reward_progress():
+    """Drops every user's progress snapshot, e.g. after the reward catalog changes."""
+    try:
+        cache.incr(REWARD_PROGRESS_GENERATION_KEY)
+    except ValueError:
+        cache.set(REWARD_PROGRESS_GENERATION_KEY, 1, None)
+
+
+def _seconds_until_midnight():
+    now = timezone.now()
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return max(int((midnight - now).total_seconds()), 1)
@@ -0,0 +1,260 @@
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from accounts.models import School, SchoolClass, Syllabus, UserDailyActivity
+from .curriculum import bump_curriculum_version
+from .grading import bump_answer_key_version
+from .sections import delete_unused_section_bodies, queue_section_rebuild
+from .models import (
+    AILessonQuizAttempt, AILessonSummary, Choice, Class, Lesson, LessonSection, Question, Quiz, Reward, Subject,
+    TranslatedLessonContent, UserLessonProgress, UserQuizAttempt, UserReward
+)
+from .services import (
+    adjust_ai_quiz_passes, rebuild_reward_counter, record_lesson_pass, forget_lesson_pass,
+    record_lesson_completion_change, rebuild_user_subject_completion,
+    adjust_subject_lesson_total, rebuild_subject_completions,
+    invalidate_reward_progress, invalidate_all_reward_progress, relink_subject_lessons,
+    set_ai_quiz_cooldown, sync_ai_quiz_cooldown
+)
+
+
+# Defined ahead of index_ai_quiz_pass, which resets _loaded_passed.
+
+@receiver(post_save, sender=AILessonQuizAttempt)
+def update_reward_counters_on_ai_quiz_pass(sender, instance, created, **kwargs):
+    if created:
+        was_passed, previous_score = False, 0.0
+    else:
+        was_passed = getattr(instance, '_loaded_passed', None)
+        previous_score = getattr(instance, '_loaded_score', None)
+    if was_passed is None or previous_score is None:
+        # Saved from an instance we didn't load, so the previous state is unknown.
+        rebuild_reward_counter(instance.user)
+    else:
+        adjust_ai_quiz_passes(
+            instance.user, int(instance.passed) - int(was_passed),
+            (instance.score if instance.passed else 0.0) - (previous_score if was_passed else 0.0),
+        )
+    instance._loaded_score = instance.score
+
+
+@receiver(post_delete, sender=AILessonQuizAttempt)
+def update_reward_counters_on_ai_quiz_delete(sender, instance, **kwargs):
+    if instance.passed:
+        adjust_ai_quiz_passes(instance.user, -1, -instance.score)
+
+
+# --- AI quiz cooldowns ---
+
+@receiver(post_save, sender=AILessonQuizAttempt)
+def record_ai_quiz_cooldown(sender, instance, created, **kwargs):
+    if created:
+        set_ai_quiz_cooldown(instance.user_id, instance.lesson_id, instance.can_reattempt_at)
+    else:
+        sync_ai_quiz_cooldown(instance.user_id, instance.lesson_id)
+
+
+@receiver(post_delete, sender=AILessonQuizAttempt)
+def resync_ai_quiz_cooldown(sender, instance, **kwargs):
+    sync_ai_quiz_cooldown(instance.user_id, instance.lesson_id)
+
+
+# --- Passed lesson index ---
+
+def _reindex_lesson_pass(instance, created, lesson_id):
+    was_passed = False if created else getattr(instance, '_loaded_passed', None)
+    if instance.passed and not was_passed:
+        record_lesson_pass(instance.user_id, lesson_id)
+    elif not instance.passed and was_passed is not False:
+        # Passed before, or saved from an instance we didn't load: drop the pass unless another attempt holds it.
+        forget_lesson_pass(instance.user_id, lesson_id)
+    instance._loaded_passed = instance.passed
+
+
+@receiver(post_save, sender=AILessonQuizAttempt)
+def index_ai_quiz_pass(sender, instance, created, **kwargs):
+    _reindex_lesson_pass(instance, created, instance.lesson_id)
+
+
+@receiver(post_save, sender=UserQuizAttempt)
+def index_quiz_pass(sender, instance, created, **kwargs):
+    _reindex_lesson_pass(instance, created, instance.quiz.lesson_id)
+
+
+@receiver(post_delete, sender=AILessonQuizAttempt)
+def unindex_ai_quiz_pass(sender, instance, **kwargs):
+    if instance.passed:
+        forget_lesson_pass(instance.user_id, instance.lesson_id)
+
+
+@receiver(post_delete, sender=UserQuizAttempt)
+def unindex_quiz_pass(sender, instance, **kwargs):
+    if instance.passed:
+        forget_lesson_pass(instance.user_id, instance.quiz.lesson_id)
+
+
+# --- Subject completion aggregates ---
+
+@receiver(post_save, sender=UserLessonProgress)
+def update_subject_completion_on_progress(sender, instance, created, **kwargs):
+    was_completed = False if created else getattr(instance, '_loaded_completed', None)
+    subject_id = instance.lesson.subject_id
+    if was_completed is None:
+        # Saved from an instance we didn't load, so the previous state is unknown.
+        rebuild_user_subject_completion(instance.user_id, subject_id)
+    elif was_completed != instance.completed:
+        record_lesson_completion_change(instance.user_id, subject_id, 1 if instance.completed else -1)
+    instance._loaded_completed = instance.completed
+
+
+@receiver(post_delete, sender=UserLessonProgress)
+def update_subject_completion_on_progress_delete(sender, instance, **kwargs):
+    if instance.completed:
+        subject_id = Lesson.objects.filter(pk=instance.lesson_id).values_list('subject_id', flat=True).first()
+        if subject_id:
+            record_lesson_completion_change(instance.user_id, subject_id, -1)
+
+
+# --- Lesson order chain and gates ---
+# Defined ahead of update_subject_totals_on_lesson_save, which resets _loaded_subject_id.
+
+@receiver(post_save, sender=Lesson)
+def relink_lessons_on_save(sender, instance, created, **kwargs):
+    previous_subject_id = getattr(instance, '_loaded_subject_id', None)
+    previous_order = getattr(instance, '_loaded_lesson_order', None)
+    previously_required = getattr(instance, '_loaded_requires_previous_quiz', None)
+    instance._loaded_lesson_order = instance.lesson_order
+    instance._loaded_requires_previous_quiz = instance.requires_previous_quiz
+    if not created and (previous_order, previous_subject_id, previously_required) == (
+        instance.lesson_order, instance.subject_id, instance.requires_previous_quiz
+    ):
+        return
+    relinked = relink_subject_lessons(instance.subject_id)
+    if previous_subject_id and previous_subject_id != instance.subject_id:
+        relinked += relink_subject_lessons(previous_subject_id)
+    if relinked:
+        bump_curriculum_version() # bulk_update sends no signals of its own
+
+
+@receiver(post_delete, sender=Lesson)
+def relink_lessons_on_delete(sender, instance, **kwargs):
+    if relink_subject_lessons(instance.subject_id):
+        bump_curriculum_version()
+
+
+@receiver(post_save, sender=Lesson)
+def update_subject_totals_on_lesson_save(sender, instance, created, **kwargs):
+    previous_subject_id = getattr(instance, '_loaded_subject_id', None)
+    if created:
+        adjust_subject_lesson_total(instance.subject_id, 1)
+    elif previous_subject_id and previous_subject_id != instance.subject_id:
+        rebuild_subject_completions(previous_subject_id)
+        rebuild_subject_completions(instance.subject_id)
+    instance._loaded_subject_id = instance.subject_id
+
+
+@receiver(post_delete, sender=Lesson)
+def update_subject_totals_on_lesson_delete(sender, instance, **kwargs):
+    adjust_subject_lesson_total(instance.subject_id, -1)
+
+
+# --- Reward progress snapshot invalidation ---
+
+@receiver(post_save, sender=AILessonQuizAttempt)
+@receiver(post_delete, sender=AILessonQuizAttempt)
+@receiver(post_save, sender=UserQuizAttempt)
+@receiver(post_delete, sender=UserQuizAttempt)
+@receiver(post_save, sender=UserLessonProgress)
+@receiver(post_delete, sender=UserLessonProgress)
+@receiver(post_save, sender=UserDailyActivity)
+@receiver(post_save, sender=UserReward)
+@receiver(post_delete, sender=UserReward)
+def invalidate_user_reward_progress(sender, instance, **kwargs):
+    invalidate_reward_progress(instance.user_id)
+
+
+@receiver(post_save, sender=Reward)
+@receiver(post_delete, sender=Reward)
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_save, sender=Quiz)
+@receiver(post_delete, sender=Quiz)
+def invalidate_all_users_reward_progress(sender, **kwargs):
+    invalidate_all_reward_progress()
+
+
+# --- Curriculum cache invalidation ---
+
+@receiver(post_save, sender=Class)
+@receiver(post_delete, sender=Class)
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_save, sender=Quiz)
+@receiver(post_delete, sender=Quiz)
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+@receiver(post_save, sender=TranslatedLessonContent)
+@receiver(post_delete, sender=TranslatedLessonContent)
+@receiver(post_save, sender=AILessonSummary)
+@receiver(post_delete, sender=AILessonSummary)
+@receiver(post_save, sender=Syllabus)
+@receiver(post_delete, sender=Syllabus)
+@receiver(post_save, sender=School)
+@receiver(post_delete, sender=School)
+@receiver(post_save, sender=SchoolClass)
+@receiver(post_delete, sender=SchoolClass)
+def invalidate_curriculum_cache(sender, **kwargs):
+    bump_curriculum_version()
+
+
+# --- Quiz answer keys ---
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_answer_key_on_question_change(sender, instance, **kwargs):
+    bump_answer_key_version(instance.quiz_id)
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def invalidate_answer_key_on_choice_change(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, (Question, Quiz)) or getattr(origin, 'model', None) in (Question, Quiz):
+        return # Deleted along with its question or quiz, whose own receivers retire the key.
+    if Choice.question.is_cached(instance):
+        quiz_id = instance.question.quiz_id
+    else:
+        quiz_id = Question.objects.filter(pk=instance.question_id).values_list('quiz_id', flat=True).first()
+    if quiz_id:
+        bump_answer_key_version(quiz_id)
+
+
+# --- Lesson sections ---
+
+@receiver(post_save, sender=Lesson)
+def rebuild_sections_on_lesson_save(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and 'content' not in update_fields:
+        return
+    loaded_content = getattr(instance, '_loaded_content', None)
+    if created or loaded_content is None or loaded_content != instance.content:
+        queue_section_rebuild(instance.id)
+    instance._loaded_content = instance.content
+
+
+@receiver(post_save, sender=TranslatedLessonContent)
+@receiver(post_delete, sender=TranslatedLessonContent)
+def rebuild_sections_on_translation_change(sender, instance, **kwargs):
+    queue_section_rebuild(instance.lesson_id, instance.language_code)
+
+
+@receiver(pre_delete, sender=Lesson)
+def remember_section_bodies_on_lesson_delete(sender, instance, **kwargs):
+    instance._section_body_ids = set(LessonSection.objects.filter(lesson=instance).values_list('body_id', flat=True))
+
+
+@receiver(post_delete, sender=Lesson)
+def delete_section_bodies_on_lesson_delete(sender, instance, **kwargs):
+    # The sections went with the lesson; bodies shared with other lessons stay.
+    delete_unused_section_bodies(getattr(instance, '_section_body_ids', set()))
@@ -1,3 +1,1537 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from stepwise_backend.fieldsets import parse_field_paths
+
+from accounts.models import CustomUser, RecentActivity, Syllabus, UserDailyActivity
+from accounts.services import DEFAULT_STREAK_MINUTES, rebuild_study_streak
+from jobs.models import Job
+from jobs.queue import run_pending_jobs
+from .authoring import save_quiz_questions
+from .curriculum import get_class_trees, get_curriculum_version
+from .exams import FLUSH_EXAM_SUBMISSIONS_JOB, flush_exam_submissions
+from .grading import get_answer_key, grade_answers, score_answers
+from .item_analysis import quiz_item_statistics
+from .models import (
+    AILessonQuizAttempt, AIQuizCooldown, Choice, Class, ExamSubmission, Lesson, Question, Quiz, QuizAnswer, Reward,
+    SectionBody, Subject, UserLessonProgress, UserLessonUnlock, UserPassedLesson, UserQuizAttempt, UserRewardCounter
+)
+from .question_bank import import_question_bank
+from .sections import REBUILD_SECTIONS_JOB, delete_unused_section_bodies, rebuild_lesson_sections
+from .serializers import ClassSerializer
+from .services import (
+    EVALUATE_REWARDS_JOB, check_and_award_rewards, eligible_user_ids, get_lesson_locks, get_reward_progress,
+    get_subject_completion, prefetch_class_tree, rebuild_reward_counter
+)
+
+# The configured cache is shared with the running server (see settings.CACHES),
+# so tests get a cache of their own: they neither clear the server's nor read its entries.
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'}}
+
+# Query and wall-time ceilings for the reward engine. Raise a budget only
+# together with the change that needs it, and say why in the commit.
+BUDGETS_PATH = Path(__file__).resolve().parent / 'reward_budgets.json'
+
+# When set, the measurements of a run are written to this path as JSON.
+REPORT_ENV_VAR = 'REWARD_BENCHMARK_REPORT'
+
+# Wall time depends on the machine running the suite, so the seconds budgets
+# are only enforced when this is set (e.g. on a dedicated benchmark runner).
+# Query budgets always are.
+TIME_BUDGETS_ENV_VAR = 'BENCHMARK_TIME_BUDGETS'
+
+# Query and wall-time ceilings for exam-mode submissions, per request and per flush.
+EXAM_BUDGETS_PATH = Path(__file__).resolve().parent / 'exam_budgets.json'
+
+# Days of activity history per seeded student.
+HISTORY_DAYS = (1, 30, 90, 365)
+AI_ATTEMPTS_PER_STUDENT = 300
+QUIZ_ATTEMPTS_PER_STUDENT = 120
+LESSON_COUNT = 40
+
+# Students handing in the exam at the same moment, and the share of them whose client retries.
+EXAM_STUDENTS = 500
+EXAM_RETRY_EVERY = 10
+EXAM_QUESTIONS = 10
+
+
+def assertWithinSeconds(test, elapsed, budget, message):
+    """Holds a wall-time measurement to its budget when TIME_BUDGETS_ENV_VAR is set."""
+    if os.environ.get(TIME_BUDGETS_ENV_VAR):
+        test.assertLessEqual(elapsed, budget, message)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RewardEngineBenchmarkTests(TestCase):
+    """
+    Measures `check_and_award_rewards` under each trigger and `get_reward_progress`
+    for students with 1 to 365 days of history, and fails when a measurement goes
+    over its budget in reward_budgets.json (wall time only with TIME_BUDGETS_ENV_VAR set). Every student is held to the same
+    budget, so a query that grows with a student's history fails the suite.
+    """
+
+    measurements = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        for criteria_type, category in (
+            ('WEEK_WARRIOR', 'Study Habits'),
+            ('CONSISTENCY_CHAMPION', 'Study Habits'),
+            ('MASTER_OF_CONSISTENCY', 'Study Habits'),
+            ('PERFECT_ATTENDANCE_STAR', 'Attendance'),
+            ('QUIZ_MASTER', 'Academic Performance'),
+            ('COMPLETION_CROWN', 'Progression'),
+            ('PIONEER_GRADUATE', 'Progression'),
+        ):
+            Reward.objects.create(
+                title=criteria_type.replace('_', ' ').title(), description=criteria_type,
+                icon='rewards_icons/benchmark.png', category=category, criteria_type=criteria_type
+            )
+
+        syllabus = Syllabus.objects.create(name='Benchmark Syllabus')
+        master_class = Class.objects.create(syllabus=syllabus, name='Class 5')
+        subject = Subject.objects.create(master_class=master_class, name='Science')
+        cls.lessons = [
+            Lesson.objects.create(subject=subject, title=f'Lesson {order}', content='...', lesson_order=order)
+            for order in range(1, LESSON_COUNT + 1)
+        ]
+        cls.quizzes = [Quiz.objects.create(lesson=lesson, title=f'{lesson.title} Quiz') for lesson in cls.lessons]
+
+        today = timezone.now().date()
+        cls.students = {}
+        for days in HISTORY_DAYS:
+            student = CustomUser.objects.create_user(
+                username=f'student_{days}d', email=f'student_{days}d@example.com', password='benchmark'
+            )
+            for offset in range(days):
+                UserDailyActivity.objects.create(
+                    user=student, date=today - timedelta(days=offset),
+                    study_duration_minutes=DEFAULT_STREAK_MINUTES, present=offset % 20 != 0
+                )
+            rebuild_study_streak(student, DEFAULT_STREAK_MINUTES)
+
+            for index in range(AI_ATTEMPTS_PER_STUDENT):
+                # Every lesson gets at least one passing AI attempt, which COMPLETION_CROWN needs.
+                score = 96.0 if index % 7 else 60.0
+                AILessonQuizAttempt.objects.create(
+                    user=student, lesson=cls.lessons[index % LESSON_COUNT],
+                    score=score, passed=score >= 70, quiz_data={}
+                )
+            for index in range(QUIZ_ATTEMPTS_PER_STUDENT):
+                score = 90.0 if index % 3 else 40.0
+                UserQuizAttempt.objects.create(
+                    user=student, quiz=cls.quizzes[index % LESSON_COUNT], score=score, passed=score >= 70
+                )
+            for lesson in cls.lessons[:LESSON_COUNT // 2]:
+                UserLessonProgress.objects.create(user=student, lesson=lesson, completed=True)
+            cls.students[days] = student
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.budgets = json.loads(BUDGETS_PATH.read_text())
+
+    @classmethod
+    def tearDownClass(cls):
+        report_path = os.environ.get(REPORT_ENV_VAR)
+        if report_path:
+            Path(report_path).write_text(json.dumps(cls.measurements, indent=2, sort_keys=True))
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+
+    def measure(self, name, func):
+        """Runs `func` once per seeded student and checks the query count and wall time against the budget."""
+        for days, student in self.students.items():
+            # A fresh instance per run, so nothing cached on the user carries over.
+            user = CustomUser.objects.get(pk=student.pk)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                func(user)
+                elapsed = time.perf_counter() - started
+            self.measurements.setdefault(name, {})[f'{days}d'] = {
+                'queries': len(queries), 'seconds': round(elapsed, 4)
+            }
+
+            with self.subTest(benchmark=name, history_days=days):
+                self.assertLessEqual(
+                    len(queries), self.budgets['queries'][name],
+                    f"{name} ran {len(queries)} queries for {days} days of history:\n"
+                    + '\n'.join(query['sql'] for query in queries.captured_queries)
+                )
+                assertWithinSeconds(
+                    self, elapsed, self.budgets['seconds'][name],
+                    f"{name} took {elapsed:.3f}s for {days} days of history."
+                )
+
+    def test_login_trigger(self):
+        self.measure('check_and_award_rewards:LOGIN', lambda user: check_and_award_rewards(user, 'LOGIN'))
+
+    def test_quiz_passed_trigger(self):
+        self.measure('check_and_award_rewards:QUIZ_PASSED', lambda user: check_and_award_rewards(user, 'QUIZ_PASSED'))
+
+    def test_lesson_completed_trigger(self):
+        self.measure(
+            'check_and_award_rewards:LESSON_COMPLETED', lambda user: check_and_award_rewards(user, 'LESSON_COMPLETED')
+        )
+
+    def test_repeat_login_trigger(self):
+        """The common case: a student logging in again with nothing new to earn."""
+        for student in self.students.values():
+            check_and_award_rewards(student, 'LOGIN')
+        self.measure('check_and_award_rewards:LOGIN:repeat', lambda user: check_and_award_rewards(user, 'LOGIN'))
+
+    def test_reward_progress(self):
+        self.measure('get_reward_progress', get_reward_progress)
+
+    def test_cached_reward_progress(self):
+        for student in self.students.values():
+            get_reward_progress(student)
+        self.measure('get_reward_progress:cached', get_reward_progress)
+
+    def test_awards_expected_rewards(self):
+        """Guards the seeded data: the benchmarks are only meaningful if the checks actually pass."""
+        awarded = {
+            reward.criteria_type for reward in check_and_award_rewards(self.students[365], 'LOGIN')
+        }
+        self.assertEqual(awarded, {'WEEK_WARRIOR', 'CONSISTENCY_CHAMPION', 'MASTER_OF_CONSISTENCY'})
+        awarded = {
+            reward.criteria_type for reward in check_and_award_rewards(self.students[365], 'QUIZ_PASSED')
+        }
+        self.assertEqual(awarded, {'QUIZ_MASTER', 'COMPLETION_CROWN'})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ExamSubmissionBenchmarkTests(TestCase):
+    """
+    Simulates a class of 500 students handing in the same quiz at once in exam
+    mode: every submission (and a retry from every tenth client) arrives before
+    any worker runs, then one flush writes the attempts. Every request is held
+    to the same per-request budget in exam_budgets.json, so a query that grows
+    with the number of waiting submissions fails the suite; the flush of all
+    500 has a budget of its own.
+    """
+
+    measurements = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        syllabus = Syllabus.objects.create(name='Exam Syllabus')
+        master_class = Class.objects.create(syllabus=syllabus, name='Class 6')
+        subject = Subject.objects.create(master_class=master_class, name='Mathematics')
+        cls.lesson = Lesson.objects.create(subject=subject, title='Fractions', content='...', lesson_order=1)
+        cls.next_lesson = Lesson.objects.create(
+            subject=subject, title='Decimals', content='...', lesson_order=2, requires_previous_quiz=True
+        )
+        cls.quiz = Quiz.objects.create(lesson=cls.lesson, title='Fractions Exam')
+        cls.other_quiz = Quiz.objects.create(lesson=cls.next_lesson, title='Decimals Exam')
+        cls.questions = []
+        for number in range(EXAM_QUESTIONS):
+            question = Question.objects.create(quiz=cls.quiz, text=f'Question {number}')
+            right = Choice.objects.create(question=question, text='Right', is_correct=True)
+            wrong = Choice.objects.create(question=question, text='Wrong', is_correct=False)
+            cls.questions.append((question.id, right.id, wrong.id))
+
+        CustomUser.objects.bulk_create([
+            CustomUser(username=f'examinee_{index}', email=f'examinee_{index}@example.com', role='Student')
+            for index in range(EXAM_STUDENTS)
+        ])
+        cls.students = list(CustomUser.objects.filter(username__startswith='examinee_').order_by('id'))
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.budgets = json.loads(EXAM_BUDGETS_PATH.read_text())
+
+    @classmethod
+    def tearDownClass(cls):
+        report_path = os.environ.get(REPORT_ENV_VAR)
+        if report_path:
+            Path(report_path).with_suffix('.exam.json').write_text(json.dumps(cls.measurements, indent=2, sort_keys=True))
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def answers(self, index):
+        """Students get index % (EXAM_QUESTIONS + 1) questions right, so some pass and some fail."""
+        right_count = index % (EXAM_QUESTIONS + 1)
+        return [
+            {'question_id': question_id, 'choice_id': right_id if number < right_count else wrong_id}
+            for number, (question_id, right_id, wrong_id) in enumerate(self.questions)
+        ]
+
+    def request(self, name, student, url, data, key):
+        """Posts as `student` with an Idempotency-Key and records the query count and wall time."""
+        self.client.force_authenticate(student)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+            elapsed = time.perf_counter() - started
+        measurement = self.measurements.setdefault(name, {'queries': 0, 'seconds': 0.0})
+        measurement['queries'] = max(measurement['queries'], len(queries))
+        measurement['seconds'] = round(max(measurement['seconds'], elapsed), 4)
+        return response, queries
+
+    def flush(self, name):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            recorded = flush_exam_submissions()
+            elapsed = time.perf_counter() - started
+        self.measurements[name] = {'queries': len(queries), 'seconds': round(elapsed, 4)}
+        return recorded, queries, elapsed
+
+    def assertWithinBudget(self, name, queries, elapsed=None):
+        self.assertLessEqual(
+            len(queries), self.budgets['queries'][name],
+            f"{name} ran {len(queries)} queries:\n" + '\n'.join(query['sql'] for query in queries.captured_queries)
+        )
+        if elapsed is not None:
+            assertWithinSeconds(self, elapsed, self.budgets['seconds'][name], f"{name} took {elapsed:.3f}s.")
+
+    def test_simultaneous_quiz_submissions(self):
+        url = f'/api/quizzes/{self.quiz.id}/submit_quiz/'
+        for index, student in enumerate(self.students):
+            response, queries = self.request('submit_quiz:exam', student, url, {'answers': self.answers(index)}, f'exam-{index}')
+            self.assertEqual(response.status_code, 202)
+            self.assertWithinBudget('submit_quiz:exam', queries)
+        for index, student in enumerate(self.students[::EXAM_RETRY_EVERY]):
+            index *= EXAM_RETRY_EVERY
+            response, queries = self.request(
+                'submit_quiz:exam:retry', student, url, {'answers': self.answers(index)}, f'exam-{index}'
+            )
+            self.assertEqual(response.status_code, 202)
+            self.assertWithinBudget('submit_quiz:exam:retry', queries)
+
+        self.assertFalse(UserQuizAttempt.objects.exists())
+        self.assertEqual(Job.objects.filter(kind=FLUSH_EXAM_SUBMISSIONS_JOB).count(), 1)
+        for name in ('submit_quiz:exam', 'submit_quiz:exam:retry'):
+            assertWithinSeconds(self, self.measurements[name]['seconds'], self.budgets['seconds'][name], f"{name} took too long.")
+
+        recorded, queries, elapsed = self.flush('flush_exam_submissions:quiz')
+        self.assertEqual(recorded, EXAM_STUDENTS)
+        self.assertWithinBudget('flush_exam_submissions:quiz', queries, elapsed)
+
+        attempts = UserQuizAttempt.objects.filter(quiz=self.quiz)
+        self.assertEqual(attempts.count(), EXAM_STUDENTS)
+        self.assertEqual(attempts.values('user').distinct().count(), EXAM_STUDENTS)
+        self.assertEqual(QuizAnswer.objects.count(), EXAM_STUDENTS * EXAM_QUESTIONS)
+        passed = [index for index in range(EXAM_STUDENTS) if index % (EXAM_QUESTIONS + 1) >= 7]
+        self.assertEqual(attempts.filter(passed=True).count(), len(passed))
+        self.assertEqual(UserPassedLesson.objects.filter(lesson=self.lesson).count(), len(passed))
+        self.assertEqual(UserLessonUnlock.objects.filter(lesson=self.next_lesson).count(), len(passed))
+        submission = ExamSubmission.objects.get(user=self.students[7], idempotency_key='exam-7')
+        self.assertEqual(submission.quiz_attempt.completed_at, submission.submitted_at)
+        self.assertEqual(submission.quiz_attempt.score, 70.0)
+
+        # A retry after the flush gets the written attempt back.
+        response, _ = self.request('submit_quiz:exam:retry', self.students[7], url, {'answers': []}, 'exam-7')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['quiz_attempt'], submission.quiz_attempt_id)
+        self.assertEqual(UserQuizAttempt.objects.count(), EXAM_STUDENTS)
+
+    def test_simultaneous_ai_quiz_submissions(self):
+        for index, student in enumerate(self.students):
+            score = 40.0 if index % 4 == 0 else 90.0
+            data = {'lesson': self.lesson.id, 'lesson_id': self.lesson.id, 'score': score, 'passed': score >= 70, 'quiz_data': {'index': index}}
+            response, queries = self.request('ai_quiz_attempt:exam', student, '/api/ai-quiz-attempts/', data, f'ai-{index}')
+            self.assertEqual(response.status_code, 202, response.data)
+            self.assertWithinBudget('ai_quiz_attempt:exam', queries)
+            if index % EXAM_RETRY_EVERY == 0:
+                response, _ = self.request('ai_quiz_attempt:exam', student, '/api/ai-quiz-attempts/', data, f'ai-{index}')
+                self.assertEqual(response.status_code, 202)
+        assertWithinSeconds(
+            self, self.measurements['ai_quiz_attempt:exam']['seconds'], self.budgets['seconds']['ai_quiz_attempt:exam'],
+            "ai_quiz_attempt:exam took too long."
+        )
+        self.assertFalse(RecentActivity.objects.exists())
+
+        # A failed submission starts the cooldown before its attempt is written.
+        self.client.force_authenticate(self.students[0])
+        response = self.client.post('/api/ai-quiz-attempts/', {
+            'lesson': self.lesson.id, 'lesson_id': self.lesson.id, 'score': 95.0, 'passed': True, 'quiz_data': {}
+        }, format='json', HTTP_IDEMPOTENCY_KEY='ai-again')
+        self.assertEqual(response.status_code, 403)
+
+        recorded, queries, elapsed = self.flush('flush_exam_submissions:ai_quiz')
+        self.assertEqual(recorded, EXAM_STUDENTS)
+        self.assertWithinBudget('flush_exam_submissions:ai_quiz', queries, elapsed)
+
+        passed_count = EXAM_STUDENTS - len(range(0, EXAM_STUDENTS, 4))
+        self.assertEqual(AILessonQuizAttempt.objects.count(), EXAM_STUDENTS)
+        self.assertEqual(RecentActivity.objects.filter(activity_type='Quiz').count(), EXAM_STUDENTS)
+        self.assertEqual(UserPassedLesson.objects.filter(lesson=self.lesson).count(), passed_count)
+        self.assertEqual(
+            sorted(UserRewardCounter.objects.values_list('ai_quizzes_passed', flat=True).distinct()), [1]
+        )
+        self.assertEqual(UserRewardCounter.objects.count(), passed_count)
+        self.assertEqual(Job.objects.filter(kind=EVALUATE_REWARDS_JOB).count(), passed_count)
+        failed = AILessonQuizAttempt.objects.get(user=self.students[0])
+        self.assertEqual(failed.can_reattempt_at, failed.attempted_at + timedelta(hours=2))
+
+    def test_submissions_are_written_by_the_workers(self):
+        self.client.force_authenticate(self.students[10])
+        url = f'/api/quizzes/{self.quiz.id}/submit_quiz/'
+        response = self.client.post(url, {'answers': self.answers(10)}, format='json', HTTP_IDEMPOTENCY_KEY='worker')
+        self.assertEqual(response.status_code, 202)
+
+        Job.objects.update(run_after=timezone.now())
+        run_pending_jobs()
+        attempt = UserQuizAttempt.objects.get(user=self.students[10])
+        self.assertEqual(attempt.score, 100.0)
+        self.assertFalse(Job.objects.exists())
+
+        # The same key can't be spent on another quiz.
+        response = self.client.post(
+            f'/api/quizzes/{self.other_quiz.id}/submit_quiz/', {'answers': []}, format='json', HTTP_IDEMPOTENCY_KEY='worker'
+        )
+        self.assertEqual(response.status_code, 409)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CompletionCrownTests(TestCase):
+    """COMPLETION_CROWN is earned by passing the AI quiz of every lesson that has a quiz; regular quiz passes don't count."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reward = Reward.objects.create(
+            title='Completion Crown', description='...', icon='rewards_icons/crown.png',
+            category='Progression', criteria_type='COMPLETION_CROWN'
+        )
+        syllabus = Syllabus.objects.create(name='Crown Syllabus')
+        subject = Subject.objects.create(master_class=Class.objects.create(syllabus=syllabus, name='Class 7'), name='History')
+        cls.lessons = [
+            Lesson.objects.create(subject=subject, title=f'Lesson {order}', content='...', lesson_order=order)
+            for order in (1, 2)
+        ]
+        cls.quizzes = [Quiz.objects.create(lesson=lesson, title=f'{lesson.title} Quiz') for lesson in cls.lessons]
+        cls.student = CustomUser.objects.create_user(username='crown', email='crown@example.com', password='crown')
+
+    def awarded(self):
+        return {reward.criteria_type for reward in check_and_award_rewards(self.student, 'QUIZ_PASSED')}
+
+    def sweep_eligible(self):
+        return {row['user_id'] for row in eligible_user_ids(self.reward)}
+
+    def test_regular_quiz_passes_do_not_earn_it(self):
+        for quiz in self.quizzes:
+            UserQuizAttempt.objects.create(user=self.student, quiz=quiz, score=100.0, passed=True)
+        self.assertNotIn('COMPLETION_CROWN', self.awarded())
+        self.assertNotIn(self.student.id, self.sweep_eligible())
+
+    def test_ai_quiz_passes_earn_it(self):
+        AILessonQuizAttempt.objects.create(user=self.student, lesson=self.lessons[0], score=90.0, passed=True, quiz_data={})
+        self.assertNotIn('COMPLETION_CROWN', self.awarded())
+        AILessonQuizAttempt.objects.create(user=self.student, lesson=self.lessons[1], score=90.0, passed=True, quiz_data={})
+        self.assertIn(self.student.id, self.sweep_eligible())
+        self.assertIn('COMPLETION_CROWN', self.awarded())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CurriculumPayloadTests(TestCase):
+    """Class and subject trees nest lesson summaries, and students never see which choices are correct."""
+
+    @classmethod
+    def setUpTestData(cls):
+        syllabus = Syllabus.objects.create(name='Payload Syllabus')
+        cls.master_class = Class.objects.create(syllabus=syllabus, name='Class 8')
+        cls.subject = Subject.objects.create(master_class=cls.master_class, name='Biology')
+        cls.lesson = Lesson.objects.create(subject=cls.subject, title='Cells', content='Secret body', lesson_order=1)
+        quiz = Quiz.objects.create(lesson=cls.lesson, title='Cells Quiz')
+        question = Question.objects.create(quiz=quiz, text='What is a cell?')
+        Choice.objects.create(question=question, text='A unit of life', is_correct=True)
+        cls.student = CustomUser.objects.create_user(
+            username='payload_student', email='payload_student@example.com', password='payload', role='Student'
+        )
+        cls.teacher = CustomUser.objects.create_user(
+            username='payload_teacher', email='payload_teacher@example.com', password='payload', role='Teacher'
+        )
+
+    def get(self, user, url):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data['results'] if isinstance(response.data, dict) and 'results' in response.data else response.data
+
+    def assertSummary(self, lesson):
+        self.assertEqual(lesson['id'], self.lesson.id)
+        self.assertTrue(lesson['has_quiz'])
+        for field in ('content', 'simplified_content', 'quiz'):
+            self.assertNotIn(field, lesson)
+
+    def test_class_and_subject_trees_nest_summaries(self):
+        cache.clear()
+        for user in (self.student, self.teacher):
+            (subject,) = self.get(user, f'/api/subjects/?master_class={self.master_class.id}')
+            self.assertSummary(subject['lessons'][0])
+            tree = self.get(user, f'/api/classes/{self.master_class.id}/')
+            self.assertSummary(tree['subjects'][0]['lessons'][0])
+
+    def test_students_do_not_see_correct_choices(self):
+        body = self.get(self.student, f'/api/lessons/{self.lesson.id}/body/')
+        lesson = self.get(self.student, f'/api/lessons/{self.lesson.id}/')
+        for quiz in (body['quiz'], lesson['quiz']):
+            self.assertEqual(quiz['questions'][0]['choices'], [{'id': Choice.objects.get().id, 'text': 'A unit of life'}])
+
+    def test_teachers_see_correct_choices(self):
+        body = self.get(self.teacher, f'/api/lessons/{self.lesson.id}/body/')
+        self.assertTrue(body['quiz']['questions'][0]['choices'][0]['is_correct'])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CurriculumQueryCountTests(TestCase):
+    """Subject and class listings cost the same queries however many subjects and lessons they nest."""
+
+    # Per-request query counts for (anonymous, student) readers.
+    SUBJECT_LIST_QUERIES = (3, 4) # count, subjects, lessons (+ the student's unlocks)
+    FILTERED_SUBJECT_LIST_QUERIES = (4, 5) # and the master_class filter's lookup
+    # A tree missing from the cache costs its class, subjects, lessons, syllabus and school (and the list its class ids).
+    CLASS_LIST_QUERIES = (6, 8) # A student adds their completions and unlocks
+    CLASS_DETAIL_QUERIES = (5, 7)
+    CACHED_CLASS_QUERIES = (0, 2)
+
+    @classmethod
+    def setUpTestData(cls):
+        syllabus = Syllabus.objects.create(name='Query Count Syllabus')
+        cls.master_class = Class.objects.create(syllabus=syllabus, name='Class 9')
+        cls.student = CustomUser.objects.create_user(
+            username='count_student', email='count_student@example.com', password='count', role='Student'
+        )
+
+    def add_subjects(self, count, lessons_per_subject=3):
+        for _ in range(count):
+            subject = Subject.objects.create(master_class=self.master_class, name=f'Subject {Subject.objects.count()}')
+            for order in range(1, lessons_per_subject + 1):
+                lesson = Lesson.objects.create(
+                    subject=subject, title=f'Lesson {order}', content='Body', lesson_order=order,
+                    requires_previous_quiz=True
+                )
+                Quiz.objects.create(lesson=lesson, title=f'Lesson {order} Quiz')
+
+    def assertQueryCounts(self, url, counts, cold=True):
+        for user, expected in zip((None, self.student), counts):
+            client = APIClient()
+            if user:
+                client.force_authenticate(user)
+            if cold:
+                cache.clear()
+            with self.assertNumQueries(expected):
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200, response.data)
+
+    def assertConstantQueries(self):
+        self.assertQueryCounts('/api/subjects/', self.SUBJECT_LIST_QUERIES)
+        self.assertQueryCounts(f'/api/subjects/?master_class={self.master_class.id}', self.FILTERED_SUBJECT_LIST_QUERIES)
+        self.assertQueryCounts('/api/classes/', self.CLASS_LIST_QUERIES)
+        self.assertQueryCounts(f'/api/classes/{self.master_class.id}/', self.CLASS_DETAIL_QUERIES)
+        self.assertQueryCounts(f'/api/classes/{self.master_class.id}/', self.CACHED_CLASS_QUERIES, cold=False)
+
+    def test_query_counts_do_not_grow_with_the_curriculum(self):
+        self.add_subjects(1)
+        self.assertConstantQueries()
+        self.add_subjects(4, lessons_per_subject=6)
+        self.assertConstantQueries()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CurriculumCacheTests(TestCase):
+    """Cached class trees are retired by content edits, and the per-user overlay matches live serialization."""
+
+    @classmethod
+    def setUpTestData(cls):
+        syllabus = Syllabus.objects.create(name='Cache Syllabus')
+        cls.master_class = Class.objects.create(syllabus=syllabus, name='Class 10')
+        cls.subject = Subject.objects.create(master_class=cls.master_class, name='Chemistry')
+        cls.lessons = [
+            Lesson.objects.create(
+                subject=cls.subject, title=f'Lesson {order}', content='Body', lesson_order=order,
+                requires_previous_quiz=True
+            )
+            for order in (1, 2, 3)
+        ]
+        cls.quizzes = [Quiz.objects.create(lesson=lesson, title=f'{lesson.title} Quiz') for lesson in cls.lessons]
+        question = Question.objects.create(quiz=cls.quizzes[0], text='What is an atom?')
+        cls.choice = Choice.objects.create(question=question, text='A particle', is_correct=True)
+        cls.student = CustomUser.objects.create_user(
+            username='cache_student', email='cache_student@example.com', password='cache', role='Student'
+        )
+        cls.teacher = CustomUser.objects.create_user(
+            username='cache_teacher', email='cache_teacher@example.com', password='cache', role='Teacher'
+        )
+
+    def live_tree(self, user):
+        """The class tree serialized straight from the database for `user`, as before it was cached."""
+        request = Request(APIRequestFactory().get('/'))
+        request.user = user
+        classes = prefetch_class_tree(Class.objects.filter(pk=self.master_class.pk), user)
+        return json.loads(json.dumps(ClassSerializer(classes, many=True, context={'request': request}).data))
+
+    def get_tree(self, user):
+        client = APIClient()
+        if user:
+            client.force_authenticate(user)
+        response = client.get(f'/api/classes/{self.master_class.id}/')
+        self.assertEqual(response.status_code, 200, response.data)
+        return json.loads(json.dumps(response.data))
+
+    def assertOverlayMatchesLiveSerializer(self):
+        cache.clear()
+        get_class_trees([self.master_class.id]) # Cache the tree, then read it back with each overlay.
+        for user in (AnonymousUser(), self.student, self.teacher):
+            trees = json.loads(json.dumps(get_class_trees([self.master_class.id], user)))
+            self.assertEqual(trees, self.live_tree(user), user)
+
+    def assertCachedMatchesUncached(self):
+        """Returns the student's cached tree after checking every reader's against a freshly built one."""
+        responses = {}
+        for user in (None, self.student, self.teacher):
+            self.get_tree(user) # Make sure the tree is cached
+            responses[user] = self.get_tree(user)
+        cache.clear()
+        for user, cached in responses.items():
+            self.assertEqual(cached, self.get_tree(user), user)
+        return responses[self.student]
+
+    def lesson_states(self, tree):
+        return [(lesson['title'], lesson['is_locked']) for lesson in tree['subjects'][0]['lessons']]
+
+    def test_content_edits_bump_the_version(self):
+        lesson = Lesson.objects.get(pk=self.lessons[0].pk)
+        quiz, choice = self.quizzes[0], self.choice
+        lesson.title = 'Atoms'
+        quiz.title = 'Atoms Quiz'
+        choice.text = 'The smallest particle'
+        for instance in (lesson, quiz, choice):
+            version = get_curriculum_version()
+            instance.save()
+            self.assertGreater(get_curriculum_version(), version, instance)
+        version = get_curriculum_version()
+        choice.delete()
+        self.assertGreater(get_curriculum_version(), version)
+
+    def test_overlay_matches_live_serializer(self):
+        self.assertOverlayMatchesLiveSerializer()
+        # Passing lesson 1 unlocks lesson 2; completing it counts towards the subject's progress.
+        UserQuizAttempt.objects.create(user=self.student, quiz=self.quizzes[0], score=100.0, passed=True)
+        UserLessonProgress.objects.create(user=self.student, lesson=self.lessons[0], completed=True)
+        self.assertOverlayMatchesLiveSerializer()
+        tree = self.live_tree(self.student)[0]
+        self.assertEqual([lesson['is_locked'] for lesson in tree['subjects'][0]['lessons']], [False, False, True])
+        self.assertAlmostEqual(tree['subjects'][0]['progress'], 100 / 3)
+
+    def test_cached_responses_match_uncached(self):
+        tree = self.assertCachedMatchesUncached()
+        self.assertEqual(self.lesson_states(tree), [('Lesson 1', False), ('Lesson 2', True), ('Lesson 3', True)])
+
+        self.get_tree(self.student) # Cached before the edit, which has to retire it.
+        lesson = Lesson.objects.get(pk=self.lessons[1].pk) # Loaded after the lessons were linked
+        lesson.title = 'Molecules'
+        lesson.save()
+        tree = self.assertCachedMatchesUncached()
+        self.assertEqual(self.lesson_states(tree), [('Lesson 1', False), ('Molecules', True), ('Lesson 3', True)])
+
+        self.get_tree(self.student) # Unlocks leave the shared tree alone; the overlay picks them up.
+        UserQuizAttempt.objects.create(user=self.student, quiz=self.quizzes[0], score=100.0, passed=True)
+        self.assertEqual(self.lesson_states(self.get_tree(self.student))[1], ('Molecules', False))
+        tree = self.assertCachedMatchesUncached()
+        self.assertEqual(self.lesson_states(tree), [('Lesson 1', False), ('Molecules', False), ('Lesson 3', True)])
+
+
+def pick_fields(data, fields):
+    """The parts of a full response that the parsed `fields` select, to compare a sparse response with."""
+    if isinstance(data, list):
+        return [pick_fields(item, fields) for item in data]
+    return {
+        name: pick_fields(data[name], nested) if nested and data[name] is not None else data[name]
+        for name, nested in fields.items()
+    }
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SparseFieldsTests(TestCase):
+    """`?fields=`, `?depth=` and `?expand=` on the curriculum endpoints, and the querysets they narrow."""
+
+    @classmethod
+    def setUpTestData(cls):
+        syllabus = Syllabus.objects.create(name='Sparse Syllabus')
+        cls.master_class = Class.objects.create(syllabus=syllabus, name='Class 11')
+        cls.subject = Subject.objects.create(master_class=cls.master_class, name='Physics')
+        cls.lessons = [
+            Lesson.objects.create(
+                subject=cls.subject, title=f'Lesson {order}', content=f'Body {order}',
+                simplified_content=f'Simple {order}', lesson_order=order, requires_previous_quiz=True
+            )
+            for order in (1, 2)
+        ]
+        cls.quiz = Quiz.objects.create(lesson=cls.lessons[0], title='Motion Quiz')
+        question = Question.objects.create(quiz=cls.quiz, text='What is speed?')
+        Choice.objects.create(question=question, text='Distance over time', is_correct=True)
+        cls.teacher = CustomUser.objects.create_user(
+            username='sparse_teacher', email='sparse_teacher@example.com', password='sparse', role='Teacher'
+        )
+        cls.student = CustomUser.objects.create_user(
+            username='sparse_student', email='sparse_student@example.com', password='sparse', role='Student'
+        )
+
+    def get(self, url, user=None, status=200):
+        client = APIClient()
+        client.force_authenticate(user or self.teacher)
+        response = client.get(url)
+        self.assertEqual(response.status_code, status, response.data)
+        if status != 200:
+            return response.data
+        data = json.loads(json.dumps(response.data))
+        return data['results'] if isinstance(data, dict) and 'results' in data else data
+
+    def assertSparse(self, url, fields, user=None):
+        """Checks that `url` with `?fields=` returns exactly those parts of the full response."""
+        separator = '&' if '?' in url else '?'
+        full = self.get(url, user)
+        self.assertEqual(self.get(f'{url}{separator}fields={fields}', user), pick_fields(full, parse_field_paths(fields)))
+
+    def test_parse_field_paths(self):
+        self.assertEqual(
+            parse_field_paths('id, quiz.title,quiz.questions.text,,quiz.'),
+            {'id': {}, 'quiz': {'title': {}, 'questions': {'text': {}}}}
+        )
+
+    def test_nested_fields(self):
+        lesson = self.get(f'/api/lessons/{self.lessons[0].id}/?fields=id,quiz.title,quiz.questions.choices.text')
+        self.assertEqual(lesson, {
+            'id': self.lessons[0].id,
+            'quiz': {'title': 'Motion Quiz', 'questions': [{'choices': [{'text': 'Distance over time'}]}]},
+        })
+        # A nested field named without sub-fields comes whole.
+        lesson = self.get(f'/api/lessons/{self.lessons[0].id}/?fields=quiz')
+        self.assertEqual(set(lesson['quiz']), {'id', 'lesson', 'title', 'description', 'pass_mark_percentage', 'questions'})
+        # Unknown names select nothing rather than failing.
+        self.assertEqual(self.get(f'/api/lessons/{self.lessons[0].id}/?fields=id,nonexistent'), {'id': self.lessons[0].id})
+
+    def test_depth_and_expand(self):
+        url = f'/api/lessons/{self.lessons[0].id}/'
+        full = self.get(url)
+        shallow = self.get(f'{url}?depth=0')
+        self.assertEqual(shallow, {
+            name: value for name, value in full.items() if name not in ('quiz', 'ai_summary', 'translations')
+        })
+
+        quiz = self.get(f'{url}?depth=0&expand=quiz')['quiz']
+        self.assertEqual(quiz, {name: value for name, value in full['quiz'].items() if name != 'questions'})
+        questions = self.get(f'{url}?depth=0&expand=quiz.questions')['quiz']['questions']
+        self.assertEqual(questions, [{'id': question['id'], 'text': question['text']} for question in full['quiz']['questions']])
+        self.assertEqual(self.get(f'{url}?depth=0&expand=quiz.questions.choices')['quiz'], full['quiz'])
+        self.assertEqual(self.get(f'{url}?depth=1')['quiz'], quiz)
+
+        # Depth also applies to the nested lists of the cached class trees.
+        tree = self.get(f'/api/classes/{self.master_class.id}/?depth=1')
+        self.assertNotIn('lessons', tree['subjects'][0])
+        tree = self.get(f'/api/classes/{self.master_class.id}/?depth=0&expand=subjects.lessons')
+        self.assertEqual(tree['subjects'][0]['lessons'], self.get(f'/api/classes/{self.master_class.id}/')['subjects'][0]['lessons'])
+
+    def test_invalid_depth(self):
+        for depth in ('x', '-1', '1.5'):
+            errors = self.get(f'/api/lessons/{self.lessons[0].id}/?depth={depth}', status=400)
+            self.assertIn('depth', errors)
+            self.get(f'/api/classes/?depth={depth}', status=400)
+
+    def test_narrowed_querysets_render_every_requested_field(self):
+        for user in (self.teacher, self.student):
+            for fields in (
+                'id,title', 'id,content', 'simplified_content,quiz.title', 'quiz.questions.choices',
+                'has_quiz', 'is_locked,lesson_order', 'ai_summary,translations', 'subject_name,next_lesson',
+            ):
+                self.assertSparse(f'/api/lessons/{self.lessons[0].id}/', fields, user)
+            for fields in ('id,title', 'is_locked,has_quiz', 'subject_name'):
+                self.assertSparse(f'/api/lessons/?subject={self.subject.id}', fields, user)
+            for fields in ('id,name', 'lessons.title,lessons.is_locked', 'progress', 'master_class_name,lessons.has_quiz'):
+                self.assertSparse(f'/api/subjects/?master_class={self.master_class.id}', fields, user)
+            for fields in ('id,school_name', 'subjects.name', 'subjects.lessons.is_locked,subjects.progress'):
+                self.assertSparse(f'/api/classes/{self.master_class.id}/', fields, user)
+                self.assertSparse('/api/classes/', fields, user)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class LessonSectionTests(TestCase):
+    """Section bodies served by hash, and the upkeep of sections as lessons change."""
+
+    @classmethod
+    def setUpTestData(cls):
+        syllabus = Syllabus.objects.create(name='Section Syllabus')
+        cls.subject = Subject.objects.create(master_class=Class.objects.create(syllabus=syllabus, name='Class 9'), name='Chemistry')
+        cls.text = 'Atoms are small.\n\nMolecules are atoms together.'
+        cls.lesson = Lesson.objects.create(subject=cls.subject, title='Atoms', content=cls.text, lesson_order=1)
+        rebuild_lesson_sections(cls.lesson.id)
+        cls.body = SectionBody.objects.get()
+
+    def get_body(self, **headers):
+        return self.client.get(reverse('lesson_section_body', args=[self.body.hash]), headers=headers)
+
+    def test_identity_and_etag(self):
+        response = self.get_body()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.text.encode())
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['ETag'], f'"{self.body.hash}"')
+
+        response = self.get_body(if_none_match=f'"{self.body.hash}"')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.get_body(if_none_match='"other"').status_code, 200)
+
+    def test_encoding_negotiation(self):
+        response = self.get_body(accept_encoding='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.text.encode())
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        # Without a stored brotli encoding, br falls back to gzip or identity.
+        self.assertEqual(self.get_body(accept_encoding='br, gzip')['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Encoding', self.get_body(accept_encoding='br'))
+        self.assertNotIn('Content-Encoding', self.get_body(accept_encoding='gzip;q=0'))
+
+        SectionBody.objects.filter(pk=self.body.pk).update(brotli_body=b'brotli bytes')
+        response = self.get_body(accept_encoding='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(response.content, b'brotli bytes')
+
+    def test_ranges(self):
+        size = len(self.text.encode())
+        response = self.get_body(range='bytes=0-4', accept_encoding='gzip')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, self.text.encode()[:5])
+        self.assertEqual(response['Content-Range'], f'bytes 0-4/{size}')
+        self.assertNotIn('Content-Encoding', response)
+
+        response = self.get_body(range='bytes=-3')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, self.text.encode()[-3:])
+
+        response = self.get_body(range=f'bytes={size}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{size}')
+
+    def test_unknown_hash(self):
+        self.assertEqual(self.client.get(reverse('lesson_section_body', args=['0' * 64])).status_code, 404)
+
+    def test_only_content_changes_queue_a_rebuild(self):
+        rebuilds = Job.objects.filter(kind=REBUILD_SECTIONS_JOB)
+        rebuilds.delete()
+        lesson = Lesson.objects.get(pk=self.lesson.pk)
+        lesson.title = 'Atoms and molecules'
+        lesson.save()
+        Lesson.objects.get(pk=self.lesson.pk).save()
+        self.assertFalse(rebuilds.exists())
+
+        lesson.content = self.text + '\n\nIons carry a charge.'
+        lesson.save()
+        self.assertEqual(rebuilds.count(), 1)
+
+    def test_shared_bodies_outlive_one_lesson(self):
+        other = Lesson.objects.create(subject=self.subject, title='Atoms again', content=self.text, lesson_order=2)
+        rebuild_lesson_sections(other.id)
+        self.assertEqual(SectionBody.objects.count(), 1)
+
+        Lesson.objects.filter(pk=self.lesson.pk).update(content='Something else entirely.')
+        rebuild_lesson_sections(self.lesson.id)
+        self.assertTrue(SectionBody.objects.filter(pk=self.body.pk).exists())
+
+        other.delete()
+        delete_unused_section_bodies()
+        self.assertFalse(SectionBody.objects.filter(pk=self.body.pk).exists())
+        self.assertEqual(SectionBody.objects.count(), 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ReorderLessonsTests(TestCase):
+    """SubjectViewSet.reorder_lessons renumbers a subject's lessons and relinks their chain and gates."""
+
+    @classmethod
+    def setUpTestData(cls):
+        syllabus = Syllabus.objects.create(name='Reorder Syllabus')
+        master_class = Class.objects.create(syllabus=syllabus, name='Class 7')
+        cls.subject = Subject.objects.create(master_class=master_class, name='History')
+        cls.other_subject = Subject.objects.create(master_class=master_class, name='Geography')
+        cls.first, cls.second, cls.third = [
+            Lesson.objects.create(subject=cls.subject, title=title, content=title, lesson_order=order, requires_previous_quiz=order != 2)
+            for order, title in enumerate(['Ancient', 'Medieval', 'Modern'], start=1)
+        ]
+        cls.elsewhere = Lesson.objects.create(subject=cls.other_subject, title='Rivers', content='Rivers', lesson_order=1)
+        cls.teacher = CustomUser.objects.create_user(
+            username='reorder_teacher', email='reorder_teacher@example.com', password='reorder', role='Teacher'
+        )
+
+    def reorder(self, lesson_ids, user=None):
+        client = APIClient()
+        client.force_authenticate(user or self.teacher)
+        return client.post(f'/api/subjects/{self.subject.id}/reorder_lessons/', {'lesson_ids': lesson_ids}, format='json')
+
+    def links(self):
+        return {
+            lesson.id: (lesson.lesson_order, lesson.previous_lesson_id, lesson.next_lesson_id, lesson.gate_lesson_id)
+            for lesson in Lesson.objects.filter(subject=self.subject)
+        }
+
+    def test_reorder_relinks_the_chain_and_gates(self):
+        response = self.reorder([self.third.id, self.first.id, self.second.id])
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual([lesson['id'] for lesson in response.data], [self.third.id, self.first.id, self.second.id])
+        # Each lesson is gated by the one before it when that one requires its quiz.
+        self.assertEqual(self.links(), {
+            self.third.id: (1, None, self.first.id, None),
+            self.first.id: (2, self.third.id, self.second.id, self.third.id),
+            self.second.id: (3, self.first.id, None, self.first.id),
+        })
+
+        response = self.reorder([self.first.id, self.second.id, self.third.id])
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.links(), {
+            self.first.id: (1, None, self.second.id, None),
+            self.second.id: (2, self.first.id, self.third.id, self.first.id),
+            self.third.id: (3, self.second.id, None, None),
+        })
+
+    def test_invalid_lesson_ids_are_rejected(self):
+        before = self.links()
+        for lesson_ids in (
+            [self.first.id, self.second.id, self.elsewhere.id],              # From another subject
+            [self.first.id, self.second.id, self.third.id, self.elsewhere.id],
+            [self.first.id, self.second.id],                                 # Missing one
+            [self.first.id, self.second.id, self.third.id, self.third.id],   # Duplicated
+            [self.first.id, self.second.id, str(self.third.id)],
+            None,
+        ):
+            response = self.reorder(lesson_ids)
+            self.assertEqual(response.status_code, 400, lesson_ids)
+            self.assertIn('lesson_ids', response.data)
+        self.assertEqual(self.links(), before)
+
+    def test_students_cannot_reorder(self):
+        student = CustomUser.objects.create_user(
+            username='reorder_student', email='reorder_student@example.com', password='reorder', role='Student'
+        )
+        self.assertEqual(self.reorder([self.third.id, self.second.id, self.first.id], student).status_code, 403)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class GradingTests(TestCase):
+    """Submissions are graded against the quiz's cached answer key, which retires itself when the quiz is edited."""
+
+    @classmethod
+    def setUpTestData(cls):
+        syllabus = Syllabus.objects.create(name='Grading Syllabus')
+        subject = Subject.objects.create(master_class=Class.objects.create(syllabus=syllabus, name='Class 6'), name='Maths')
+        lesson = Lesson.objects.create(subject=subject, title='Primes', content='Primes', lesson_order=1)
+        cls.quiz = Quiz.objects.create(lesson=lesson, title='Primes Quiz', pass_mark_percentage=50)
+        # Two correct choices: either one answers the question.
+        cls.multi = Question.objects.create(quiz=cls.quiz, text='Which are prime?')
+        cls.two = Choice.objects.create(question=cls.multi, text='2', is_correct=True)
+        cls.three = Choice.objects.create(question=cls.multi, text='3', is_correct=True)
+        cls.four = Choice.objects.create(question=cls.multi, text='4', is_correct=False)
+        cls.single = Question.objects.create(quiz=cls.quiz, text='Is 1 prime?')
+        cls.yes = Choice.objects.create(question=cls.single, text='Yes', is_correct=False)
+        cls.no = Choice.objects.create(question=cls.single, text='No', is_correct=True)
+
+        other_lesson = Lesson.objects.create(subject=subject, title='Squares', content='Squares', lesson_order=2)
+        other_question = Question.objects.create(quiz=Quiz.objects.create(lesson=other_lesson, title='Squares Quiz'), text='4?')
+        cls.other_question = other_question
+        cls.other_choice = Choice.objects.create(question=other_question, text='Square', is_correct=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def answer(self, question, choice):
+        return {'question_id': question.id, 'choice_id': choice.id}
+
+    def test_multi_correct_questions(self):
+        for choice in (self.two, self.three):
+            graded, score, passed = score_answers(self.quiz, [self.answer(self.multi, choice), self.answer(self.single, self.yes)])
+            self.assertEqual(graded, {self.multi.id: (choice.id, True), self.single.id: (self.yes.id, False)})
+            self.assertEqual((score, passed), (50, True))
+        graded, score, passed = score_answers(self.quiz, [self.answer(self.multi, self.four)])
+        self.assertEqual(graded, {self.multi.id: (self.four.id, False)})
+        self.assertEqual((score, passed), (0, False))
+
+    def test_only_the_first_answer_to_a_question_counts(self):
+        graded = grade_answers(get_answer_key(self.quiz.id), [
+            self.answer(self.multi, self.four), self.answer(self.multi, self.two),
+        ])
+        self.assertEqual(graded, {self.multi.id: (self.four.id, False)})
+
+    def test_unknown_questions_and_choices_are_ignored(self):
+        answers = [
+            self.answer(self.other_question, self.other_choice),    # Another quiz's question
+            self.answer(self.multi, self.other_choice),             # Another question's choice
+            self.answer(self.single, self.two),
+            {'question_id': 0, 'choice_id': self.no.id},
+            {'question_id': self.single.id},
+            {'question_id': 'one', 'choice_id': self.no.id},
+            'not an answer',
+            {'question_id': str(self.single.id), 'choice_id': str(self.no.id)},
+        ]
+        graded, score, passed = score_answers(self.quiz, answers)
+        self.assertEqual(graded, {self.single.id: (self.no.id, True)})
+        self.assertEqual((score, passed), (50, True))
+
+    def test_choice_edits_retire_the_cached_key(self):
+        answers = [self.answer(self.multi, self.four), self.answer(self.single, self.no)]
+        self.assertEqual(score_answers(self.quiz, answers)[1], 50)
+        with self.assertNumQueries(0):
+            get_answer_key(self.quiz.id)
+
+        four = Choice.objects.get(pk=self.four.pk)
+        four.is_correct = True
+        four.save()
+        self.assertEqual(score_answers(self.quiz, answers)[1], 100)
+
+        four.delete()
+        self.assertEqual(score_answers(self.quiz, answers)[1], 50)
+        self.assertNotIn(self.four.id, get_answer_key(self.quiz.id)[self.multi.id])
+
+        added = Choice.objects.create(question=self.single, text='Sometimes', is_correct=True)
+        self.assertEqual(score_answers(self.quiz, [self.answer(self.single, added)])[1], 50)
+
+    def test_quiz_without_questions(self):
+        empty = Quiz.objects.create(lesson=Lesson.objects.create(
+            subject=self.quiz.lesson.subject, title='Empty', content='Empty', lesson_order=3
+        ), title='Empty Quiz')
+        self.assertEqual(score_answers(empty, [self.answer(self.multi, self.two)]), ({}, 0, False))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class QuizAuthoringTests(TestCase):
+    """Nested quiz writes keep the ids of kept rows, delete left-out ones, and retire the caches on commit."""
+
+    @classmethod
+    def setUpTestData(cls):
+        syllabus = Syllabus.objects.create(name='Authoring Syllabus')
+        subject = Subject.objects.create(master_class=Class.objects.create(syllabus=syllabus, name='Class 5'), name='Art')
+        cls.lesson = Lesson.objects.create(subject=subject, title='Colours', content='Colours', lesson_order=1)
+        cls.quiz = Quiz.objects.create(lesson=cls.lesson, title='Colours Quiz')
+        cls.kept = Question.objects.create(quiz=cls.quiz, text='Primary colour?')
+        cls.red = Choice.objects.create(question=cls.kept, text='Red', is_correct=True)
+        cls.green = Choice.objects.create(question=cls.kept, text='Green', is_correct=False)
+        cls.dropped = Question.objects.create(quiz=cls.quiz, text='Warm colour?')
+        Choice.objects.create(question=cls.dropped, text='Orange', is_correct=True)
+
+        other_lesson = Lesson.objects.create(subject=subject, title='Shapes', content='Shapes', lesson_order=2)
+        cls.foreign = Question.objects.create(quiz=Quiz.objects.create(lesson=other_lesson, title='Shapes Quiz'), text='Sides?')
+        cls.foreign_choice = Choice.objects.create(question=cls.foreign, text='Three', is_correct=True)
+        cls.teacher = CustomUser.objects.create_user(
+            username='author_teacher', email='author_teacher@example.com', password='author', role='Teacher'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def patch_questions(self, questions):
+        return self.client.patch(f'/api/quizzes/{self.quiz.id}/', {'questions': questions}, format='json')
+
+    def test_update_keeps_ids_and_deletes_left_out_rows(self):
+        response = self.patch_questions([
+            {'id': self.kept.id, 'text': 'A primary colour?', 'choices': [
+                {'id': self.red.id, 'text': 'Red', 'is_correct': True},
+                {'text': 'Blue', 'is_correct': True},
+            ]},
+            {'text': 'Cool colour?', 'choices': [{'text': 'Teal', 'is_correct': True}]},
+        ])
+        self.assertEqual(response.status_code, 200, response.data)
+
+        kept, added = Question.objects.filter(quiz=self.quiz).order_by('id')
+        self.assertEqual((kept.id, kept.text), (self.kept.id, 'A primary colour?'))
+        self.assertEqual(added.text, 'Cool colour?')
+        self.assertFalse(Question.objects.filter(pk=self.dropped.pk).exists())
+        self.assertEqual(
+            list(kept.choices.order_by('id').values_list('id', 'text')),
+            [(self.red.id, 'Red'), (Choice.objects.get(text='Blue').id, 'Blue')]
+        )
+        self.assertFalse(Choice.objects.filter(pk=self.green.pk).exists())
+
+    def test_ids_from_another_quiz_are_rejected(self):
+        for questions in (
+            [{'id': self.foreign.id, 'text': 'Sides?', 'choices': []}],
+            [{'id': self.kept.id, 'text': 'Primary colour?', 'choices': [
+                {'id': self.foreign_choice.id, 'text': 'Three', 'is_correct': True},
+            ]}],
+        ):
+            response = self.patch_questions(questions)
+            self.assertEqual(response.status_code, 400, questions)
+            self.assertIn('questions', response.data)
+        # Nothing was written, on this quiz or the other one.
+        self.assertEqual(set(Question.objects.filter(quiz=self.quiz).values_list('id', flat=True)), {self.kept.id, self.dropped.id})
+        self.assertEqual(Choice.objects.get(pk=self.foreign_choice.pk).question_id, self.foreign.id)
+
+    def test_caches_are_retired_after_commit(self):
+        answer_key = get_answer_key(self.quiz.id)
+        self.assertEqual(answer_key[self.kept.id], {self.red.id: True, self.green.id: False})
+        curriculum_version = get_curriculum_version()
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            save_quiz_questions(self.quiz, [{'id': self.kept.id, 'text': 'Primary colour?', 'choices': [
+                {'id': self.red.id, 'text': 'Red', 'is_correct': False},
+                {'id': self.green.id, 'text': 'Green', 'is_correct': True},
+            ]}])
+        self.assertEqual(len(callbacks), 2)
+        self.assertGreater(get_curriculum_version(), curriculum_version)
+        self.assertEqual(get_answer_key(self.quiz.id), {self.kept.id: {self.red.id: False, self.green.id: True}})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class QuestionBankImportTests(TestCase):
+    """Question banks imported through QuizViewSet.import_questions and the import_question_bank command."""
+
+    @classmethod
+    def setUpTestData(cls):
+        syllabus = Syllabus.objects.create(name='Import Syllabus')
+        subject = Subject.objects.create(master_class=Class.objects.create(syllabus=syllabus, name='Class 4'), name='Music')
+        cls.with_quiz = Lesson.objects.create(subject=subject, title='Rhythm', content='Rhythm', lesson_order=1)
+        cls.quiz = Quiz.objects.create(lesson=cls.with_quiz, title='Rhythm Quiz')
+        cls.without_quiz = Lesson.objects.create(subject=subject, title='Melody', content='Melody', lesson_order=2)
+        cls.teacher = CustomUser.objects.create_user(
+            username='import_teacher', email='import_teacher@example.com', password='import', role='Teacher'
+        )
+
+    def csv_lines(self, *rows):
+        return ['lesson,question,choice_1,choice_2,choice_3,correct\n'] + [row + '\n' for row in rows]
+
+    def choices(self, text):
+        return list(Choice.objects.filter(question__text=text).order_by('id').values_list('text', 'is_correct'))
+
+    def test_csv_correct_column(self):
+        lesson = self.with_quiz.id
+        (report,) = import_question_bank(self.csv_lines(
+            f'{lesson},One?,a,b,c,2',
+            f'{lesson},Two?,a,b,c,1|3',
+            f'{lesson},Three?,a,b,c," 1, 2 "',
+            f'{lesson},Empty?,a,,c,2',
+            f'{lesson},Letters?,a,b,c,b',
+            f'{lesson},None?,a,b,c,',
+        ), 'csv')
+        self.assertEqual(self.choices('One?'), [('a', False), ('b', True), ('c', False)])
+        self.assertEqual(self.choices('Two?'), [('a', True), ('b', False), ('c', True)])
+        self.assertEqual(self.choices('Three?'), [('a', True), ('b', True), ('c', False)])
+        self.assertEqual((report['imported'], report['error_count']), (3, 3))
+        self.assertEqual([error['line'] for error in report['errors']], [5, 6, 7])
+        self.assertIn('empty or missing choices [2]', report['errors'][0]['error'])
+
+    def test_unknown_lessons_and_new_quizzes(self):
+        (report,) = import_question_bank([
+            json.dumps({'lesson': 0, 'text': 'Lost?', 'choices': [{'text': 'a', 'is_correct': True}, {'text': 'b'}]}),
+            json.dumps({'lesson': self.without_quiz.id, 'text': 'Scale?', 'choices': [{'text': 'a', 'is_correct': True}, {'text': 'b'}]}),
+            json.dumps({'lesson': self.without_quiz.id, 'text': 'Key?', 'choices': [{'text': 'a'}, {'text': 'b', 'is_correct': True}]}),
+            json.dumps({'lesson': self.with_quiz.id, 'text': 'Beat?', 'choices': [{'text': 'a', 'is_correct': True}, {'text': 'b'}]}),
+        ], 'jsonl')
+        self.assertEqual(report['errors'], [{'line': 1, 'error': 'Lesson 0 does not exist.'}])
+        self.assertEqual((report['imported'], report['quizzes_created']), (3, 1))
+        created = Quiz.objects.get(lesson=self.without_quiz)
+        self.assertEqual(created.title, 'Melody Quiz')
+        self.assertEqual(set(created.questions.values_list('text', flat=True)), {'Scale?', 'Key?'})
+        self.assertEqual(list(self.quiz.questions.values_list('text', flat=True)), ['Beat?'])
+
+    def test_chunk_boundaries(self):
+        lines = self.csv_lines(*[f'{self.with_quiz.id},Q{number}?,a,b,,1' for number in range(4)])
+        reports = [dict(report) for report in import_question_bank(lines, 'csv', chunk_size=2)]
+        # Rows that fill the last chunk exactly don't leave an empty chunk and an extra report behind.
+        self.assertEqual([(report['rows'], report['imported']) for report in reports], [(2, 2), (4, 4)])
+        self.assertEqual([dict(report) for report in import_question_bank(self.csv_lines(), 'csv', chunk_size=2)], [
+            {'rows': 0, 'imported': 0, 'quizzes_created': 0, 'error_count': 0, 'errors': []}
+        ])
+        reports = list(import_question_bank(self.csv_lines(f'{self.with_quiz.id},Q4?,a,b,,1'), 'csv', chunk_size=2))
+        self.assertEqual(len(reports), 1)
+
+    def test_caches_are_retired_after_each_chunk(self):
+        cache.clear()
+        answer_key = get_answer_key(self.quiz.id)
+        version = get_curriculum_version()
+        lines = self.csv_lines(*[f'{self.with_quiz.id},Q{number}?,a,b,,1' for number in range(4)])
+        reports = import_question_bank(lines, 'csv', chunk_size=2)
+        next(reports)
+        # The caller stops after the first chunk, as a streaming client that goes away would.
+        reports.close()
+        self.assertGreater(get_curriculum_version(), version)
+        self.assertNotEqual(get_answer_key(self.quiz.id), answer_key)
+        self.assertEqual(self.quiz.questions.count(), 2)
+
+    def test_upload(self):
+        client = APIClient()
+        client.force_authenticate(self.teacher)
+        upload = SimpleUploadedFile('bank.csv', ''.join(self.csv_lines(
+            f'{self.without_quiz.id},Tempo?,fast,slow,,1', '999999,Lost?,a,b,,1'
+        )).encode())
+        response = client.post('/api/quizzes/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        reports = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(reports[-1]['imported'], 1)
+        self.assertEqual(reports[-1]['quizzes_created'], 1)
+        self.assertEqual(reports[-1]['errors'], [{'line': 3, 'error': 'Lesson 999999 does not exist.'}])
+        self.assertTrue(Question.objects.filter(quiz__lesson=self.without_quiz, text='Tempo?').exists())
+
+        response = client.post('/api/quizzes/import/', {'file': SimpleUploadedFile('bank.txt', b'')}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as bank:
+            bank.writelines(self.csv_lines(*[f'{self.without_quiz.id},C{number}?,a,b,,2' for number in range(3)]))
+        self.addCleanup(os.remove, bank.name)
+        stdout = io.StringIO()
+        call_command('import_question_bank', bank.name, '--chunk-size', '3', stdout=stdout)
+        self.assertEqual(stdout.getvalue().count('rows read'), 1)
+        self.assertIn('Imported 3 questions (1 new quizzes) from 3 rows.', stdout.getvalue())
+        self.assertEqual(Question.objects.filter(quiz__lesson=self.without_quiz).count(), 3)
+
+        with self.assertRaises(CommandError):
+            call_command('import_question_bank', bank.name, '--chunk-size', '0', stdout=io.StringIO())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ItemAnalysisTests(TestCase):
+    """quiz_item_statistics over a small set of graded answers whose figures are worked out by hand."""
+
+    def test_item_statistics(self):
+        syllabus = Syllabus.objects.create(name='Item Syllabus')
+        subject = Subject.objects.create(master_class=Class.objects.create(syllabus=syllabus, name='Class 3'), name='Reading')
+        lesson = Lesson.objects.create(subject=subject, title='Words', content='Words', lesson_order=1)
+        quiz = Quiz.objects.create(lesson=lesson, title='Words Quiz')
+        easy, hard, unanswered = [Question.objects.create(quiz=quiz, text=text) for text in ('Easy?', 'Hard?', 'Skipped?')]
+        easy_right, easy_wrong, hard_right, hard_wrong = [
+            Choice.objects.create(question=question, text=text, is_correct=text == 'Yes')
+            for question in (easy, hard) for text in ('Yes', 'No')
+        ]
+
+        # Four attempts, so the upper and lower groups hold one each (27% of 4, rounded).
+        for index, picked in enumerate([
+            (easy_right, hard_right), (easy_right, hard_wrong), (easy_right, None), (easy_wrong, hard_wrong),
+        ]):
+            user = CustomUser.objects.create_user(username=f'item_{index}', email=f'item_{index}@example.com', password='item')
+            attempt = UserQuizAttempt.objects.create(user=user, quiz=quiz, score=0, passed=False, answers=[])
+            for choice in picked:
+                if choice is not None:
+                    QuizAnswer.objects.create(attempt=attempt, question=choice.question, choice=choice, correct=choice.is_correct)
+
+        statistics = quiz_item_statistics(quiz.id)
+        self.assertEqual(statistics['attempts'], 4)
+        by_text = {question['text']: question for question in statistics['questions']}
+        self.assertEqual((by_text['Easy?']['responses'], by_text['Easy?']['difficulty']), (4, 0.75))
+        self.assertEqual(by_text['Easy?']['discrimination'], 1.0)
+        self.assertEqual(
+            [(choice['picks'], choice['frequency']) for choice in by_text['Easy?']['choices']], [(3, 0.75), (1, 0.25)]
+        )
+        self.assertEqual((by_text['Hard?']['responses'], by_text['Hard?']['difficulty']), (3, 0.3333))
+        self.assertEqual(by_text['Hard?']['discrimination'], 1.0)
+        self.assertEqual(by_text['Skipped?'], {
+            'question_id': unanswered.id, 'text': 'Skipped?', 'responses': 0,
+            'difficulty': None, 'discrimination': None, 'choices': [],
+        })
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AIQuizCooldownTests(TestCase):
+    """AI quiz attempts respect the per-lesson cooldown, which the cooldowns endpoint reports per subject."""
+
+    @classmethod
+    def setUpTestData(cls):
+        syllabus = Syllabus.objects.create(name='Cooldown Syllabus')
+        cls.subject = Subject.objects.create(master_class=Class.objects.create(syllabus=syllabus, name='Class 2'), name='Physics')
+        cls.first, cls.second = [
+            Lesson.objects.create(subject=cls.subject, title=title, content=title, lesson_order=order)
+            for order, title in enumerate(['Force', 'Energy'], start=1)
+        ]
+        cls.quiz = Quiz.objects.create(lesson=cls.first, title='Force Quiz')
+        cls.student = CustomUser.objects.create_user(
+            username='cooldown_student', email='cooldown_student@example.com', password='cooldown', role='Student'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def attempt(self, lesson, passed, idempotency_key=None):
+        data = {'quiz_data': {'questions': []}, 'score': 100.0 if passed else 20.0, 'passed': passed}
+        if lesson is not None:
+            data['lesson'] = data['lesson_id'] = lesson.id
+        headers = {'Idempotency-Key': idempotency_key} if idempotency_key else {}
+        return self.client.post('/api/ai-quiz-attempts/', data, format='json', headers=headers)
+
+    def cooldowns(self, subject_id=None):
+        return self.client.get(f'/api/ai-quiz-attempts/cooldowns/?subject={subject_id or self.subject.id}')
+
+    def test_cooldowns_endpoint(self):
+        response = self.cooldowns()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'subject': self.subject.id, 'lessons': [
+            {'lesson': self.first.id, 'can_attempt': True, 'can_reattempt_at': None},
+            {'lesson': self.second.id, 'can_attempt': True, 'can_reattempt_at': None},
+        ]})
+
+        self.assertEqual(self.attempt(self.second, passed=False).status_code, 201)
+        self.assertEqual(self.attempt(self.first, passed=True).status_code, 201)
+        lessons = self.cooldowns().data['lessons']
+        self.assertEqual([lesson['can_attempt'] for lesson in lessons], [True, False])
+        self.assertEqual(
+            lessons[1]['can_reattempt_at'],
+            AILessonQuizAttempt.objects.get(user=self.student, lesson=self.second).can_reattempt_at
+        )
+
+        self.assertEqual(self.cooldowns('physics').status_code, 400)
+        self.assertEqual(self.cooldowns(999999).status_code, 404)
+
+    def test_a_failed_attempt_starts_the_cooldown(self):
+        self.assertEqual(self.attempt(self.first, passed=False).status_code, 201)
+        self.assertEqual(self.attempt(self.first, passed=True).status_code, 403)
+        self.assertEqual(self.attempt(self.second, passed=True).status_code, 201)
+        self.assertEqual(AILessonQuizAttempt.objects.filter(user=self.student, lesson=self.first).count(), 1)
+
+        AIQuizCooldown.objects.filter(user=self.student, lesson=self.first).update(available_at=timezone.now())
+        self.assertEqual(self.attempt(self.first, passed=True).status_code, 201)
+        # A pass clears the cooldown, and checking it leaves no row behind.
+        self.assertFalse(AIQuizCooldown.objects.filter(user=self.student).exists())
+
+    def test_rejected_attempts_leave_no_cooldown_row(self):
+        response = self.client.post('/api/ai-quiz-attempts/', {'lesson': self.first.id, 'lesson_id': self.first.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(AIQuizCooldown.objects.exists())
+
+    def test_exam_mode_retries_and_conflicts(self):
+        self.assertEqual(self.attempt(self.first, passed=False, idempotency_key='ai-exam-1').status_code, 202)
+        # The retry gets its submission back although its failure started the cooldown.
+        self.assertEqual(self.attempt(self.first, passed=False, idempotency_key='ai-exam-1').status_code, 202)
+        self.assertEqual(self.attempt(self.second, passed=False, idempotency_key='ai-exam-1').status_code, 409)
+        self.assertEqual(self.attempt(None, passed=False, idempotency_key='ai-exam-1').status_code, 409)
+        self.assertEqual(self.attempt(self.first, passed=False, idempotency_key='ai-exam-2').status_code, 403)
+
+    def test_exam_key_of_a_quiz_submission_is_not_reused_without_a_lesson(self):
+        response = self.client.post(
+            f'/api/quizzes/{self.quiz.id}/submit_quiz/', {'answers': []}, format='json',
+            headers={'Idempotency-Key': 'quiz-exam'}
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.attempt(None, passed=False, idempotency_key='quiz-exam').status_code, 409)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class LessonPassIndexTests(TestCase):
+    """The passed-lesson index, and the unlocks derived from it, follow attempts whose `passed` flips."""
+
+    @classmethod
+    def setUpTestData(cls):
+        syllabus = Syllabus.objects.create(name='Index Syllabus')
+        subject = Subject.objects.create(master_class=Class.objects.create(syllabus=syllabus, name='Class 12'), name='Algebra')
+        cls.lesson = Lesson.objects.create(
+            subject=subject, title='Equations', content='Equations', lesson_order=1, requires_previous_quiz=True
+        )
+        cls.next_lesson = Lesson.objects.create(subject=subject, title='Inequalities', content='Inequalities', lesson_order=2)
+        cls.quiz = Quiz.objects.create(lesson=cls.lesson, title='Equations Quiz')
+        cls.student = CustomUser.objects.create_user(
+            username='index_student', email='index_student@example.com', password='index', role='Student'
+        )
+
+    def attempt(self, model, passed):
+        if model is UserQuizAttempt:
+            return UserQuizAttempt.objects.create(user=self.student, quiz=self.quiz, score=80.0, passed=passed)
+        return AILessonQuizAttempt.objects.create(user=self.student, lesson=self.lesson, score=80.0, passed=passed, quiz_data={})
+
+    def assertNextLessonLocked(self, locked):
+        self.assertEqual(UserPassedLesson.objects.filter(user=self.student, lesson=self.lesson).exists(), not locked)
+        self.assertEqual(UserLessonUnlock.objects.filter(user=self.student, lesson=self.next_lesson).exists(), not locked)
+        self.assertEqual(get_lesson_locks(self.student, pk=self.next_lesson.pk), {self.next_lesson.pk: locked})
+
+    def test_flipping_passed_relocks_the_next_lesson(self):
+        for model in (UserQuizAttempt, AILessonQuizAttempt):
+            attempt = self.attempt(model, passed=True)
+            self.assertNextLessonLocked(False)
+
+            attempt = model.objects.get(pk=attempt.pk)
+            attempt.passed = False
+            attempt.save()
+            self.assertNextLessonLocked(True)
+            attempt.passed = True
+            attempt.save()
+            self.assertNextLessonLocked(False)
+            attempt.delete()
+            self.assertNextLessonLocked(True)
+
+    def test_another_passing_attempt_keeps_the_pass(self):
+        kept = self.attempt(UserQuizAttempt, passed=True)
+        flipped = self.attempt(AILessonQuizAttempt, passed=True)
+        flipped.passed = False
+        flipped.save()
+        self.assertNextLessonLocked(False)
+        kept = UserQuizAttempt.objects.get(pk=kept.pk)
+        kept.passed = False
+        kept.save()
+        self.assertNextLessonLocked(True)
+
+    def test_saving_without_a_loaded_state(self):
+        for model in (UserQuizAttempt, AILessonQuizAttempt):
+            attempt = self.attempt(model, passed=True)
+            attempt = model.objects.defer('passed').get(pk=attempt.pk)
+            attempt.passed = False
+            attempt.save()
+            self.assertNextLessonLocked(True)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RewardCounterTests(TestCase):
+    """The passed AI quiz counters follow every create, edit and delete of an attempt."""
+
+    @classmethod
+    def setUpTestData(cls):
+        syllabus = Syllabus.objects.create(name='Counter Syllabus')
+        subject = Subject.objects.create(master_class=Class.objects.create(syllabus=syllabus, name='Class 10'), name='Logic')
+        cls.lesson = Lesson.objects.create(subject=subject, title='Truth', content='Truth', lesson_order=1)
+        cls.student = CustomUser.objects.create_user(
+            username='counter_student', email='counter_student@example.com', password='counter', role='Student'
+        )
+
+    def attempt(self, passed, score):
+        return AILessonQuizAttempt.objects.create(user=self.student, lesson=self.lesson, passed=passed, score=score, quiz_data={})
+
+    def assertCounter(self, passed, score_total):
+        counter = UserRewardCounter.objects.get(user=self.student)
+        self.assertEqual((counter.ai_quizzes_passed, counter.ai_quiz_passed_score_total), (passed, score_total))
+        rebuilt = rebuild_reward_counter(self.student)
+        self.assertEqual((rebuilt.ai_quizzes_passed, rebuilt.ai_quiz_passed_score_total), (passed, score_total))
+
+    def test_deleting_a_passed_attempt(self):
+        passed = self.attempt(True, 90.0)
+        self.attempt(True, 80.0)
+        self.assertCounter(2, 170.0)
+        AILessonQuizAttempt.objects.get(pk=passed.pk).delete()
+        self.assertCounter(1, 80.0)
+        self.attempt(False, 10.0).delete()
+        self.assertCounter(1, 80.0)
+
+    def test_flipping_passed(self):
+        self.attempt(True, 75.0)
+        attempt = AILessonQuizAttempt.objects.get(pk=self.attempt(False, 40.0).pk)
+        attempt.passed, attempt.score = True, 85.0
+        attempt.save()
+        self.assertCounter(2, 160.0)
+        attempt.score = 95.0
+        attempt.save()
+        self.assertCounter(2, 170.0)
+        attempt.passed = False
+        attempt.save()
+        self.assertCounter(1, 75.0)
+        attempt.save() # Saving again without a change leaves the counters alone.
+        self.assertCounter(1, 75.0)
+
+    def test_save_without_a_loaded_state_rebuilds(self):
+        attempt = self.attempt(True, 70.0)
+        AILessonQuizAttempt(
+            pk=attempt.pk, user=self.student, lesson=self.lesson, passed=False, score=70.0, quiz_data={},
+            attempted_at=attempt.attempted_at,
+        ).save()
+        self.assertCounter(0, 0.0)
+
+    def test_students_editing_their_attempts_through_the_api(self):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        attempt = self.attempt(True, 90.0)
+        for _ in range(3):
+            response = client.delete(f'/api/ai-quiz-attempts/{self.attempt(True, 90.0).id}/')
+            self.assertEqual(response.status_code, 204)
+        self.assertCounter(1, 90.0)
+        self.assertEqual(client.patch(f'/api/ai-quiz-attempts/{attempt.id}/', {'passed': False}, format='json').status_code, 200)
+        self.assertCounter(0, 0.0)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SubjectCompletionTests(TestCase):
+    """UserSubjectCompletion matches a live count of lessons and completed progress after every kind of change."""
+
+    @classmethod
+    def setUpTestData(cls):
+        syllabus = Syllabus.objects.create(name='Completion Syllabus')
+        master_class = Class.objects.create(syllabus=syllabus, name='Class 11')
+        cls.subject = Subject.objects.create(master_class=master_class, name='Economics')
+        cls.other_subject = Subject.objects.create(master_class=master_class, name='Civics')
+        cls.lessons = [
+            Lesson.objects.create(subject=cls.subject, title=f'Lesson {order}', content='...', lesson_order=order)
+            for order in range(1, 4)
+        ]
+        cls.students = [
+            CustomUser.objects.create_user(username=f'completer_{index}', email=f'completer_{index}@example.com', password='done')
+            for index in range(2)
+        ]
+
+    def complete(self, student, lesson, completed=True):
+        progress, _ = UserLessonProgress.objects.get_or_create(user=student, lesson=lesson)
+        progress.completed = completed
+        progress.save()
+        return progress
+
+    def assertMatchesLiveCounts(self):
+        for subject in (self.subject, self.other_subject):
+            total = Lesson.objects.filter(subject=subject).count()
+            for student in self.students:
+                completed = UserLessonProgress.objects.filter(user=student, lesson__subject=subject, completed=True).count()
+                aggregate = get_subject_completion(student, subject.id)
+                if aggregate is None:
+                    self.assertEqual(completed, 0, (student, subject))
+                else:
+                    self.assertEqual((aggregate.completed_lessons, aggregate.total_lessons), (completed, total), (student, subject))
+
+    def test_completion_toggles(self):
+        first, second, third = self.lessons
+        self.complete(self.students[0], first)
+        self.complete(self.students[0], second)
+        self.complete(self.students[1], second)
+        self.assertMatchesLiveCounts()
+        self.complete(self.students[0], first, completed=False)
+        self.assertMatchesLiveCounts()
+        self.complete(self.students[0], first, completed=False) # Saving again without a change
+        self.complete(self.students[1], third)
+        self.assertMatchesLiveCounts()
+
+        progress = UserLessonProgress.objects.get(user=self.students[1], lesson=third)
+        UserLessonProgress(pk=progress.pk, user=self.students[1], lesson=third, completed=False).save()
+        self.assertMatchesLiveCounts()
+
+    def test_deleting_progress(self):
+        progress = self.complete(self.students[0], self.lessons[0])
+        self.complete(self.students[0], self.lessons[1])
+        self.complete(self.students[1], self.lessons[2], completed=False).delete()
+        self.assertMatchesLiveCounts()
+        UserLessonProgress.objects.get(pk=progress.pk).delete()
+        self.assertMatchesLiveCounts()
+
+    def test_adding_moving_and_deleting_lessons(self):
+        self.complete(self.students[0], self.lessons[0])
+        self.complete(self.students[1], self.lessons[1])
+        added = Lesson.objects.create(subject=self.subject, title='Lesson 4', content='...', lesson_order=4)
+        self.assertMatchesLiveCounts()
+
+        self.complete(self.students[0], added)
+        moved = Lesson.objects.get(pk=added.pk)
+        moved.subject = self.other_subject
+        moved.save()
+        self.assertMatchesLiveCounts()
+
+        # Deleting a lesson takes it out of the totals, and its completions with it.
+        Lesson.objects.get(pk=self.lessons[0].pk).delete()
+        self.assertMatchesLiveCounts()
+        Lesson.objects.get(pk=moved.pk).delete()
+        self.assertMatchesLiveCounts()
@@ -1,5 +1,5 @@
 
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
 from .views import (
     ClassViewSet, SubjectViewSet, LessonViewSet, QuizViewSet, QuestionViewSet, ChoiceViewSet, 
@@ -7,7 +7,7 @@ from .views import (
     ProcessedNoteViewSet, UserQuizAttemptViewSet, RewardViewSet, UserRewardViewSet, CheckpointViewSet,
     AILessonQuizAttemptViewSet, UserNoteViewSet, TranslatedLessonContentViewSet, AILessonSummaryViewSet,
     StudentResourceViewSet, ai_summarize_lesson, ai_translate_lesson, RewardProgressView,
-    ManualReportViewSet
+    ManualReportViewSet, lesson_section_body
 )
 
 router = DefaultRouter()
@@ -40,4 +40,5 @@ urlpatterns = [
     path('dictionary/', dictionary_lookup, name='dictionary_lookup'),
     path('ai/notes/summarize/', ai_summarize_lesson, name='ai_summarize_lesson'),
     path('ai/translate/', ai_translate_lesson, name='ai_translate_lesson'),
+    re_path(r'^lesson-sections/(?P<body_hash>[0-9a-f]{64})/$', lesson_section_body, name='lesson_section_body'),
 ]
@@ -1,3 +1,5 @@
+import io
+import json
 
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action, api_view, permission_classes as dec_permission_classes
@@ -5,30 +7,44 @@ from rest_framework.response import Response
 from .models import (
     Class, Subject, Lesson, Quiz, Question, Choice, UserLessonProgress, 
     UserQuizAttempt, Book, ProcessedNote, Reward, UserReward, Checkpoint, AILessonQuizAttempt,
-    UserNote, TranslatedLessonContent, AILessonSummary, StudentResource, ManualReport
+    UserNote, TranslatedLessonContent, AILessonSummary, StudentResource, ManualReport, SectionBody
 )
 from accounts.models import CustomUser, ParentStudentLink, StudentProfile, RecentActivity
 from .serializers import ( 
-    ProcessedNoteSerializer, ClassSerializer, SubjectSerializer, LessonSerializer, BookSerializer, 
+    ProcessedNoteSerializer, ClassSerializer, SubjectSerializer, LessonSerializer, LessonSummarySerializer, LessonBodySerializer, BookSerializer, 
     UserLessonProgressSerializer, QuizSerializer, QuestionSerializer, ChoiceSerializer, UserQuizAttemptSerializer,
     RewardSerializer, UserRewardSerializer, CheckpointSerializer, AILessonQuizAttemptSerializer,
     UserNoteSerializer, TranslatedLessonContentSerializer, AILessonSummarySerializer, StudentResourceSerializer,
-    ManualReportSerializer
+    ManualReportSerializer, ExamSubmissionSerializer
+)
+from stepwise_backend.fieldsets import SparseFieldsViewMixin
+from .curriculum import bump_curriculum_version, get_class_ids, get_class_trees
+from .exams import IDEMPOTENCY_KEY_LENGTH, get_exam_submission, submit_ai_quiz_exam, submit_quiz_exam
+from .grading import record_quiz_answers, score_answers
+from .item_analysis import quiz_item_statistics
+from .question_bank import QUESTION_BANK_FORMATS, import_question_bank, question_bank_format
+from .sections import get_lesson_sections, source_text
+from .services import (
+    queue_reward_evaluation, get_reward_progress, lesson_summary_queryset, lesson_tree_queryset, annotate_subject_progress,
+    prefetch_class_tree, reorder_subject_lessons, AI_QUIZ_REATTEMPT_DELAY, lock_ai_quiz_cooldown,
+    get_subject_ai_quiz_cooldowns
 )
-from .services import check_and_award_rewards, get_reward_progress
 from accounts.permissions import IsTeacher, IsTeacherOrReadOnly, IsStudent, IsParent
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAdminUser, AllowAny, IsAuthenticated
 from rest_framework.generics import ListAPIView
 from django_filters.rest_framework import DjangoFilterBackend 
-from django.http import JsonResponse 
-from django.db.models import Q, Exists, OuterRef, F
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.http import require_safe
+from django.db import transaction
+from django.db.models import Q, Exists, OuterRef, F, Prefetch
 from django.utils import timezone
 from datetime import timedelta
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.exceptions import PermissionDenied, NotFound, ValidationError
 
 
-class ClassViewSet(viewsets.ModelViewSet):
+class ClassViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     serializer_class = ClassSerializer
     permission_classes = [IsAuthenticatedOrReadOnly] 
     filter_backends = [DjangoFilterBackend]
@@ -36,11 +52,29 @@ class ClassViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         # Annotate with the school name for the student dashboard display logic
-        return Class.objects.all().select_related('syllabus').annotate(school_name=F('syllabus__schools__name'))
+        queryset = Class.objects.all().select_related('syllabus').annotate(school_name=F('syllabus__schools__name'))
+        return prefetch_class_tree(queryset, self.request.user)
 
     def get_serializer_context(self):
         return {'request': self.request, **super().get_serializer_context()}
 
+    def list(self, request, *args, **kwargs):
+        syllabus_id = request.query_params.get('syllabus')
+        if 'name' in request.query_params or (syllabus_id and not syllabus_id.isdigit()):
+            class_ids = list(self.filter_queryset(self.get_queryset()).values_list('id', flat=True))
+        else:
+            class_ids = get_class_ids(syllabus_id)
+        page = self.paginate_queryset(class_ids)
+        trees = self.sparse_data(get_class_trees(page if page is not None else class_ids, request.user))
+        return self.get_paginated_response(trees) if page is not None else Response(trees)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        trees = get_class_trees([int(lookup)], request.user) if str(lookup).isdigit() else []
+        if not trees:
+            raise NotFound("Class not found.")
+        return Response(self.sparse_data(trees[0]))
+
     def perform_create(self, serializer):
         user = self.request.user
         if not user.is_staff and not (user.role == 'Admin'):
@@ -48,13 +82,23 @@ class ClassViewSet(viewsets.ModelViewSet):
         serializer.save()
 
 
-class SubjectViewSet(viewsets.ModelViewSet):
+class SubjectViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = Subject.objects.all().select_related('master_class', 'master_class__syllabus')
     serializer_class = SubjectSerializer
     permission_classes = [IsAuthenticatedOrReadOnly] 
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['master_class', 'master_class__schoolclass', 'name'] # Added master_class__schoolclass
 
+    def get_queryset(self):
+        subjects = super().get_queryset()
+        if self.wants('lessons'):
+            subjects = subjects.prefetch_related(
+                Prefetch('lessons', queryset=lesson_summary_queryset())
+            )
+        if self.wants('progress'):
+            subjects = annotate_subject_progress(subjects, self.request.user)
+        return subjects
+
     def get_serializer_context(self):
         return {'request': self.request, **super().get_serializer_context()}
 
@@ -64,15 +108,47 @@ class SubjectViewSet(viewsets.ModelViewSet):
             raise PermissionDenied("You do not have permission to create subjects.")
         serializer.save()
 
-
-class LessonViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['post'], permission_classes=[IsTeacher | IsAdminUser])
+    def reorder_lessons(self, request, pk=None):
+        """Puts the subject's lessons in the order of `lesson_ids`, which must list each of them once."""
+        subject = self.get_object()
+        lesson_ids = request.data.get('lesson_ids')
+        if not isinstance(lesson_ids, list) or not all(isinstance(lesson_id, int) for lesson_id in lesson_ids):
+            raise ValidationError({'lesson_ids': "A list of lesson ids is required."})
+        try:
+            lessons = reorder_subject_lessons(subject.id, lesson_ids)
+        except ValueError as exc:
+            raise ValidationError({'lesson_ids': str(exc)})
+        bump_curriculum_version() # The bulk update bypasses the content signals.
+        return Response([
+            {'id': lesson.id, 'lesson_order': lesson.lesson_order,
+             'previous_lesson': lesson.previous_lesson_id, 'next_lesson': lesson.next_lesson_id}
+            for lesson in lessons
+        ])
+
+
+class LessonViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     serializer_class = LessonSerializer
     permission_classes = [IsAuthenticatedOrReadOnly] 
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['subject', 'subject__master_class', 'title', 'created_by']
 
     def get_queryset(self):
-        return Lesson.objects.all().select_related('subject', 'subject__master_class', 'created_by').order_by('subject__master_class__id', 'subject__id', 'lesson_order')
+        if self.action == 'list':
+            lessons = lesson_summary_queryset()
+        elif self.action == 'sections':
+            lessons = Lesson.objects.only('id')
+        else:
+            lessons = lesson_tree_queryset(self.wants).select_related('subject__master_class', 'created_by')
+        return lessons.order_by('subject__master_class__id', 'subject__id', 'lesson_order')
+
+    def get_serializer_class(self):
+        # Listings leave out lesson bodies and quizzes; retrieve and `body` return them.
+        if self.action == 'list':
+            return LessonSummarySerializer
+        if self.action == 'body':
+            return LessonBodySerializer
+        return super().get_serializer_class()
 
     def get_serializer_context(self):
         return {'request': self.request, **super().get_serializer_context()}
@@ -97,6 +173,34 @@ class LessonViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def body(self, request, pk=None):
+        return Response(self.get_serializer(self.get_object()).data)
+
+    @action(detail=True, methods=['get'])
+    def sections(self, request, pk=None):
+        """Lists the lesson's content sections (or a translation's, with ?language=) and where to fetch each."""
+        lesson = self.get_object()
+        language_code = request.query_params.get('language', '')
+        if source_text(lesson.id, language_code) is None:
+            raise NotFound("No content in this language.")
+        sections = get_lesson_sections(lesson.id, language_code)
+        return Response({
+            'lesson': lesson.id,
+            'language_code': language_code,
+            'format': 'json' if any(section.name for section in sections) else 'text',
+            'sections': [
+                {
+                    'position': section.position,
+                    'name': section.name,
+                    'hash': section.body.hash,
+                    'size': section.body.size,
+                    'url': request.build_absolute_uri(reverse('lesson_section_body', args=[section.body.hash])),
+                }
+                for section in sections
+            ],
+        })
+
     def perform_create(self, serializer):
         user = self.request.user
         if not user.is_staff and not (user.role == 'Admin' or user.role == 'Teacher'):
@@ -118,13 +222,20 @@ class LessonViewSet(viewsets.ModelViewSet):
         return Response(LessonSerializer(lesson, context=self.get_serializer_context()).data)
 
 
-class QuizViewSet(viewsets.ModelViewSet):
-    queryset = Quiz.objects.all().select_related('lesson', 'lesson__subject').prefetch_related('questions__choices')
+class QuizViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
+    queryset = Quiz.objects.all().select_related('lesson', 'lesson__subject')
     serializer_class = QuizSerializer
     permission_classes = [IsTeacherOrReadOnly]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['lesson', 'lesson__subject', 'title']
 
+    def get_queryset(self):
+        quizzes = super().get_queryset()
+        # Exam-mode submissions answer with the stored submission, not the quiz.
+        if self.action == 'submit_quiz' and _idempotency_key(self.request):
+            return quizzes
+        return quizzes.prefetch_related('questions__choices') if self.wants('questions') else quizzes
+
     def get_serializer_context(self):
         return {'request': self.request, **super().get_serializer_context()}
     
@@ -135,6 +246,38 @@ class QuizViewSet(viewsets.ModelViewSet):
         serializer.save()
 
 
+    @action(detail=False, methods=['post'], url_path='import', permission_classes=[IsTeacher | IsAdminUser],
+            parser_classes=[MultiPartParser, FormParser])
+    def import_questions(self, request):
+        """
+        Imports a CSV or JSON Lines question bank uploaded as `file` (see
+        content/question_bank.py), its format taken from the file name or
+        `file_format`. Streams a JSON line of progress after every chunk; the
+        last line is the final report.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': "A question bank file is required."})
+        file_format = request.data.get('file_format') or question_bank_format(upload.name)
+        if file_format not in QUESTION_BANK_FORMATS.values():
+            raise ValidationError({'file_format': "Upload a .csv or .jsonl file, or set file_format to csv or jsonl."})
+
+        # Large uploads are spooled to disk, so the file is read a line at a time either way.
+        lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        reports = import_question_bank(lines, file_format)
+        return StreamingHttpResponse(
+            (json.dumps(report) + '\n' for report in reports), content_type='application/x-ndjson'
+        )
+
+    @action(detail=True, methods=['get'], permission_classes=[IsTeacher | IsAdminUser])
+    def item_statistics(self, request, pk=None):
+        """Difficulty, discrimination and choice frequencies of the quiz's questions, optionally for one `school_class`."""
+        quiz = self.get_object()
+        school_class_id = request.query_params.get('school_class')
+        if school_class_id and not school_class_id.isdigit():
+            raise ValidationError({'school_class': "Must be a school class id."})
+        return Response({'quiz': quiz.id, **quiz_item_statistics(quiz.id, school_class_id)})
+
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsStudent])
     def submit_quiz(self, request, pk=None):
         quiz = self.get_object()
@@ -144,33 +287,12 @@ class QuizViewSet(viewsets.ModelViewSet):
         if not isinstance(answers_data, list):
              return Response({"error": "Answers must be a list."}, status=status.HTTP_400_BAD_REQUEST)
 
-        correct_answers_count = 0
-        total_questions_in_quiz = quiz.questions.count()
-
-        if total_questions_in_quiz == 0:
-            attempt = UserQuizAttempt.objects.create(user=user, quiz=quiz, score=0, passed=False, answers=answers_data)
-            return Response(UserQuizAttemptSerializer(attempt, context=self.get_serializer_context()).data, status=status.HTTP_200_OK)
-
-        for answer_data in answers_data:
-            question_id = answer_data.get('question_id')
-            selected_choice_id = answer_data.get('choice_id')
-
-            if question_id is None or selected_choice_id is None:
-                continue 
-
-            try:
-                question = Question.objects.get(pk=question_id, quiz=quiz) 
-                selected_choice = Choice.objects.get(pk=selected_choice_id, question=question) 
-                if selected_choice.is_correct:
-                    correct_answers_count += 1
-            except Question.DoesNotExist:
-                pass 
-            except Choice.DoesNotExist:
-                pass
-        
-        score_percentage = (correct_answers_count / total_questions_in_quiz) * 100 if total_questions_in_quiz > 0 else 0
-        passed = score_percentage >= quiz.pass_mark_percentage
+        idempotency_key = _idempotency_key(request)
+        if idempotency_key:
+            submission, _ = submit_quiz_exam(user, quiz, idempotency_key, answers_data)
+            return _exam_submission_response(submission, submission.quiz_id == quiz.id)
 
+        graded, score_percentage, passed = score_answers(quiz, answers_data)
         attempt = UserQuizAttempt.objects.create(
             user=user,
             quiz=quiz,
@@ -178,6 +300,7 @@ class QuizViewSet(viewsets.ModelViewSet):
             passed=passed,
             answers=answers_data 
         )
+        record_quiz_answers(attempt, graded)
         
         return Response(UserQuizAttemptSerializer(attempt, context=self.get_serializer_context()).data, status=status.HTTP_200_OK)
 
@@ -267,7 +390,7 @@ class UserLessonProgressViewSet(viewsets.ModelViewSet):
         )
 
         if completed_flag:
-            check_and_award_rewards(user, trigger_event='LESSON_COMPLETED')
+            queue_reward_evaluation(user, trigger_event='LESSON_COMPLETED')
         
         serializer.instance = progress
 
@@ -280,7 +403,7 @@ class UserLessonProgressViewSet(viewsets.ModelViewSet):
         instance = serializer.save()
         
         if instance.completed:
-            check_and_award_rewards(user, trigger_event='LESSON_COMPLETED')
+            queue_reward_evaluation(user, trigger_event='LESSON_COMPLETED')
 
 
 
@@ -362,7 +485,7 @@ def dictionary_lookup(request):
     mock_definition = f"Mock definition for '{term}': This is a placeholder. In a real app, this would come from a dictionary API or database."
     return Response({'term': term, 'definition': mock_definition}, status=status.HTTP_200_OK)
 
-class UserQuizAttemptViewSet(viewsets.ReadOnlyModelViewSet): 
+class UserQuizAttemptViewSet(SparseFieldsViewMixin, viewsets.ReadOnlyModelViewSet): 
     queryset = UserQuizAttempt.objects.all().select_related('user', 'quiz', 'quiz__lesson')
     serializer_class = UserQuizAttemptSerializer
     permission_classes = [IsAuthenticatedOrReadOnly] 
@@ -374,6 +497,8 @@ class UserQuizAttemptViewSet(viewsets.ReadOnlyModelViewSet):
         qs = super().get_queryset()
         if not user.is_authenticated:
             return qs.none() 
+        if self.wants('quiz_details.questions'):
+            qs = qs.prefetch_related('quiz__questions__choices')
 
         if user.role == 'Student':
             return qs.filter(user=user)
@@ -415,9 +540,12 @@ class RewardProgressView(ListAPIView):
         progress_data = get_reward_progress(user)
         
         # Serialize the reward part and add progress fields
+        rewards = Reward.objects.in_bulk([p_data['reward'] for p_data in progress_data])
         serialized_rewards = []
         for p_data in progress_data:
-            reward_instance = Reward.objects.get(id=p_data['reward'])
+            reward_instance = rewards.get(p_data['reward'])
+            if reward_instance is None:
+                continue
             serialized_reward = self.get_serializer(reward_instance).data
             serialized_reward['progress'] = {
                 'current': p_data['current'],
@@ -478,18 +606,58 @@ class AILessonQuizAttemptViewSet(viewsets.ModelViewSet):
             return qs
         return qs.filter(user=user)
 
+    def create(self, request, *args, **kwargs):
+        lesson_id = request.data.get('lesson_id', request.data.get('lesson'))
+        lesson_id = int(lesson_id) if str(lesson_id).isdigit() else None
+        idempotency_key = _idempotency_key(request)
+        # A retry gets the stored submission back, even once its own failure has started the cooldown.
+        submission = get_exam_submission(request.user, idempotency_key) if idempotency_key else None
+        if submission is None:
+            # The cooldown is checked and the attempt written under one lock, so two
+            # attempts sent together can't both get past a cooldown the first one starts.
+            with transaction.atomic():
+                self.deny_reattempt(lock_ai_quiz_cooldown(request.user, lesson_id))
+                if not idempotency_key:
+                    return super().create(request, *args, **kwargs)
+                serializer = self.get_serializer(data=request.data)
+                serializer.is_valid(raise_exception=True)
+                submission, _ = submit_ai_quiz_exam(
+                    request.user, serializer.validated_data['lesson'], idempotency_key,
+                    score=serializer.validated_data.get('score', 0.0),
+                    passed=serializer.validated_data.get('passed', False),
+                    quiz_data=serializer.validated_data['quiz_data'],
+                )
+        return _exam_submission_response(submission, lesson_id is not None and submission.lesson_id == lesson_id)
+
+    def deny_reattempt(self, reattempt_at):
+        if reattempt_at:
+            raise PermissionDenied(f"You must wait until {reattempt_at.strftime('%Y-%m-%d %H:%M:%S')} to attempt this quiz again.")
+
+    @action(detail=False, methods=['get'])
+    def cooldowns(self, request):
+        """The AI quiz cooldown of every lesson in `?subject=`, for the requesting user."""
+        subject_id = request.query_params.get('subject', '')
+        if not subject_id.isdigit():
+            raise ValidationError({'subject': "Must be a subject id."})
+        cooldowns = get_subject_ai_quiz_cooldowns(request.user, subject_id)
+        if not cooldowns and not Subject.objects.filter(id=subject_id).exists():
+            raise NotFound("Subject not found.")
+        return Response({
+            'subject': int(subject_id),
+            'lessons': [
+                {'lesson': lesson_id, 'can_attempt': reattempt_at is None, 'can_reattempt_at': reattempt_at}
+                for lesson_id, reattempt_at in cooldowns
+            ],
+        })
+
     def perform_create(self, serializer):
         user = self.request.user
         lesson = serializer.validated_data.get('lesson')
-        
-        latest_attempt = AILessonQuizAttempt.objects.filter(user=user, lesson=lesson).order_by('-attempted_at').first()
-        if latest_attempt and latest_attempt.can_reattempt_at and timezone.now() < latest_attempt.can_reattempt_at:
-            raise PermissionDenied(f"You must wait until {latest_attempt.can_reattempt_at.strftime('%Y-%m-%d %H:%M:%S')} to attempt this quiz again.")
 
         passed = serializer.validated_data.get('passed', False)
         can_reattempt_at = None
         if not passed:
-            can_reattempt_at = timezone.now() + timedelta(hours=2)
+            can_reattempt_at = timezone.now() + AI_QUIZ_REATTEMPT_DELAY
 
         attempt = serializer.save(user=user, can_reattempt_at=can_reattempt_at)
         
@@ -498,7 +666,28 @@ class AILessonQuizAttemptViewSet(viewsets.ModelViewSet):
         RecentActivity.objects.create(user=user, activity_type='Quiz', details=details)
         
         if passed:
-            check_and_award_rewards(user, trigger_event='QUIZ_PASSED')
+            queue_reward_evaluation(user, trigger_event='QUIZ_PASSED')
+
+
+def _idempotency_key(request):
+    """The Idempotency-Key header that puts a submission in exam mode, or None."""
+    key = request.headers.get('Idempotency-Key', '').strip()
+    if len(key) > IDEMPOTENCY_KEY_LENGTH:
+        raise ValidationError({'Idempotency-Key': f"Must be at most {IDEMPOTENCY_KEY_LENGTH} characters."})
+    return key or None
+
+
+def _exam_submission_response(submission, same_target):
+    """202 while the submission waits for its attempt, 200 once written, 409 when the key was used for another quiz."""
+    if not same_target:
+        return Response(
+            {"error": "This Idempotency-Key was already used for a submission to another quiz."},
+            status=status.HTTP_409_CONFLICT
+        )
+    return Response(
+        ExamSubmissionSerializer(submission).data,
+        status=status.HTTP_200_OK if submission.recorded_at else status.HTTP_202_ACCEPTED
+    )
 
 
 class UserNoteViewSet(viewsets.ModelViewSet):
@@ -652,4 +841,88 @@ def ai_translate_lesson(request):
     except Lesson.DoesNotExist:
         return Response({'error': 'Lesson not found'}, status=status.HTTP_404_NOT_FOUND)
 
-    
\ No newline at end of file
+
+def _accepted_encodings(header):
+    """Returns the content codings an Accept-Encoding header allows (those without q=0)."""
+    accepted = set()
+    for item in header.split(','):
+        coding, *params = item.split(';')
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding.strip() and quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _byte_range(header, size):
+    """
+    Returns the (start, end) of a single `bytes=` range, end inclusive, or None
+    when the header should be ignored. Raises ValueError when it can't be satisfied.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip() != 'bytes' or ',' in spec:
+        return None # Other units and multiple ranges are answered with the whole body.
+    first, _, last = spec.strip().partition('-')
+    if not (first or last) or not (first or '0').isdigit() or not (last or '0').isdigit():
+        return None
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+@require_safe
+def lesson_section_body(request, body_hash):
+    """
+    Serves a section body by its hash (see LessonViewSet.sections). Bodies never
+    change, so they are cached for good. The stored brotli or gzip encoding is
+    sent as is when the client accepts it; Range requests get the uncompressed bytes.
+    """
+    body = SectionBody.objects.filter(hash=body_hash).first()
+    if body is None:
+        raise Http404("No such section.")
+    etag = f'"{body.hash}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    data = body.text.encode()
+    range_header = request.headers.get('Range')
+    byte_range = None
+    if range_header:
+        try:
+            byte_range = _byte_range(range_header, len(data))
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{len(data)}'
+            return response
+
+    if byte_range:
+        start, end = byte_range
+        response = HttpResponse(data[start:end + 1], status=206, content_type='text/plain; charset=utf-8')
+        response['Content-Range'] = f'bytes {start}-{end}/{len(data)}'
+    else:
+        encodings = _accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        if 'br' in encodings and body.brotli_body is not None:
+            response = HttpResponse(bytes(body.brotli_body), content_type='text/plain; charset=utf-8')
+            response['Content-Encoding'] = 'br'
+        elif 'gzip' in encodings:
+            response = HttpResponse(bytes(body.gzip_body), content_type='text/plain; charset=utf-8')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(data, content_type='text/plain; charset=utf-8')
+    response['ETag'] = etag
+    response['Accept-Ranges'] = 'bytes'
+    response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
@@ -1,9 +1,10 @@
 # forum/serializers.py
 
 from rest_framework import serializers
+from stepwise_backend.fieldsets import SparseFieldsMixin
 from .models import ForumThread, ForumPost, PostAttachment, PostLike
 
-class PostAttachmentSerializer(serializers.ModelSerializer):
+class PostAttachmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     file_url = serializers.FileField(source='file', read_only=True)
     file_name = serializers.SerializerMethodField()
     file_type = serializers.SerializerMethodField()
@@ -23,7 +24,7 @@ class PostAttachmentSerializer(serializers.ModelSerializer):
             return 'pdf'
         return 'file'
 
-class RecursivePostSerializer(serializers.ModelSerializer):
+class RecursivePostSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     author_username = serializers.CharField(source='author.username', read_only=True)
     author_avatar_url = serializers.SerializerMethodField()
     attachments = PostAttachmentSerializer(many=True, read_only=True)
@@ -38,6 +39,7 @@ class RecursivePostSerializer(serializers.ModelSerializer):
             'id', 'author_username', 'author_avatar_url', 'content', 'parent_post',
             'created_at', 'replies', 'attachments', 'like_count', 'is_liked_by_user'
         ]
+        nested_fields = ['replies']
     
     def get_author_avatar_url(self, obj):
         request = self.context.get('request')
@@ -54,7 +56,7 @@ class RecursivePostSerializer(serializers.ModelSerializer):
     
     def get_replies(self, obj):
         if hasattr(obj, 'replies_cache'):
-            return RecursivePostSerializer(obj.replies_cache, many=True, context=self.context).data
+            return RecursivePostSerializer(obj.replies_cache, many=True, context=self.nested_context('replies')).data
         return []
 
 
@@ -64,7 +66,7 @@ class ForumPostSerializer(RecursivePostSerializer):
         read_only_fields = ['author', 'created_at', 'replies', 'attachments', 'like_count', 'is_liked_by_user']
 
 
-class ForumThreadSerializer(serializers.ModelSerializer):
+class ForumThreadSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     author_username = serializers.CharField(source='author.username', read_only=True)
     author_avatar_url = serializers.SerializerMethodField()
     posts = serializers.SerializerMethodField()
@@ -83,6 +85,7 @@ class ForumThreadSerializer(serializers.ModelSerializer):
             'attachments', 'reply_count', 'last_activity_at', 'last_activity_by'
         ]
         read_only_fields = ['author', 'created_at', 'updated_at', 'view_count', 'posts', 'attachments', 'school', 'author_username', 'author_avatar_url']
+        nested_fields = ['posts']
 
     def get_author_avatar_url(self, obj):
         request = self.context.get('request')
@@ -99,5 +102,5 @@ class ForumThreadSerializer(serializers.ModelSerializer):
 
     def get_posts(self, obj):
         if hasattr(obj, 'prefetched_posts'):
-            return ForumPostSerializer(obj.prefetched_posts, many=True, context=self.context).data
+            return ForumPostSerializer(obj.prefetched_posts, many=True, context=self.nested_context('posts')).data
         return []
@@ -9,6 +9,7 @@ from django.db.models import Prefetch, Count, Q, F, OuterRef, Subquery, Exists,
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.exceptions import PermissionDenied, NotFound, ValidationError
 from .models import ForumThread, ForumPost, PostLike, PostAttachment
+from stepwise_backend.fieldsets import SparseFieldsViewMixin
 from .serializers import ForumThreadSerializer, ForumPostSerializer
 from accounts.models import SchoolClass, RecentActivity
 
@@ -17,7 +18,7 @@ def get_user_school(user):
         return user.school
     return None
 
-class ForumThreadViewSet(viewsets.ModelViewSet):
+class ForumThreadViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     serializer_class = ForumThreadSerializer
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser, JSONParser]
@@ -78,6 +79,9 @@ class ForumThreadViewSet(viewsets.ModelViewSet):
             instance.save(update_fields=['view_count'])
             instance.refresh_from_db()
 
+        if not self.wants('posts'):
+            return Response(self.get_serializer(instance).data)
+
         user_likes_subquery = PostLike.objects.filter(post=OuterRef('pk'), user=request.user)
         replies_qs = ForumPost.objects.select_related('author__student_profile', 'author__teacher_profile', 'author__parent_profile').prefetch_related('attachments').annotate(
             like_count=Count('likes'),
@@ -0,0 +1,59 @@
+import threading
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from jobs.queue import claim_jobs, run_job, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = "Runs background job workers against the database-backed job queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help="Number of worker threads.")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--batch-size', type=int, default=10, help="Jobs claimed per poll.")
+        parser.add_argument('--burst', action='store_true', help="Exit once the queue is empty instead of polling forever.")
+        parser.add_argument('--stale-after', type=int, default=15,
+                            help="Minutes after which a RUNNING job is assumed orphaned and requeued on startup.")
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError("--workers must be at least 1.")
+
+        requeued = requeue_stale_jobs(timedelta(minutes=options['stale_after']))
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale jobs.")
+
+        stop = threading.Event()
+        counts = [0] * options['workers']
+        threads = [
+            threading.Thread(target=self.work, args=(index, counts, stop, options), daemon=True)
+            for index in range(options['workers'])
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {sum(counts)} jobs."))
+
+    def work(self, index, counts, stop, options):
+        try:
+            while not stop.is_set():
+                jobs = claim_jobs(limit=options['batch_size'])
+                if not jobs:
+                    if options['burst']:
+                        return
+                    stop.wait(options['poll_interval'])
+                    continue
+                for job in jobs:
+                    run_job(job)
+                    counts[index] += 1
+        finally:
+            connection.close()
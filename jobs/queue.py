@@ -0,0 +1,113 @@
+import logging
+import traceback
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+RETRY_DELAY = timedelta(seconds=30)
+
+
+def register(kind):
+    """Registers the decorated function as the handler for jobs of `kind`. It receives the job payload."""
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, payload=None, dedupe_key=None, run_after=None):
+    """
+    Stores a job for the workers. When `dedupe_key` is given and a pending job
+    with the same key already exists, no new job is added.
+    """
+    job = Job(kind=kind, payload=payload or {}, dedupe_key=dedupe_key, run_after=run_after or timezone.now())
+    Job.objects.bulk_create([job], ignore_conflicts=True)
+
+
+def enqueue_many(kind, jobs, run_after=None):
+    """Stores one job of `kind` per (payload, dedupe_key) pair in a single insert, deduplicated like enqueue."""
+    run_after = run_after or timezone.now()
+    Job.objects.bulk_create([
+        Job(kind=kind, payload=payload or {}, dedupe_key=dedupe_key, run_after=run_after) for payload, dedupe_key in jobs
+    ], ignore_conflicts=True)
+
+
+def claim_jobs(limit=10):
+    """Marks up to `limit` due jobs as running and returns them. Safe to call from several workers at once."""
+    now = timezone.now()
+    candidate_ids = list(
+        Job.objects.filter(status=Job.Status.PENDING, run_after__lte=now).values_list('id', flat=True)[:limit]
+    )
+    claimed = []
+    for job_id in candidate_ids:
+        # Only the worker whose update flips the row from PENDING gets the job.
+        if Job.objects.filter(id=job_id, status=Job.Status.PENDING).update(
+            status=Job.Status.RUNNING, started_at=now, attempts=F('attempts') + 1
+        ):
+            claimed.append(Job.objects.get(id=job_id))
+    return claimed
+
+
+def run_job(job):
+    """Runs a claimed job, deleting it on success and rescheduling or failing it on error."""
+    handler = _handlers.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job kind '{job.kind}'.")
+        handler(job.payload)
+    except Exception:
+        logger.exception("Job %s (%s) failed", job.id, job.kind)
+        _record_failure(job, traceback.format_exc())
+        return False
+    job.delete()
+    return True
+
+
+def _record_failure(job, error):
+    job.last_error = error
+    if job.attempts < job.max_attempts:
+        job.status = Job.Status.PENDING
+        job.run_after = timezone.now() + RETRY_DELAY * job.attempts
+    else:
+        job.status = Job.Status.FAILED
+    try:
+        with transaction.atomic():
+            job.save(update_fields=['status', 'run_after', 'last_error'])
+    except IntegrityError:
+        # A newer pending job with the same dedupe key will redo this work.
+        job.status = Job.Status.FAILED
+        job.save(update_fields=['status', 'last_error'])
+
+
+def run_pending_jobs(limit=None):
+    """Runs due jobs until none are left (or `limit` have run). Returns the number of jobs run."""
+    processed = 0
+    while limit is None or processed < limit:
+        jobs = claim_jobs(limit=10 if limit is None else min(10, limit - processed))
+        if not jobs:
+            break
+        for job in jobs:
+            run_job(job)
+            processed += 1
+    return processed
+
+
+def requeue_stale_jobs(older_than):
+    """Puts jobs left RUNNING by a worker that died back in the queue."""
+    stale = Job.objects.filter(status=Job.Status.RUNNING, started_at__lt=timezone.now() - older_than)
+    requeued = 0
+    for job in stale:
+        try:
+            with transaction.atomic():
+                job.status = Job.Status.PENDING
+                job.save(update_fields=['status'])
+            requeued += 1
+        except IntegrityError:
+            job.delete() # Already superseded by a pending duplicate.
+    return requeued
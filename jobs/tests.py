@@ -0,0 +1,112 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from .models import Job
+from .queue import RETRY_DELAY, claim_jobs, enqueue, enqueue_many, register, requeue_stale_jobs, run_job, run_pending_jobs
+
+SUCCEEDING_JOB = 'jobs.tests.succeed'
+FAILING_JOB = 'jobs.tests.fail'
+
+handled = []
+
+
+@register(SUCCEEDING_JOB)
+def succeed(payload):
+    handled.append(payload)
+
+
+@register(FAILING_JOB)
+def fail(payload):
+    raise RuntimeError("Failed on purpose.")
+
+
+class JobQueueTests(TestCase):
+    """Deduplication, claiming, and what becomes of a job once it has run."""
+
+    def setUp(self):
+        handled.clear()
+
+    def test_pending_jobs_are_deduplicated_by_key(self):
+        enqueue(SUCCEEDING_JOB, {'n': 1}, dedupe_key='same')
+        enqueue(SUCCEEDING_JOB, {'n': 2}, dedupe_key='same')
+        enqueue_many(SUCCEEDING_JOB, [({'n': 3}, 'same'), ({'n': 4}, 'other'), ({'n': 5}, None), ({'n': 6}, None)])
+        self.assertEqual(sorted(job.payload['n'] for job in Job.objects.all()), [1, 4, 5, 6])
+
+        # A running job no longer holds its key, so the work it may have missed can be queued again.
+        (job,) = claim_jobs(limit=1)
+        self.assertEqual(job.payload, {'n': 1})
+        enqueue(SUCCEEDING_JOB, {'n': 7}, dedupe_key='same')
+        self.assertEqual(Job.objects.filter(dedupe_key='same').count(), 2)
+
+    def test_claim_marks_due_jobs_running_once(self):
+        enqueue(SUCCEEDING_JOB, {'n': 1})
+        enqueue(SUCCEEDING_JOB, {'n': 2}, run_after=timezone.now() + timedelta(minutes=5))
+
+        (job,) = claim_jobs()
+        self.assertEqual((job.payload, job.status, job.attempts), ({'n': 1}, Job.Status.RUNNING, 1))
+        self.assertIsNotNone(job.started_at)
+        self.assertEqual(claim_jobs(), []) # The other one isn't due yet.
+
+    def test_success_deletes_the_job(self):
+        enqueue(SUCCEEDING_JOB, {'n': 1})
+        (job,) = claim_jobs()
+        self.assertTrue(run_job(job))
+        self.assertEqual(handled, [{'n': 1}])
+        self.assertFalse(Job.objects.exists())
+
+    def test_failures_back_off_then_fail_for_good(self):
+        enqueue(FAILING_JOB)
+        for attempt in range(1, 4):
+            Job.objects.update(run_after=timezone.now())
+            (job,) = claim_jobs()
+            before = timezone.now()
+            with self.assertLogs('jobs.queue', 'ERROR'):
+                self.assertFalse(run_job(job))
+            job.refresh_from_db()
+            self.assertEqual(job.attempts, attempt)
+            self.assertIn('Failed on purpose.', job.last_error)
+            if attempt < job.max_attempts:
+                self.assertEqual(job.status, Job.Status.PENDING)
+                self.assertGreaterEqual(job.run_after, before + RETRY_DELAY * attempt)
+                self.assertEqual(claim_jobs(), []) # Not before its delay is up
+        self.assertEqual(job.status, Job.Status.FAILED)
+
+    def test_failure_with_a_newer_duplicate_pending(self):
+        enqueue(FAILING_JOB, dedupe_key='fail')
+        (job,) = claim_jobs()
+        enqueue(FAILING_JOB, dedupe_key='fail')
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            run_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertEqual(Job.objects.filter(status=Job.Status.PENDING, dedupe_key='fail').count(), 1)
+
+    def test_unknown_kinds_fail(self):
+        enqueue('jobs.tests.unknown')
+        (job,) = claim_jobs()
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            self.assertFalse(run_job(job))
+        job.refresh_from_db()
+        self.assertIn('No handler registered', job.last_error)
+
+    def test_run_pending_jobs(self):
+        for n in range(5):
+            enqueue(SUCCEEDING_JOB, {'n': n})
+        self.assertEqual(run_pending_jobs(limit=2), 2)
+        self.assertEqual(run_pending_jobs(), 3)
+        self.assertEqual([payload['n'] for payload in handled], [0, 1, 2, 3, 4])
+
+    def test_requeue_stale_jobs(self):
+        enqueue(SUCCEEDING_JOB, {'n': 1}, dedupe_key='stale')
+        enqueue(SUCCEEDING_JOB, {'n': 2}, dedupe_key='superseded')
+        enqueue(SUCCEEDING_JOB, {'n': 3}, dedupe_key='fresh')
+        stale, superseded, fresh = claim_jobs()
+        Job.objects.filter(pk__in=[stale.pk, superseded.pk]).update(started_at=timezone.now() - timedelta(hours=1))
+        enqueue(SUCCEEDING_JOB, {'n': 4}, dedupe_key='superseded')
+
+        self.assertEqual(requeue_stale_jobs(timedelta(minutes=15)), 1)
+        self.assertEqual(Job.objects.get(pk=stale.pk).status, Job.Status.PENDING)
+        self.assertFalse(Job.objects.filter(pk=superseded.pk).exists())
+        self.assertEqual(Job.objects.get(pk=fresh.pk).status, Job.Status.RUNNING)
@@ -5,7 +5,7 @@ import React, { useEffect, useState, useRef, useMemo, useCallback } from 'react'
 import { useParams, useRouter } from 'next/navigation';
 import { useForm } from "react-hook-form";
 import { api } from '@/lib/api';
-import type { Lesson as LessonInterface, LessonSummary, AILessonQuizAttempt as AILessonQuizAttemptInterface, UserLessonProgress, UserNote, TranslatedLessonContent, AILessonSummary } from '@/interfaces';
+import type { Lesson as LessonInterface, LessonSummary, AILessonQuizAttempt as AILessonQuizAttemptInterface, AIQuizCooldowns, UserLessonProgress, UserNote, TranslatedLessonContent, AILessonSummary } from '@/interfaces';
 import { Card, CardContent, CardDescription, CardHeader, CardTitle, CardFooter } from '@/components/ui/card';
 import { Button } from '@/components/ui/button';
 import { Skeleton } from '@/components/ui/skeleton';
@@ -365,11 +365,11 @@ export default function LessonPage() {
     setCooldownMessage(null);
     
     try {
-        const previousAttempts = await api.get<AILessonQuizAttemptInterface[]>(`/ai-quiz-attempts/?user=${currentUser?.id}&lesson=${lessonId}&ordering=-attempted_at`);
-        const latestAttempt = Array.isArray(previousAttempts) ? previousAttempts[0] : (previousAttempts as any).results[0];
-        if (latestAttempt && latestAttempt.can_reattempt_at) {
+        const cooldowns = await api.get<AIQuizCooldowns>(`/ai-quiz-attempts/cooldowns/?subject=${subjectId}`);
+        const lessonCooldown = cooldowns.lessons.find(l => String(l.lesson) === String(lessonId));
+        if (lessonCooldown && lessonCooldown.can_reattempt_at) {
             const now = new Date();
-            const reattemptTime = new Date(latestAttempt.can_reattempt_at);
+            const reattemptTime = new Date(lessonCooldown.can_reattempt_at);
             if (now < reattemptTime) {
                 setCooldownMessage(`You must wait until ${reattemptTime.toLocaleString()} to try again.`);
                 setIsLoadingQuiz(false);
@@ -99,6 +99,10 @@ export interface LessonSummary {
   audio_url?: string;
   image_url?: string;
   subject_name?: string;
+  previous_lesson?: number | null;
+  next_lesson?: number | null;
+  requires_previous_quiz?: boolean;
+  has_quiz?: boolean;
 }
 
 export interface Choice {
@@ -376,6 +380,15 @@ export interface AILessonQuizAttempt {
   can_reattempt_at?: string | null;
 }
 
+export interface AIQuizCooldowns {
+  subject: number;
+  lessons: {
+    lesson: number;
+    can_attempt: boolean;
+    can_reattempt_at: string | null;
+  }[];
+}
+
 
 export interface UserNote {
   id?: number;
@@ -0,0 +1,167 @@
+"""
+Sparse fieldsets for the API: `?fields=`, `?expand=` and `?depth=` on GET requests.
+
+    fields=id,title,quiz.title   only these fields; dotted paths select inside nested objects
+    depth=0                      leave out nested objects below this many levels
+    expand=subjects.lessons      bring nested objects back past `depth`
+
+Serializers opt in with SparseFieldsMixin and views with SparseFieldsViewMixin,
+which also lets `get_queryset` skip loading what won't be rendered.
+"""
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+
+def parse_field_paths(value):
+    """Turns 'id,quiz.title,quiz.questions' into {'id': {}, 'quiz': {'title': {}, 'questions': {}}}."""
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+class FieldSet:
+    """The fields a client asked for at one level of a response, and how to narrow it for a nested field."""
+
+    def __init__(self, fields=None, expand=None, depth=None):
+        self.fields = fields # None renders every field
+        self.expand = expand or {}
+        self.depth = depth # None renders nested objects at any depth
+
+    @classmethod
+    def from_request(cls, request):
+        """Returns the request's FieldSet, or None when it doesn't ask for one (or isn't an API read)."""
+        params = getattr(request, 'query_params', None)
+        if params is None or request.method not in SAFE_METHODS:
+            return None
+        if not any(params.get(name) for name in ('fields', 'expand', 'depth')):
+            return None
+
+        depth = params.get('depth')
+        if depth:
+            if not depth.isdigit():
+                raise ValidationError({'depth': "Must be a non-negative integer."})
+            depth = int(depth)
+        return cls(
+            fields=parse_field_paths(params['fields']) if params.get('fields') else None,
+            expand=parse_field_paths(params.get('expand', '')),
+            depth=depth if depth != '' else None,
+        )
+
+    def includes(self, name, nested=False):
+        if self.fields is not None and name not in self.fields:
+            return False
+        if nested and self.depth == 0:
+            # Naming a nested field, in either `fields` or `expand`, brings it back.
+            return name in self.expand or name in (self.fields or {})
+        return True
+
+    def subset(self, name):
+        """Returns the FieldSet for the nested field `name`."""
+        return FieldSet(
+            fields=(self.fields.get(name) or None) if self.fields is not None else None,
+            expand=self.expand.get(name),
+            depth=None if self.depth is None else max(self.depth - 1, 0),
+        )
+
+
+def field_path(serializer):
+    """Returns the field names leading from the root serializer to `serializer`."""
+    path = []
+    while serializer.parent is not None:
+        if serializer.field_name:
+            path.append(serializer.field_name)
+        serializer = serializer.parent
+    return path[::-1]
+
+
+def renders(serializer, path):
+    """Tells whether the dotted field `path` is part of `serializer`'s output."""
+    for name in path.split('.'):
+        fields = getattr(getattr(serializer, 'child', serializer), 'fields', None)
+        if fields is None or name not in fields:
+            return False
+        serializer = fields[name]
+    return True
+
+
+def prune_representation(serializer, data):
+    """Cuts already serialized `data` down to the fields `serializer` renders, e.g. for cached responses."""
+    serializer = getattr(serializer, 'child', serializer)
+    if isinstance(data, list):
+        return [prune_representation(serializer, item) for item in data]
+    pruned = {}
+    for name, field in serializer.fields.items():
+        if name in data:
+            nested = isinstance(field, serializers.BaseSerializer) and data[name] is not None
+            pruned[name] = prune_representation(field, data[name]) if nested else data[name]
+    return pruned
+
+
+class SparseFieldsMixin:
+    """
+    Leaves out the fields the request's FieldSet doesn't ask for. Nested
+    serializers are narrowed by their path from the root. Method fields that
+    return nested objects are listed in Meta.nested_fields so `depth` applies
+    to them too, and build their serializers with `nested_context(name)`.
+    """
+
+    @property
+    def fieldset(self):
+        context = self.context
+        if 'fieldset' not in context:
+            context['fieldset'] = FieldSet.from_request(context.get('request'))
+        fieldset = context['fieldset']
+        if fieldset is None:
+            return None
+        for name in field_path(self):
+            fieldset = fieldset.subset(name)
+        return fieldset
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.fieldset
+        if fieldset is None:
+            return fields
+        nested_fields = getattr(self.Meta, 'nested_fields', ())
+        return {
+            name: field for name, field in fields.items()
+            if field.write_only or fieldset.includes(
+                name, nested=isinstance(field, serializers.BaseSerializer) or name in nested_fields
+            )
+        }
+
+    def nested_context(self, name):
+        """Returns the context for a serializer built by hand for the nested field `name`."""
+        fieldset = self.fieldset
+        return {**self.context, 'fieldset': fieldset.subset(name) if fieldset else None}
+
+
+class SparseFieldsViewMixin:
+    """Passes the request's FieldSet to the serializer and lets the view ask what it will render."""
+
+    def get_fieldset(self):
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = FieldSet.from_request(self.request)
+        return self._fieldset
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'fieldset': self.get_fieldset()}
+
+    def wants(self, path):
+        """Tells whether the dotted serializer field `path` is rendered for this request."""
+        if self.get_fieldset() is None:
+            return True
+        if not hasattr(self, '_field_probe'):
+            self._field_probe = self.get_serializer()
+        return renders(self._field_probe, path)
+
+    def sparse_data(self, data):
+        """Prunes already serialized (e.g. cached) `data` to the request's FieldSet."""
+        if self.get_fieldset() is None:
+            return data
+        return prune_representation(self.get_serializer(), data)
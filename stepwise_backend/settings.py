@@ -14,6 +14,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 import os # For MEDIA_ROOT and MEDIA_URL
 from dotenv import load_dotenv
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -55,6 +56,7 @@ INSTALLED_APPS = [
     'content',
     'notifications',
     'forum',
+    'jobs',
 ]
 
 MIDDLEWARE = [
@@ -96,11 +98,36 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Let concurrent writers (e.g. several run_workers threads) wait for the lock,
+        # taking it up front so a transaction never fails while upgrading a read lock.
+        'OPTIONS': {'timeout': 20, 'transaction_mode': 'IMMEDIATE'},
+    }
+}
+
+# Cache
+# Holds per-user snapshots such as reward progress, the curriculum trees and
+# quiz answer keys, with the version counters that retire them. It must be
+# shared by every process that writes or reads them (the web server,
+# run_workers and management commands), so it lives on disk rather than in
+# process memory. Point this at Redis or Memcached when running on more than
+# one machine.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('DJANGO_CACHE_DIR', BASE_DIR / '.django_cache'),
+        # One snapshot per student plus the curriculum trees and answer keys.
+        'OPTIONS': {'MAX_ENTRIES': 50000},
     }
 }
 
 AUTH_USER_MODEL = 'accounts.CustomUser'
 
+# Rewards
+# Criteria listed here are skipped by the login/quiz-time checks and only
+# awarded by the scheduled `python manage.py award_rewards` sweep.
+# Any of: 'PERFECT_ATTENDANCE_STAR', 'QUIZ_MASTER', 'COMPLETION_CROWN'.
+REWARD_SWEEP_ONLY_CRITERIA = []
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -123,6 +150,8 @@ CORS_ALLOWED_ORIGINS = [
     "http://192.168.1.9:3000"
 ]
 CORS_ALLOW_CREDENTIALS = True
+# Idempotency-Key marks exam-mode quiz submissions (content/exams.py).
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 CSRF_TRUSTED_ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",
@@ -160,6 +189,12 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 
+# Study pings
+# Pings add up in this per-server SQLite file and reach the activity tables in
+# one batch every STUDY_PING_FLUSH_SECONDS (see accounts/study_pings.py).
+STUDY_PING_BUFFER_PATH = BASE_DIR / 'study_pings.sqlite3'
+STUDY_PING_FLUSH_SECONDS = 30
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'